@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+# Bounded alert log: at most `capacity` rows are kept, a repeated alert for
+# the same key (field, sensor) updates its row and counter instead of adding
+# a new one, and the oldest rows are dropped when the log is full. Memory
+# stays constant whatever the uptime of the dashboard.
+
+DEFAULT_CAPACITY = 200
+
+
+class AlertEntry:
+    __slots__ = ("key", "message", "count", "first_seen", "last_seen")
+
+    def __init__(self, key, message, now):
+        self.key = key
+        self.message = message
+        self.count = 1
+        self.first_seen = now
+        self.last_seen = now
+
+    def text(self):
+        if self.count > 1:
+            return f"{self.message} (x{self.count})"
+        return self.message
+
+
+class AlertLog:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.entries = OrderedDict()  # key -> AlertEntry, oldest first
+        self.version = 0  # Incremented on every change, lets the view skip redraws
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Function to add an alert, merged with the previous one of the same key
+    def add(self, key, message, now=None):
+        now = time.time() if now is None else now
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = AlertEntry(key, message, now)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        else:
+            entry.message = message
+            entry.count += 1
+            entry.last_seen = now
+            self.entries.move_to_end(key)
+        self.version += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.version += 1
+
+    # Function to list the entries (oldest first) whose text contains `text`
+    def filtered(self, text=""):
+        if not text:
+            return list(self.entries.values())
+        text = text.lower()
+        return [entry for entry in self.entries.values() if text in entry.message.lower()]
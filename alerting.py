@@ -0,0 +1,89 @@
+from collections import namedtuple
+
+import numpy as np
+
+import protocol
+
+# Vectorized threshold evaluation: the latest values of every field are kept
+# in a fields x sensors matrix next to matrices of rules (upper and lower
+# bounds, hysteresis, minimum duration), and one pass of NumPy operations
+# per tick finds the alerts raised and cleared since the previous tick.
+# Headless, it is driven by the dashboard tick or by a benchmark.
+
+# raised/cleared are (rows, sensors) index arrays, as returned by np.nonzero
+AlertEvents = namedtuple("AlertEvents", ["raised", "cleared"])
+
+
+class ThresholdEngine:
+    def __init__(self, capacity=16, sensors=len(protocol.SENSORS)):
+        self.sensors = sensors
+        self.rows = {}  # field id -> row of the matrices
+        self.field_ids = []  # row -> field id
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        shape = (capacity, self.sensors)
+        self.values = np.full(shape, np.nan, dtype=np.float32)  # NaN until the field reports
+        self.upper = np.full(shape, np.inf, dtype=np.float32)
+        self.lower = np.full(shape, -np.inf, dtype=np.float32)
+        self.hysteresis = np.zeros(shape, dtype=np.float32)  # Margin to get back inside before an alert clears
+        self.min_duration = np.zeros(shape, dtype=np.float64)  # Seconds a breach must last to raise an alert
+        self.breach_since = np.full(shape, np.nan, dtype=np.float64)
+        self.active = np.zeros(shape, dtype=bool)
+
+    # Function to double the capacity, keeping the rules and state of the existing rows
+    def grow(self):
+        old = (self.values, self.upper, self.lower, self.hysteresis, self.min_duration, self.breach_since, self.active)
+        self.allocate(max(1, 2 * len(self.values)))
+        for new, previous in zip((self.values, self.upper, self.lower, self.hysteresis, self.min_duration, self.breach_since, self.active), old):
+            new[:len(previous)] = previous
+
+    def row_for(self, field_id):
+        row = self.rows.get(field_id)
+        if row is None:
+            row = len(self.field_ids)
+            if row == len(self.values):
+                self.grow()
+            self.rows[field_id] = row
+            self.field_ids.append(field_id)
+        return row
+
+    # Function to change the rule of a sensor, None keeps the current setting
+    def set_rule(self, field_id, sensor, upper=None, lower=None, hysteresis=None, min_duration=None):
+        row = self.row_for(field_id)
+        if upper is not None:
+            self.upper[row, sensor] = upper
+        if lower is not None:
+            self.lower[row, sensor] = lower
+        if hysteresis is not None:
+            self.hysteresis[row, sensor] = hysteresis
+        if min_duration is not None:
+            self.min_duration[row, sensor] = min_duration
+
+    def update(self, field_id, values):
+        row = self.row_for(field_id)  # May grow the matrices
+        self.values[row] = values
+
+    # One vectorized pass over every field and sensor
+    def evaluate(self, now):
+        count = len(self.field_ids)
+        values = self.values[:count]
+        upper = self.upper[:count]
+        lower = self.lower[:count]
+        hysteresis = self.hysteresis[:count]
+        breach_since = self.breach_since[:count]
+        active = self.active[:count]
+
+        # Comparisons with NaN are False: fields without data never alert
+        breach = (values > upper) | (values < lower)
+        inside = (values <= upper - hysteresis) & (values >= lower + hysteresis)
+
+        # Start the breach timers, reset them when the value is back inside
+        breach_since[breach & np.isnan(breach_since)] = now
+        breach_since[~breach] = np.nan
+
+        raised = breach & ~active & (now - breach_since >= self.min_duration[:count])
+        cleared = active & inside
+        active |= raised
+        active &= ~cleared
+        return AlertEvents(np.nonzero(raised), np.nonzero(cleared))
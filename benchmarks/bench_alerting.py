@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import alerting
+import protocol
+
+# Benchmark of the threshold engine: one vectorized evaluation per tick over
+# N fields x 4 sensors, against the same rules checked one value at a time.
+#
+# Usage: python benchmarks/bench_alerting.py --fields 10000 --ticks 200
+
+
+# Reference: the rules evaluated value by value, like the old update_sensor_values loop
+def evaluate_loop(values, upper, lower, active):
+    raised = []
+    for row in range(len(values)):
+        for sensor in range(len(values[row])):
+            value = values[row][sensor]
+            breach = value > upper[row][sensor] or value < lower[row][sensor]
+            if breach and not active[row][sensor]:
+                active[row][sensor] = True
+                raised.append((row, sensor))
+            elif not breach:
+                active[row][sensor] = False
+    return raised
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=10000)
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    sensors = len(protocol.SENSORS)
+    engine = alerting.ThresholdEngine()
+    for field_id in range(1, args.fields + 1):
+        for sensor in range(sensors):
+            engine.set_rule(field_id, sensor, upper=90, lower=10, hysteresis=2, min_duration=5)
+
+    ticks = [rng.uniform(0, 100, size=(args.fields, sensors)).astype(np.float32) for _ in range(args.ticks)]
+
+    raised = 0
+    began = time.perf_counter()
+    for tick, values in enumerate(ticks):
+        engine.values[:args.fields] = values
+        events = engine.evaluate(tick)
+        raised += len(events.raised[0])
+    elapsed = time.perf_counter() - began
+    print(f"{args.fields} fields x {sensors} sensors, {args.ticks} ticks")
+    print(f"vectorized: {elapsed / args.ticks * 1000:8.3f} ms per tick ({raised} alerts raised)")
+
+    upper = [[90.0] * sensors for _ in range(args.fields)]
+    lower = [[10.0] * sensors for _ in range(args.fields)]
+    active = [[False] * sensors for _ in range(args.fields)]
+    loop_ticks = max(1, args.ticks // 20)
+    began = time.perf_counter()
+    for values in ticks[:loop_ticks]:
+        evaluate_loop(values.tolist(), upper, lower, active)
+    loop_elapsed = (time.perf_counter() - began) / loop_ticks
+    print(f"      loop: {loop_elapsed * 1000:8.3f} ms per tick (bounds only)")
+    print(f"speedup: {loop_elapsed / (elapsed / args.ticks):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import control
+import ingestion
+import node_control
+import protocol
+
+# Benchmark of the command channel: round-trip latency of LED commands over
+# the persistent connections, and fan-out of one command to every node.
+# The nodes are local CommandServer instances acknowledging immediately.
+#
+# Usage: python benchmarks/bench_control.py --nodes 20 --commands 200
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run(hub, args):
+    latencies = []
+    # Sequential commands on one channel
+    channel = next(iter(hub.channels.values()))
+    for _ in range(args.commands):
+        result = await channel.send(protocol.CMD_LED_OFF)
+        latencies.append(result.latency)
+    print(f"single node: {args.commands} commands, p50 {percentile(latencies, 0.5) * 1000:.3f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.3f} ms, mean {statistics.mean(latencies) * 1000:.3f} ms")
+
+    # Fan-out of the same command to every node
+    durations = []
+    for _ in range(args.rounds):
+        began = time.perf_counter()
+        results = await hub.fan_out(protocol.CMD_LED_ON, 1.0)
+        durations.append(time.perf_counter() - began)
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed:
+            print(f"failed: {failed[0]}")
+            sys.exit(1)
+    print(f"fan-out to {len(hub.channels)} nodes: p50 {percentile(durations, 0.5) * 1000:.3f} ms, "
+          f"p99 {percentile(durations, 0.99) * 1000:.3f} ms per round")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    background = ingestion.BackgroundLoop().start()
+    hub = control.ControlHub(background)
+    for field_id in range(1, args.nodes + 1):
+        server = node_control.CommandServer(lambda opcode, argument: protocol.ACK_OK, port=0)
+        server.start()
+        hub.add_node(field_id, "127.0.0.1", server.port)
+    background.submit(run(hub, args)).result()
+    background.submit(hub.close()).result()
+    background.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alerting
+import fields
+import protocol
+
+# Cost of applying one sample to the dashboard state (the part of
+# MonitoringCore.apply_sample that runs for every field, panel open or not):
+# fields.FieldState indexed by field and sensor ids, against the dictionaries
+# keyed by formatted strings like "Monitoring Field 3 - Soil humidity" of the
+# previous app.py. Reports the time per sample, the temporary memory allocated
+# per sample and the memory kept for the state of all the fields.
+#
+# Usage: python benchmarks/bench_field_state.py --fields 500 --samples 200000
+
+
+# Reference: the string-keyed dictionaries of the previous app.py
+class StringKeyedState:
+    def __init__(self, field_ids):
+        self.sensor_values = {}
+        self.pump_states = {}
+        self.led_status = {}
+        self.uptimes = {}
+        for field_id in field_ids:
+            title = f"Monitoring Field {field_id}"
+            self.pump_states[title] = None
+            self.led_status[title] = "OFF"
+            for sensor in protocol.SENSORS:
+                self.sensor_values[f"{title} - {sensor}"] = 0.0
+
+    def apply_sample(self, sample, alerts):
+        monitor_number = sample.field_id
+        if f"Monitoring Field {monitor_number}" not in self.pump_states:
+            return
+        for sensor, value in zip(protocol.SENSORS, sample.values):
+            self.sensor_values[f"Monitoring Field {monitor_number} - {sensor}"] = round(value, 2)
+        alerts.update(monitor_number, [self.sensor_values[f"Monitoring Field {monitor_number} - {sensor}"] for sensor in protocol.SENSORS])
+        self.uptimes[monitor_number] = protocol.format_uptime(sample.uptime)
+
+
+# Same steps as MonitoringCore.apply_sample
+class SlottedState:
+    def __init__(self, field_ids):
+        self.states = {field_id: fields.FieldState(fields.FieldConfig(field_id, f"Field {field_id}", None, 0))
+                       for field_id in field_ids}
+
+    def apply_sample(self, sample, alerts):
+        state = self.states.get(sample.field_id)
+        if state is None:
+            return
+        state.update(sample.values, sample.uptime)
+        alerts.update(state.field_id, state.values)
+
+
+def bench(name, factory, args, samples):
+    field_ids = range(1, args.fields + 1)
+    alerts = alerting.ThresholdEngine()
+    for field_id in field_ids:
+        alerts.row_for(field_id)
+
+    tracemalloc.start()
+    state = factory(field_ids)
+    retained = tracemalloc.get_traced_memory()[0]
+    # Temporary memory: peak above the current size while a sample is applied
+    temporary = 0
+    for sample in samples[:args.traced]:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        state.apply_sample(sample, alerts)
+        temporary += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    began = time.perf_counter()
+    for sample in samples:
+        state.apply_sample(sample, alerts)
+    elapsed = time.perf_counter() - began
+    print(f"{name}: {elapsed / len(samples) * 1e6:.2f} us per sample, {temporary / args.traced:.0f} bytes of "
+          f"temporary memory per sample, {retained / 1024:.0f} KiB for the state of {args.fields} fields")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=200000)
+    parser.add_argument("--traced", type=int, default=20000, help="samples applied under tracemalloc")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    samples = [protocol.Sample(rng.randint(1, args.fields), tuple(rng.uniform(0, 100) for _ in protocol.SENSORS),
+                               i // args.fields, True) for i in range(args.samples)]
+    bench("string keys", StringKeyedState, args, samples)
+    bench("FieldState", SlottedState, args, samples)
+
+
+if __name__ == "__main__":
+    main()
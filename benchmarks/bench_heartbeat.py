@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gpio_sim
+import heartbeat
+
+# Off-device run of the heartbeat monitor against a simulated IR receiver:
+# heartbeats every `period` seconds with gaussian jitter, random drops and
+# one long outage. Prints what the monitor measured next to what was
+# injected, and the cost of the edge callback.
+#
+# Usage: python benchmarks/bench_heartbeat.py --beats 20000 --jitter 0.02 --drop 0.05
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--beats", type=int, default=20000)
+    parser.add_argument("--period", type=float, default=2.0)
+    parser.add_argument("--jitter", type=float, default=0.02, help="standard deviation of the period in seconds")
+    parser.add_argument("--drop", type=float, default=0.05, help="probability that a heartbeat is lost")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    pi = gpio_sim.SimulatedPi()
+    events = []
+    monitor = heartbeat.HeartbeatMonitor(pi, 16, timeout=5.0, period=args.period,
+                                         on_event=lambda event, tick: events.append(event))
+
+    dropped = 0
+    outage = args.beats // 2
+    pulse = 0.1
+    callback_time = 0.0
+    for beat in range(args.beats):
+        gap = args.period + rng.gauss(0, args.jitter) - pulse
+        if beat == outage:
+            gap += 60  # One long outage, the watchdog reports it
+        pi.advance(gap)
+        if rng.random() < args.drop:
+            dropped += 1
+            pi.advance(pulse)
+            continue
+        began = time.perf_counter()
+        pi.write(16, 1)
+        callback_time += time.perf_counter() - began
+        pi.advance(pulse)
+        pi.write(16, 0)
+
+    stats = monitor.stats()
+    print(f"injected: {args.beats} heartbeats, {dropped} dropped ({dropped / args.beats:.2%}), jitter {args.jitter * 1000:.1f} ms, 1 outage")
+    print(f"measured: {stats['heartbeats']} heartbeats, loss rate {stats['loss_rate']:.2%}, "
+          f"jitter {stats['jitter'] * 1000:.1f} ms, mean interval {stats['mean_interval']:.3f}s, "
+          f"{stats['losses']} link losses ({events.count(heartbeat.LINK_LOST)} lost / {events.count(heartbeat.LINK_RECOVERED)} recovered events)")
+    print(f"edge callback: {callback_time / max(1, stats['heartbeats']) * 1e6:.2f} us per heartbeat")
+
+
+if __name__ == "__main__":
+    main()
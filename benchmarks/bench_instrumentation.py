@@ -0,0 +1,72 @@
+import argparse
+import io
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logs
+import metrics
+
+# Overhead of the instrumentation in the hot paths: recording a value in a
+# metrics.Histogram, and logging one message per sample the old way (print
+# of an f-string), with logging at DEBUG while the level is INFO (message
+# not formatted), and with a rate-limited message shown.
+#
+# Usage: python benchmarks/bench_instrumentation.py --count 200000
+
+
+def per_call(function, count):
+    began = time.perf_counter()
+    function(count)
+    return (time.perf_counter() - began) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    values = [rng.lognormvariate(-7, 2) for _ in range(args.count)]
+    histogram = metrics.Histogram()
+
+    def record(count):
+        for value in values:
+            histogram.record(value)
+
+    print(f"Histogram.record: {per_call(record, args.count):.3f} us per value, "
+          f"p50 {histogram.percentile(0.5) * 1e3:.3f} ms p99 {histogram.percentile(0.99) * 1e3:.3f} ms "
+          f"(exact p50 {sorted(values)[args.count // 2] * 1e3:.3f} ms)")
+
+    # The console is replaced by a buffer, only the cost of producing the messages is measured
+    reading = (12.5, 40.25, 21.0, 63.75)
+    console = io.StringIO()
+
+    def print_each(count):
+        for i in range(count):
+            print(f"Sent to computer: pi_1 1 sample(s), last {reading} {i}s heartbeat=True, 0 waiting", file=console)
+
+    rate_limit = logs.setup("INFO")
+    logging.getLogger().handlers[0].stream = console
+    logger = logging.getLogger("bench")
+
+    def debug_each(count):
+        for i in range(count):
+            logger.debug("%s: %d sample(s), last %s %ss heartbeat=%s, %d waiting", "Sent to computer", 1, reading, i, True, 0)
+
+    def warning_each(count):
+        for i in range(count):
+            logger.warning("Error establishing connection to computer: %s", "timed out")
+
+    print(f"print per sample: {per_call(print_each, args.count):.3f} us")
+    print(f"logger.debug below the level: {per_call(debug_each, args.count):.3f} us")
+    print(f"logger.warning rate limited: {per_call(warning_each, args.count):.3f} us "
+          f"({rate_limit.suppressed} of {args.count} suppressed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gpio_sim
+import heartbeat
+import ir_link
+import sampling
+
+# Throughput and frame error rate of the IR data link (ir_link.py).
+#
+#   codec   sensor reading frames turned into the edges of the receiver for
+#           several symbol timings (ir_link.scaled) and channel conditions,
+#           decoded by FrameDecoder: edge jitter, marks stretched by the
+#           receiver, short noise pulses in the spaces (sunlight, lamps)
+#           and marks lost. Reports the payload bitrate on the air, the
+#           frame error rate and the decoding time per edge.
+#   waves   the real path on gpio_sim.SimulatedPi: IrTransmitter sends the
+#           wave chains of the frames, a demodulator turns the carrier
+#           bursts into the receiver output of a second SimulatedPi with
+#           IrReceiver and a HeartbeatMonitor (min_pulse) on the same GPIO,
+#           heartbeats sent between the frames.
+#
+# Most IR receivers need bursts of about 10 carrier cycles: the "cycles"
+# column tells how far below it a fast timing goes.
+#
+# Usage: python benchmarks/bench_ir_link.py --frames 500 --seconds 60
+
+GLITCH = 40  # Microseconds of a noise pulse
+CHANNELS = [
+    # name, jitter (us, standard deviation), stretch (us), glitches per second, lost marks
+    ("clean", 0, 0, 0, 0.0),
+    ("jitter 40us", 40, 0, 0, 0.0),
+    ("stretch 80us", 20, 80, 0, 0.0),
+    ("noise 50/s", 20, 40, 50, 0.0),
+    ("noise 500/s", 20, 40, 500, 0.0),
+    ("lost marks 0.1%", 20, 40, 0, 0.001),
+]
+SCALES = (1.0, 0.75, 0.5, 0.35)
+
+
+def random_reading(rng, seq):
+    return sampling.Reading(seq, time.time(), tuple(rng.uniform(0, 100) for _ in range(4)), seq * 2)
+
+
+# Function to turn frame symbols into receiver edges through an impaired channel
+def impaired_edges(symbols, start, rng, jitter, stretch, glitch_rate, lost):
+    pulses = []  # (rise, fall) of the receiver output
+    tick = start
+    for index, length in enumerate(symbols):
+        if index % 2 == 0:
+            if rng.random() >= lost:
+                rise = tick + (rng.gauss(0, jitter) if jitter else 0)
+                fall = tick + length + stretch + (rng.gauss(0, jitter) if jitter else 0)
+                pulses.append((rise, max(fall, rise + 1)))
+        elif glitch_rate and rng.random() < glitch_rate * length / 1e6:
+            at = tick + rng.uniform(0, length)
+            pulses.append((at, at + GLITCH))
+        tick += length
+    # Overlapping pulses are one pulse of the receiver output
+    pulses.sort()
+    merged = []
+    for rise, fall in pulses:
+        if merged and rise <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], fall)
+        else:
+            merged.append([rise, fall])
+    edges = []
+    for rise, fall in merged:
+        edges.append((1, int(rise) & 0xFFFFFFFF))
+        edges.append((0, int(fall) & 0xFFFFFFFF))
+    return edges, tick
+
+
+def bench_codec(frames, seed):
+    print(f"codec: {frames} sensor frames ({ir_link.IR_READING.size} bytes) per case")
+    print(f"  {'timing':>7} {'cycles':>6} {'channel':>16} {'bitrate':>12} {'FER':>8} {'decode':>12}")
+    for scale in SCALES:
+        timing = ir_link.scaled(ir_link.DEFAULT_TIMING, scale)
+        cycles = timing.bit_mark * ir_link.CARRIER / 1e6
+        for name, jitter, stretch, glitch_rate, lost in CHANNELS:
+            rng = random.Random(seed)
+            decoder = ir_link.FrameDecoder(timing)
+            traces = []
+            tick = 1000
+            for seq in range(frames):
+                symbols = ir_link.frame_symbols(ir_link.encode_reading(2, random_reading(rng, seq)), timing)
+                edges, tick = impaired_edges(symbols, tick, rng, jitter, stretch, glitch_rate, lost)
+                traces.append(edges)
+                tick += 20000  # Gap between two frames
+            count = sum(len(edges) for edges in traces)
+            began = time.perf_counter()
+            for edges in traces:
+                for level, edge_tick in edges:
+                    decoder.edge(level, edge_tick)
+            elapsed = time.perf_counter() - began
+            fer = 1 - decoder.frames / frames
+            print(f"  {scale:>6.2f}x {cycles:>6.1f} {name:>16} {decoder.bitrate():>7.0f} b/s {fer:>8.2%} "
+                  f"{elapsed / count * 1e6:>8.2f} us/edge")
+
+
+# Demodulating IR receiver: carrier bursts on the transmitter GPIO become marks on the receiver GPIO
+class Demodulator:
+    def __init__(self, tx_pi, tx_gpio, rx_pi, rx_gpio, rng, delay=60, stretch=40, jitter=20):
+        self.tx_pi = tx_pi
+        self.rx_pi = rx_pi
+        self.rx_gpio = rx_gpio
+        self.rng = rng
+        self.delay = delay
+        self.stretch = stretch
+        self.jitter = jitter
+        self.gap = 2 * 1e6 / ir_link.CARRIER  # Microseconds without carrier that end a burst
+        self.start = None
+        self.off = None
+        tx_pi.callback(tx_gpio, gpio_sim.EITHER_EDGE, self.on_edge)
+
+    def on_edge(self, gpio, level, tick):
+        now = self.tx_pi.now
+        if level == 1:
+            if self.start is not None and now - self.off > self.gap:
+                self.flush()
+            if self.start is None:
+                self.start = now
+        elif level == 0 and self.start is not None:
+            self.off = now
+
+    def flush(self):
+        if self.start is None or self.off is None:
+            return
+        rise = self.start + self.delay + self.rng.gauss(0, self.jitter)
+        fall = self.off + self.delay + self.stretch + self.rng.gauss(0, self.jitter)
+        self.rx_pi.advance_to(max(self.rx_pi.now, int(rise)))
+        self.rx_pi.write(self.rx_gpio, 1)
+        self.rx_pi.advance_to(max(self.rx_pi.now + 1, int(fall)))
+        self.rx_pi.write(self.rx_gpio, 0)
+        self.start = self.off = None
+
+
+def bench_waves(seconds, seed, heartbeat_period=2.0, pulse=0.1):
+    rng = random.Random(seed)
+    tx_pi = gpio_sim.SimulatedPi()
+    rx_pi = gpio_sim.SimulatedPi()
+    transmitter = ir_link.IrTransmitter(tx_pi, 5)
+    received = []
+    receiver = ir_link.IrReceiver(rx_pi, 16, on_frame=lambda payload, tick: received.append(payload))
+    monitor = heartbeat.HeartbeatMonitor(rx_pi, 16, timeout=5.0, period=heartbeat_period, min_pulse=pulse / 2)
+    demodulator = Demodulator(tx_pi, 5, rx_pi, 16, rng)
+
+    sent = []
+    heartbeats = 0
+    next_heartbeat = 0
+    began = time.perf_counter()
+    while tx_pi.now < seconds * 1e6:
+        if tx_pi.now >= next_heartbeat and not transmitter.busy():
+            tx_pi.write(5, 1)
+            tx_pi.advance(pulse)
+            tx_pi.write(5, 0)
+            demodulator.flush()
+            heartbeats += 1
+            next_heartbeat += heartbeat_period * 1e6
+        payload = ir_link.encode_reading(2, random_reading(rng, len(sent)))
+        transmitter.send(payload)
+        sent.append(payload)
+        while tx_pi.wave_tx_busy():
+            tx_pi.advance(0.01)
+        tx_pi.advance(0.005)  # Gap between two frames
+        demodulator.flush()
+    elapsed = time.perf_counter() - began
+    rx_pi.advance_to(tx_pi.now)
+
+    stats = receiver.stats()
+    matched = len(set(received) & set(sent))
+    print(f"waves: {seconds} s simulated in {elapsed:.1f} s, {len(tx_pi.waves)} waves, "
+          f"{len(ir_link.frame_symbols(sent[0]))} symbols per frame")
+    print(f"  frames sent {len(sent)}, received {len(received)} ({matched} identical), "
+          f"FER {1 - len(received) / len(sent):.2%}")
+    print(f"  bitrate on the air {stats['bitrate']:.0f} b/s, with the gaps and heartbeats "
+          f"{len(received) * ir_link.IR_READING.size * 8 / seconds:.0f} b/s, "
+          f"{len(received) / seconds:.1f} readings/s")
+    print(f"  heartbeats sent {heartbeats}, counted {monitor.heartbeats}, glitches {stats['glitches']}, "
+          f"decoder errors {stats['crc_errors'] + stats['framing_errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=500, help="frames per codec case")
+    parser.add_argument("--seconds", type=float, default=60, help="simulated seconds of the wave path")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    bench_codec(args.frames, args.seed)
+    print()
+    bench_waves(args.seconds, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tkinter as tk
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core
+import fields
+import gui
+import protocol
+
+# Startup cost of the dashboard with many fields: the overview alone (full
+# panels built when a field is opened) against every panel built at startup.
+# Reports the startup time, the Python memory allocated while building the
+# window (tracemalloc), the number of Tk widgets, and the cost of one main
+# loop tick with a new sample for every field. Needs a display (X server).
+#
+# Usage: python benchmarks/bench_layout.py --fields 200
+
+
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+def bench(args, directory, eager):
+    path = os.path.join(directory, "fields.json")
+    fields.save_fields(path, [fields.FieldConfig(i + 1, f"Field {i + 1}", f"10.0.{i // 250}.{i % 250 + 1}", 12347)
+                              for i in range(args.fields)])
+    root = tk.Tk()
+    tracemalloc.start()
+    began = time.perf_counter()
+    monitor = core.MonitoringCore(fields_file=path, port=0, history_directory=os.path.join(directory, "history"),
+                                  metrics_port=0, stream_port=0)
+    dashboard = gui.MonitoringApp(root, monitor)
+    if eager:
+        for field_id in range(1, args.fields + 1):
+            dashboard.open_field(field_id)
+    root.update()
+    startup = time.perf_counter() - began
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    widgets = count_widgets(root)  # The panels are Toplevel children of root
+
+    rng = random.Random(1)
+    ticks = []
+    for i in range(args.ticks):
+        for field_id in range(1, args.fields + 1):
+            values = tuple(rng.uniform(0, 100) for _ in protocol.SENSORS)
+            monitor.sample_queue.put((time.perf_counter(), protocol.Sample(field_id, values, i, True)))
+        began = time.perf_counter()
+        dashboard.process_samples()
+        root.update_idletasks()
+        ticks.append(time.perf_counter() - began)
+    monitor.close()
+    root.destroy()
+    ticks.sort()
+    mode = "all panels" if eager else "overview"
+    print(f"{mode}: {args.fields} fields, startup {startup * 1000:.0f} ms, {peak / 1024 / 1024:.1f} MiB allocated, "
+          f"{widgets} widgets, tick with {args.fields} samples p50 {ticks[len(ticks) // 2] * 1000:.1f} ms, "
+          f"max {ticks[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench(args, directory, eager=False)
+    with tempfile.TemporaryDirectory() as directory:
+        bench(args, directory, eager=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import field_node
+import gpio_backend
+import gpio_sim
+import heartbeat
+import node_control
+import protocol
+import scheduler
+
+# Microbenchmarks of the node logic on plain Linux, without pigpio:
+#   - heartbeat: HeartbeatTransmitter -> simulated IR link -> HeartbeatMonitor
+#     in simulated time, recorded to a trace and replayed with ReplayPi
+#   - real-time timing: the same chain on the real clock (RealtimePi and the
+#     timer thread), interval jitter and LED switch-off lateness
+#   - command handling: LedController.handle_command alone and behind the
+#     CommandServer frame decoding and acknowledgement
+#
+# Usage: python benchmarks/bench_node.py --beats 20000 --loss 0.05
+
+TX_PIN = 5
+RX_PIN = 16
+LED_PIN = 4
+
+
+# Function to connect the IR transmitter to the receiver, losing some heartbeats
+def wire_ir_link(pi, rng, loss):
+    lost = [False]
+
+    def on_edge(gpio, level, tick):
+        if level == 1:
+            lost[0] = rng.random() < loss
+        if not lost[0]:
+            pi.write(RX_PIN, level)
+
+    return pi.callback(TX_PIN, gpio_sim.EITHER_EDGE, on_edge)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_simulated(args, trace_path):
+    rng = random.Random(1)
+    pi = gpio_sim.SimulatedPi()
+    timers = scheduler.TimerScheduler(clock=lambda: pi.now / 1e6)
+    wire_ir_link(pi, rng, args.loss)
+    monitor = heartbeat.HeartbeatMonitor(pi, RX_PIN, timeout=5.0, period=2.0)
+    recorder = gpio_backend.TraceRecorder(pi, [RX_PIN])
+    transmitter = field_node.HeartbeatTransmitter(pi, TX_PIN, timers, period=2.0).start()
+
+    began = time.perf_counter()
+    while transmitter.sent < args.beats:
+        pi.advance_to(pi.now + max(0, math.ceil(timers.next_delay() * 1e6)))
+        timers.run_pending()
+    elapsed = time.perf_counter() - began
+    stats = monitor.stats()
+    print(f"simulated: {transmitter.sent} heartbeats sent, {stats['heartbeats']} detected, loss rate {stats['loss_rate']:.2%} "
+          f"(injected {args.loss:.2%}), mean interval {stats['mean_interval']:.6f}s, jitter {stats['jitter'] * 1e6:.1f} us, "
+          f"{elapsed / transmitter.sent * 1e6:.2f} us per heartbeat (send + detect)")
+
+    recorder.save(trace_path)
+    replay = gpio_backend.ReplayPi(gpio_backend.load_trace(trace_path))
+    replayed_monitor = heartbeat.HeartbeatMonitor(replay, RX_PIN, timeout=5.0, period=2.0)
+    began = time.perf_counter()
+    edges = replay.replay()
+    elapsed = time.perf_counter() - began
+    replayed = replayed_monitor.stats()
+    same = all(replayed[key] == stats[key] for key in ("heartbeats", "losses", "mean_interval", "loss_rate"))
+    print(f"replay: {edges} edges from {os.path.getsize(trace_path) / 1024:.0f} KiB trace in {elapsed * 1000:.1f} ms "
+          f"({edges / elapsed:,.0f} edges/s), same measures as the live run: {same}")
+
+
+def bench_realtime(args):
+    rng = random.Random(2)
+    pi = gpio_backend.RealtimePi().start()
+    timers = scheduler.TimerScheduler().start()
+    wire_ir_link(pi, rng, 0.0)
+    monitor = heartbeat.HeartbeatMonitor(pi, RX_PIN, timeout=1.0, period=args.period)
+    transmitter = field_node.HeartbeatTransmitter(pi, TX_PIN, timers, period=args.period, pulse=args.period / 4).start()
+    time.sleep(args.seconds)
+    transmitter.stop()
+    stats = monitor.stats()
+    print(f"real time: {stats['heartbeats']} heartbeats every {args.period * 1000:.0f} ms, mean interval "
+          f"{stats['mean_interval'] * 1000:.3f} ms, jitter {stats['jitter'] * 1e6:.0f} us")
+
+    # LED switch-off lateness: falling edge tick against the planned duration
+    control = field_node.LedController(pi, LED_PIN, timers, log=lambda message: None)
+    started = {}
+    lateness = []
+
+    def on_led(gpio, level, tick):
+        if level == 1:
+            started["tick"] = tick
+        elif level == 0 and "tick" in started:
+            lateness.append(heartbeat.tick_diff(started.pop("tick"), tick) / 1e6 - started.pop("duration"))
+
+    pi.callback(LED_PIN, gpio_sim.EITHER_EDGE, on_led)
+    for _ in range(args.commands_timed):
+        duration = rng.uniform(0.005, 0.03)
+        started["duration"] = duration
+        control.handle_command(protocol.CMD_LED_ON, duration)
+        time.sleep(duration + 0.01)
+    timers.stop()
+    pi.stop()
+    print(f"LED switch-off after its duration: {len(lateness)} commands, late by p50 {percentile(lateness, 0.5) * 1e6:.0f} us, "
+          f"p99 {percentile(lateness, 0.99) * 1e6:.0f} us, max {max(lateness) * 1e6:.0f} us")
+
+
+def bench_commands(args):
+    pi = gpio_sim.SimulatedPi()
+    timers = scheduler.TimerScheduler(clock=lambda: pi.now / 1e6)
+    control = field_node.LedController(pi, LED_PIN, timers, log=lambda message: None)
+    rng = random.Random(3)
+    commands = [(protocol.CMD_LED_ON, rng.uniform(0.5, 10)) if rng.random() < 0.8 else (protocol.CMD_LED_OFF, 0.0)
+                for _ in range(args.commands)]
+
+    began = time.perf_counter()
+    for opcode, argument in commands:
+        control.handle_command(opcode, argument)
+    direct = time.perf_counter() - began
+
+    # Same commands as frames, decoded and acknowledged like a control connection
+    server = node_control.CommandServer(control.handle_command)
+    decoder = protocol.FrameDecoder()
+    frames = [protocol.encode_command(i, opcode, argument) for i, (opcode, argument) in enumerate(commands)]
+    began = time.perf_counter()
+    for frame in frames:
+        for message in decoder.feed(frame):
+            protocol.encode_ack(message.command_id, server.execute(message))
+    framed = time.perf_counter() - began
+    print(f"commands: handle_command {direct / args.commands * 1e6:.2f} us, with frame decoding, "
+          f"duplicate check and ack {framed / args.commands * 1e6:.2f} us per command, {len(timers)} timers pending")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--beats", type=int, default=20000)
+    parser.add_argument("--loss", type=float, default=0.05, help="probability that a heartbeat is lost")
+    parser.add_argument("--period", type=float, default=0.02, help="heartbeat period of the real-time run")
+    parser.add_argument("--seconds", type=float, default=2.0, help="length of the real-time run")
+    parser.add_argument("--commands", type=int, default=100000)
+    parser.add_argument("--commands-timed", type=int, default=100, help="LED commands of the real-time run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_simulated(args, os.path.join(directory, "ir.trace"))
+    bench_realtime(args)
+    bench_commands(args)
+
+
+if __name__ == "__main__":
+    main()
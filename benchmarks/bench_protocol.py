@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol
+
+# Benchmark of the decode throughput of the binary frames against the legacy
+# CSV format. The stream is cut into random sized reads to reproduce what
+# TCP hands to recv() under load (split and coalesced messages).
+#
+# Usage: python benchmarks/bench_protocol.py [number of samples]
+
+
+# Function to build a stream of encoded samples for both formats
+def build_streams(count):
+    rng = random.Random(1)
+    binary = bytearray()
+    csv = bytearray()
+    for i in range(count):
+        field_id = i % 50 + 1
+        values = tuple(rng.uniform(0, 100) for _ in protocol.SENSORS)
+        heartbeat = rng.random() > 0.1
+        binary += protocol.encode_sample(field_id, values, i, heartbeat)
+        csv += protocol.encode_csv_sample(f"pi_{field_id}", values, i, heartbeat)
+    return bytes(binary), bytes(csv)
+
+
+# Function to cut a stream into reads of random size
+def split_reads(stream, max_read=4096):
+    rng = random.Random(2)
+    reads = []
+    offset = 0
+    while offset < len(stream):
+        size = rng.randint(1, max_read)
+        reads.append(stream[offset:offset + size])
+        offset += size
+    return reads
+
+
+# Function to decode every read and return (samples decoded, seconds)
+def run(decoder, reads):
+    decoded = 0
+    start = time.perf_counter()
+    for data in reads:
+        decoded += len(decoder.feed(data))
+    return decoded, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    binary, csv = build_streams(count)
+
+    print(f"{count} samples")
+    results = {}
+    for name, decoder_class, stream in (("binary", protocol.FrameDecoder, binary), ("csv", protocol.CsvDecoder, csv)):
+        decoded, elapsed = run(decoder_class(), split_reads(stream))
+        assert decoded == count, f"{name}: decoded {decoded} of {count} samples"
+        results[name] = count / elapsed
+        print(f"{name:>6}: {len(stream) / count:5.1f} bytes/sample, {elapsed:6.3f}s, {results[name]:12,.0f} samples/s")
+    print(f"binary is {results['binary'] / results['csv']:.1f}x faster to decode")
+
+
+if __name__ == "__main__":
+    main()
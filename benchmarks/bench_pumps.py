@@ -0,0 +1,195 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol
+import pumps
+
+# Pump automation engine: time of one tick (evaluation of every field) for
+# thousands of fields, then a simulated day of a few fields on a fake
+# clock (soil drying out, watered by its pump) to check the rules: pumps
+# start below `start` and stop above `stop`, the minimum on/off times and
+# the daily budget are respected, and no pump runs past its lease.
+# Scenarios on one field check each rule on its own: hysteresis, minimum
+# on and off times, daily budget, lease renewal and stale data. Exits
+# with status 1 on any violation, so it can gate a change.
+#
+# Usage: python benchmarks/bench_pumps.py --fields 1000 10000 100000 --day-fields 20
+
+
+def rule(engine, field_id, budget=60.0):
+    engine.set_rule(field_id, protocol.SOIL_HUMIDITY, start=30, stop=40, min_on=30, min_off=60, flow=2.0, budget=budget)
+
+
+def bench_tick(count, ticks, rng):
+    engine = pumps.PumpEngine()
+    for field_id in range(count):
+        rule(engine, field_id)
+    values = [(rng.uniform(20, 50), 0.0, 0.0, 0.0) for _ in range(count)]
+    now = 1_700_000_000.0
+    durations = []
+    changes = 0
+    for _ in range(ticks):
+        now += 1.0
+        for field_id in rng.sample(range(count), count // 2):  # One sample every 2 s per field
+            values[field_id] = (min(100.0, max(0.0, values[field_id][0] + rng.gauss(0, 1))), 0.0, 0.0, 0.0)
+            engine.update(field_id, values[field_id], now)
+        began = time.perf_counter()
+        events = engine.evaluate(now)
+        durations.append(time.perf_counter() - began)
+        changes += len(events.started) + len(events.stopped)
+    durations.sort()
+    print(f"{count:7} fields: tick p50 {durations[len(durations) // 2] * 1e3:.3f} ms, "
+          f"max {durations[-1] * 1e3:.3f} ms ({durations[len(durations) // 2] / count * 1e9:.0f} ns/field), "
+          f"{changes / ticks:.1f} pumps switched per tick, {int(engine.on.sum())} running")
+
+
+# Function to run the single field scenarios, returns the list of failures
+def check_rules():
+    failures = []
+
+    def expect(condition, message):
+        if not condition:
+            failures.append(message)
+
+    def setup(budget=60.0):
+        engine = pumps.PumpEngine(day=lambda now: int(now // 86400))
+        rule(engine, 1, budget)
+        return engine
+
+    # Function to give a value at `now` and evaluate, returns (started, stopped, renewed, over budget) of the field
+    def step(engine, now, value):
+        engine.update(1, (value, 0.0, 0.0, 0.0), now)
+        events = engine.evaluate(now)
+        return tuple(0 in rows for rows in events)
+
+    day = 86400.0 * 20000
+
+    # Hysteresis: starts below 30, keeps running between 30 and 40, stops above 40
+    engine = setup()
+    expect(step(engine, day, 35)[0] is False, "started between the thresholds")
+    expect(step(engine, day + 1, 29)[0], "not started below the start threshold")
+    expect(not step(engine, day + 100, 35)[1], "stopped between the thresholds")
+    expect(step(engine, day + 101, 41)[1], "not stopped above the stop threshold")
+
+    # Minimum on and off times
+    engine = setup()
+    step(engine, day, 20)
+    expect(not step(engine, day + 29, 50)[1], "stopped before min_on")
+    expect(step(engine, day + 30, 50)[1], "not stopped once min_on elapsed")
+    expect(not step(engine, day + 89, 20)[0], "started again before min_off")
+    expect(step(engine, day + 90, 20)[0], "not started again once min_off elapsed")
+
+    # Daily budget: 1 L at 2 L/min is 30 s of pumping, the budget restarts the next day
+    engine = setup(budget=1.0)
+    step(engine, day, 20)
+    expect(engine.command_duration(0) == 30.0, f"command of {engine.command_duration(0)} s for a 30 s budget")
+    expect(not step(engine, day + 29, 20)[1], "stopped before the budget was used")
+    expect(step(engine, day + 31, 20)[3], "not stopped once the budget was used")
+    expect(not any(step(engine, day + 31 + 60 * minute, 20)[0] for minute in range(1, 60)),
+           "started again the day its budget was used")
+    expect(step(engine, day + 86400, 20)[0], "not started the next day")
+
+    # Lease: a running pump is renewed RENEW_MARGIN seconds before its lease ends, not before
+    engine = setup()
+    step(engine, day, 20)
+    expect(engine.lease_until[0] == day + pumps.LEASE, "lease of the start command")
+    expect(not step(engine, day + pumps.LEASE - pumps.RENEW_MARGIN - 1, 20)[2], "lease renewed too early")
+    renewed_at = day + pumps.LEASE - pumps.RENEW_MARGIN
+    expect(step(engine, renewed_at, 20)[2], "lease not renewed before its end")
+    expect(engine.lease_until[0] == renewed_at + pumps.LEASE, "renewed lease does not start from the renewal")
+
+    # Stale data stops the pump, and a field without fresh data never starts
+    engine = setup()
+    step(engine, day, 20)
+    events = engine.evaluate(day + pumps.STALE_AFTER + 1)
+    expect(0 in events.stopped, "pump kept running without fresh data")
+    events = engine.evaluate(day + 200)
+    expect(0 not in events.started, "pump started on stale data")
+    return failures
+
+
+def simulate_day(count, rng):
+    engine = pumps.PumpEngine(day=lambda now: int(now // 86400))
+    budget = 60.0
+    humidity = [rng.uniform(25, 45) for _ in range(count)]
+    dry_rate = [rng.uniform(15, 60) / 86400 for _ in range(count)]  # Points per second, 15 to 60 per day
+    for field_id in range(count):
+        rule(engine, field_id, budget)
+    node_on_until = [0.0] * count  # The node turns its pump off at the end of the command duration
+    switches = [[] for _ in range(count)]  # (time, on, humidity, stopped by the budget)
+    run_time = [0.0] * count
+    now = 86400.0 * 20000
+    end = now + 86400 - 1
+    while now < end:
+        for field_id in range(count):
+            if now < node_on_until[field_id]:
+                humidity[field_id] += 0.02  # Watering, 1.2 points per minute
+                run_time[field_id] += 1.0
+            humidity[field_id] = max(0.0, humidity[field_id] - dry_rate[field_id])
+            if int(now) % 2 == 0:
+                engine.update(field_id, (humidity[field_id], 0.0, 0.0, 0.0), now)
+        events = engine.evaluate(now)
+        for row in np.concatenate((events.started, events.renewed)).tolist():
+            node_on_until[row] = now + engine.command_duration(row)
+        over_budget = set(events.over_budget.tolist())
+        for row in events.started.tolist():
+            switches[row].append((now, True, float(engine.value[row]), False))
+        for row in events.stopped.tolist():
+            node_on_until[row] = now
+            switches[row].append((now, False, float(engine.value[row]), row in over_budget))
+        now += 1.0
+
+    starts = sum(on for runs in switches for _, on, _, _ in runs)
+    bad_start = sum(on and value >= 30 for runs in switches for _, on, value, _ in runs)
+    short_on = short_off = early_stop = 0
+    for runs in switches:
+        for (previous, _, _, _), (at, on, value, budget_used) in zip(runs, runs[1:]):
+            if on:
+                short_off += at - previous < 60
+            else:
+                short_on += at - previous < 30 and not budget_used  # The budget may cut a run short
+                early_stop += value <= 40
+    water = [seconds / 60 * 2.0 for seconds in run_time]
+    failures = []
+    if bad_start:
+        failures.append(f"{bad_start} pumps started above the start threshold")
+    if short_on or short_off:
+        failures.append(f"{short_on} runs shorter than min_on, {short_off} pauses shorter than min_off")
+    # One tick of pumping may go over the budget
+    if max(water) > budget + 2.0 / 60:
+        failures.append(f"{max(water):.2f} L used for a budget of {budget:g} L")
+    print(f"day of {count} fields: {starts} starts ({bad_start} above the start threshold), "
+          f"{short_on} runs shorter than min_on (budget aside), {short_off} pauses shorter than min_off, "
+          f"{early_stop} stops at or below the stop threshold (budget used)")
+    print(f"  water per field: {min(water):.1f} to {max(water):.1f} L for a budget of {budget:g} L, "
+          f"humidity at the end {min(humidity):.1f} to {max(humidity):.1f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--day-fields", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    for count in args.fields:
+        bench_tick(count, args.ticks, rng)
+    failures = simulate_day(args.day_fields, rng) + check_rules()
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("checks: every rule held")
+
+
+if __name__ == "__main__":
+    main()
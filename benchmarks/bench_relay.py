@@ -0,0 +1,139 @@
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingestion
+import peer_link
+import sampling
+import uplink
+
+# Relay of a node through the other node (peer_link.py) against its direct
+# uplink, on the real ingestion server over localhost:
+#
+#   direct   the node uplink (spool, batch frames) straight to the dashboard
+#   relay    the node sends on the peer channel, the other node forwards
+#            the samples through its relayed uplink (second spool)
+#
+# For each path: latency of the samples sent one by one at --rate (node
+# timestamp to received by the dashboard, same clock), then the throughput
+# of a burst of --burst samples. Finally the uplink of the node comes back
+# and replays its spool, which holds the relayed samples too: checks that
+# the dashboard drops every copy and gets each sample once.
+#
+# Usage: python benchmarks/bench_relay.py --rate 200 --samples 2000 --burst 20000
+
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return f"p50 {pick(0.5):.2f} ms, p99 {pick(0.99):.2f} ms, max {values[-1] * 1000:.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=200, help="samples per second for the latency")
+    parser.add_argument("--samples", type=int, default=2000, help="samples sent one by one per path")
+    parser.add_argument("--burst", type=int, default=20000, help="samples of the throughput burst")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    quiet = lambda *args: None
+    arrivals = {}  # seq -> reception time
+    copies = {}  # seq -> samples handed to the dashboard
+
+    def on_sample(sample):
+        arrivals[sample.seq] = time.time()
+        copies[sample.seq] = copies.get(sample.seq, 0) + 1
+
+    background = ingestion.BackgroundLoop().start()
+    server = ingestion.IngestionServer(on_sample, host="127.0.0.1", port=0).start_in_thread(background)
+
+    # Port nobody listens on: the uplink of the relayed node stays down during the relay runs
+    closed = socket.socket()
+    closed.bind(("127.0.0.1", 0))
+    closed_port = closed.getsockname()[1]
+
+    direct = uplink.Uplink("pi_2", "127.0.0.1", server.port, uplink.Spool(os.path.join(directory, "direct.spool")),
+                           min_backoff=0.05, max_backoff=0.05, log=quiet).start()
+    node = uplink.Uplink("pi_3", "127.0.0.1", closed_port, uplink.Spool(os.path.join(directory, "node.spool")),
+                         min_backoff=0.05, max_backoff=0.05, log=quiet).start()
+    relay = peer_link.Relay("127.0.0.1", server.port, spool_path=os.path.join(directory, "relay_{}.spool"), log=quiet)
+    relaying = peer_link.PeerChannel("pi_1", relay.forward, port=0, log=quiet).start()
+    channel = peer_link.PeerChannel("pi_3", host="127.0.0.1", port=relaying.port, log=quiet).start()
+    while not (channel.connected and direct.connected):
+        time.sleep(0.001)
+
+    seq = 0
+    sent = {}  # seq -> node timestamp
+
+    # Function to send `count` samples on `send`, one by one at `rate` (all at once without rate)
+    def produce(send, count, rate=None):
+        nonlocal seq
+        first = seq
+        for _ in range(count):
+            reading = sampling.Reading(seq, time.time(), (seq % 100, 1.0, 2.0, 3.0), seq // 10)
+            sent[seq] = reading.timestamp
+            send([reading])
+            seq += 1
+            if rate:
+                time.sleep(1 / rate)
+        return range(first, seq)
+
+    def wait_for(seqs, timeout=60.0):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end and any(number not in arrivals for number in (seqs[0], seqs[-1])):
+            time.sleep(0.0005)
+        time.sleep(0.1)
+        return [number for number in seqs if number not in arrivals]
+
+    # The node keeps every sample in its spool, as rasp_sender.py does while relaying; the
+    # burst waits for the queue of the channel instead of overflowing it
+    def relayed_send(readings):
+        node.send(readings)
+        while len(channel.queue) >= peer_link.SEND_QUEUE // 2:
+            time.sleep(0.0005)
+        channel.send(readings)
+
+    print(f"latency, {args.samples} samples at {args.rate:g}/s; throughput, burst of {args.burst} samples")
+    for name, send in (("direct", direct.send), ("relay", relayed_send)):
+        seqs = produce(send, args.samples, args.rate)
+        missing = wait_for(seqs)
+        latencies = [arrivals[number] - sent[number] for number in seqs if number in arrivals]
+        print(f"  {name:7} latency {percentiles(latencies)}, {len(missing)} missing")
+        began = time.time()
+        seqs = produce(send, args.burst)
+        missing = wait_for(seqs)
+        elapsed = max(arrivals[number] for number in seqs if number in arrivals) - began
+        print(f"  {name:7} burst in {elapsed * 1000:.0f} ms, {args.burst / elapsed:,.0f} samples/s, {len(missing)} missing")
+
+    # The uplink of the node comes back: its spool is replayed, the relayed samples a second time
+    relayed = len(node.spool)
+    node.port = server.port
+    while len(node.spool):
+        time.sleep(0.001)
+    time.sleep(0.3)
+    counts = [copies.get(number, 0) for number in sent]
+    print(f"  channel: {channel.sent_records} samples sent, {channel.dropped} dropped from its queue, "
+          f"{relay.forwarded} forwarded by the relay")
+    print(f"dedup: {relayed} samples replayed by the node after the relay, {server.duplicates} copies dropped, "
+          f"{server.relayed} samples received as relayed, {server.late} late")
+    print(f"  {sum(1 for count in counts if count == 1)} of {len(sent)} samples handed over once, "
+          f"{sum(1 for count in counts if count > 1)} more than once, {sum(1 for count in counts if not count)} never")
+
+    channel.stop()
+    relaying.stop()
+    relay.stop()
+    node.stop()
+    direct.stop()
+    closed.close()
+    server.stop_thread()
+    background.stop()
+
+
+if __name__ == "__main__":
+    main()
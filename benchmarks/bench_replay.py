@@ -0,0 +1,161 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alerting
+import fields
+import ingestion
+import protocol
+import recording
+import sampling
+
+# Deterministic throughput benchmark on a recorded session: the same
+# frames, in the same reads, go through the same code every run. Without
+# --session, a session of N simulated nodes is generated first (seeded).
+#
+# Headless (default): the session is replayed as fast as possible into an
+# IngestionServer (parse stage), the latest sample of each field is applied
+# to its FieldState every 100 ms of recorded time, like the dashboard tick,
+# and the alert rules are evaluated (alert stage). With --gui, the session
+# is replayed into MonitoringApp and the render stage is measured by the app
+# histograms (needs a display).
+#
+# Usage: python benchmarks/bench_replay.py --nodes 500 --seconds 60
+#        python benchmarks/bench_replay.py --session incident.rec --speed 100
+#        python benchmarks/bench_replay.py --gui --speed max
+
+
+# Function to write a session of `nodes` nodes sending batches at `rate` samples per second
+def generate_session(path, nodes, seconds, rate, batch, seed=1):
+    rng = random.Random(seed)
+    start = 1_700_000_000.0
+    recorder = recording.SessionRecorder(path)
+    connections = [recorder.open_connection(("10.0.0.%d" % (i % 250 + 1), 40000 + i), start) for i in range(nodes)]
+    sends = []
+    for node in range(nodes):
+        values = [rng.uniform(20, 80) for _ in protocol.SENSORS]
+        phase = rng.uniform(0, batch / rate)
+        seq = 0
+        taken = start + phase
+        while taken + batch / rate < start + seconds:
+            readings = []
+            for _ in range(batch):
+                for sensor in range(len(values)):
+                    values[sensor] = min(100.0, max(0.0, values[sensor] + rng.gauss(0, 2)))
+                readings.append(sampling.Reading(seq, taken, tuple(values), int(taken - start)))
+                seq += 1
+                taken += 1 / rate
+            received = taken + rng.uniform(0.0005, 0.003)
+            sends.append((received, node, protocol.encode_batch(node + 1, readings, True, taken)))
+    sends.sort()
+    for received, node, frame in sends:
+        recorder.data(connections[node], frame, received)
+    for connection in connections:
+        recorder.close_connection(connection, start + seconds)
+    recorder.close()
+
+
+def bench_headless(args, path):
+    pending = []
+    server = ingestion.IngestionServer(pending.append)
+    states = {}
+    alerts = alerting.ThresholdEngine()
+    stages = {"apply": 0.0, "alert": 0.0}
+    raised = [0]
+
+    # Main loop tick of the dashboard without Tk
+    def tick(now):
+        began = time.perf_counter()
+        latest = {}
+        for sample in pending:
+            latest[sample.field_id] = sample
+        del pending[:]
+        for sample in latest.values():
+            state = states.get(sample.field_id)
+            if state is None:
+                state = states[sample.field_id] = fields.FieldState(fields.FieldConfig(sample.field_id, "", None, 0))
+                for sensor in range(len(protocol.SENSORS)):
+                    alerts.set_rule(sample.field_id, sensor, upper=90, lower=10, hysteresis=1.0)
+            state.update(sample.values, sample.uptime)
+            alerts.update(state.field_id, state.values)
+        evaluated = time.perf_counter()
+        raised[0] += len(alerts.evaluate(now).raised[0])
+        stages["apply"] += evaluated - began
+        stages["alert"] += time.perf_counter() - evaluated
+
+    replayer = recording.SessionReplayer(path, server, args.speed, on_tick=tick)
+    began = time.perf_counter()
+    replayer.run()
+    elapsed = time.perf_counter() - began
+    parse = server.parse_time.total
+    checksum = round(sum(sum(state.values) for state in states.values()), 2)
+    print(f"headless: {server.samples} samples, {replayer.events} events, {replayer.bytes / 1024 / 1024:.1f} MiB "
+          f"in {elapsed:.2f}s = {server.samples / elapsed:,.0f} samples/s")
+    print(f"  parse {parse:.2f}s ({parse / server.samples * 1e6:.2f} us/sample), apply {stages['apply']:.2f}s, "
+          f"alert {stages['alert']:.2f}s, {raised[0]} alerts raised, {len(states)} fields, checksum {checksum}")
+
+
+def bench_gui(args, path, directory):
+    import tkinter as tk
+    import core
+    import gui
+
+    root = tk.Tk()
+    monitor = core.MonitoringCore(fields_file=os.path.join(directory, "fields.json"), port=0, history_directory=None,
+                                  metrics_port=0, stream_port=0, replay=path, replay_speed=args.speed)
+    gui.MonitoringApp(root, monitor)
+    began = time.perf_counter()
+
+    def check():
+        if monitor.replayer.finished and monitor.sample_queue.empty():
+            root.quit()
+        else:
+            root.after(50, check)
+
+    root.after(50, check)
+    root.mainloop()
+    elapsed = time.perf_counter() - began
+    snapshot = monitor.metrics_snapshot()
+    monitor.close()
+    root.destroy()
+    counters = snapshot["counters"]
+    print(f"gui: {counters['samples_received']} samples in {elapsed:.2f}s, {counters['samples_applied']} shown, "
+          f"{counters['samples_coalesced']} coalesced")
+    for name, histogram in snapshot["histograms"].items():
+        print(f"  {name}: p50 {histogram['p50'] * 1000:.3f} ms, p99 {histogram['p99'] * 1000:.3f} ms, "
+              f"max {histogram['max'] * 1000:.3f} ms ({histogram['count']})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--session", help="recorded session, generated when not given")
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--rate", type=float, default=2, help="samples per second per node")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--speed", default="max", help="1, 100... or max")
+    parser.add_argument("--gui", action="store_true")
+    args = parser.parse_args()
+    args.speed = None if args.speed == "max" else float(args.speed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.session
+        if path is None:
+            path = os.path.join(directory, "session.rec")
+            began = time.perf_counter()
+            generate_session(path, args.nodes, args.seconds, args.rate, args.batch)
+            print(f"session: {args.nodes} nodes x {args.seconds:g}s at {args.rate:g} samples/s, "
+                  f"{os.path.getsize(path) / 1024 / 1024:.1f} MiB, generated in {time.perf_counter() - began:.1f}s")
+        if args.gui:
+            bench_gui(args, path, directory)
+        else:
+            bench_headless(args, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol
+import sampling
+
+# Simulation of one field node on a fake clock, comparing the old main loop
+# (work, then time.sleep(2)) with the adaptive sampling loop. The sensors
+# are stable with a little noise, and the soil humidity regularly ramps
+# above the pump threshold; the IR link is lost now and then. Each step
+# costs a random amount of work (reading the sensors, sending).
+#
+# Prints samples, sends and bytes per hour (frames only, and on the wire
+# with the TCP/IP headers of each send), the real sampling period, how long
+# batched samples wait before being sent, and how long a threshold
+# crossing takes to be reported.
+#
+# Usage: python benchmarks/bench_sampling.py --hours 24
+
+
+THRESHOLD = 70.0
+PACKET_OVERHEAD = 40  # IPv4 + TCP headers of each send
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+# Simulated field: soil humidity ramps from 50 to 80 and back once per `every` seconds
+class Field:
+    def __init__(self, rng, hours, every=1800.0):
+        self.rng = rng
+        self.events = [rng.uniform(0, every) + i * every for i in range(int(hours * 3600 / every))]
+        self.outages = [(start, start + rng.uniform(10, 120)) for start in
+                        (rng.uniform(0, hours * 3600) for _ in range(int(hours)))]
+
+    def humidity(self, t):
+        for start in self.events:
+            if start <= t < start + 180:
+                offset = t - start
+                if offset < 60:
+                    return 50 + offset / 2  # Ramp up, crosses 70 at 40 s
+                if offset < 120:
+                    return 80
+                return 80 - (offset - 120) / 2
+        return 50.0
+
+    def crossings(self):
+        return [start + 40 for start in self.events]
+
+    def read(self, t):
+        noise = self.rng.gauss
+        return (self.humidity(t) + noise(0, 0.2), 40 + noise(0, 0.2), 20 + noise(0, 0.2), 60 + noise(0, 0.2))
+
+    def link_up(self, t):
+        return not any(start <= t < end for start, end in self.outages)
+
+
+# Function to measure the delay between each threshold crossing and the first sample reporting it
+def detection_delays(field, sent):
+    delays = []
+    for crossing in field.crossings():
+        for sent_at, taken_at, humidity in sent:
+            if taken_at >= crossing and humidity >= THRESHOLD:
+                delays.append(sent_at - crossing)
+                break
+    return delays
+
+
+def report(name, hours, samples, sends, total_bytes, periods, sent, delays):
+    waits = [sent_at - taken_at for sent_at, taken_at, _ in sent]
+    mean_period = sum(periods) / len(periods)
+    print(f"{name}:")
+    print(f"  {samples / hours:,.0f} samples/h, {sends / hours:,.0f} sends/h, "
+          f"{total_bytes / hours / 1024:,.1f} KiB/h of frames, {(total_bytes + sends * PACKET_OVERHEAD) / hours / 1024:,.1f} KiB/h on the wire")
+    print(f"  normal period {mean_period:.3f}s (nominal 2s), batched samples sent after mean {sum(waits) / len(waits):.2f}s max {max(waits):.2f}s")
+    print(f"  threshold crossing reported after mean {sum(delays) / len(delays):.2f}s max {max(delays):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--work", type=float, default=0.4, help="longest work time of a step in seconds")
+    args = parser.parse_args()
+
+    # Old loop: work, send one sample, sleep 2 seconds
+    rng = random.Random(1)
+    field = Field(random.Random(2), args.hours)
+    clock = FakeClock()
+    end = args.hours * 3600
+    samples = total_bytes = 0
+    sent = []
+    taken = []
+    while clock.now < end:
+        clock.now += rng.uniform(0.05, args.work)
+        values = field.read(clock.now)
+        taken.append(clock.now)
+        total_bytes += len(protocol.encode_sample(1, values, int(clock.now), field.link_up(clock.now)))
+        samples += 1
+        sent.append((clock.now, clock.now, values[0]))
+        clock.sleep(2)
+    periods = [b - a for a, b in zip(taken, taken[1:])]
+    report("sleep(2) loop", args.hours, samples, samples, total_bytes, periods, sent, detection_delays(field, sent))
+
+    # Adaptive loop on absolute deadlines
+    field = Field(random.Random(2), args.hours)
+    clock = FakeClock()
+    sent = []
+    taken = []
+
+    def read_values():
+        if clock.now >= end:
+            loop.stop()
+        clock.now += rng.uniform(0.05, args.work)
+        taken.append((clock.now, loop.fast))
+        return field.read(clock.now)
+
+    def send(readings):
+        for reading in readings:
+            sent.append((clock.now, reading.timestamp, reading.values[0]))
+        return len(protocol.encode_batch(1, readings, field.link_up(clock.now)))
+
+    loop = sampling.SamplingLoop(read_values, send, period=2.0, fast_period=0.5, thresholds=(THRESHOLD,) * 4,
+                                 max_batch=5, urgent=lambda: not field.link_up(clock.now),
+                                 clock=clock, wall_clock=clock, sleep=clock.sleep)
+    loop.run()
+    periods = [b - a for (a, _), (b, fast) in zip(taken, taken[1:]) if not fast]
+    report("adaptive loop", clock.now / 3600, loop.samples, loop.sends, loop.bytes_sent, periods, sent, detection_delays(field, sent))
+    print(f"  {loop.overruns} missed deadlines, {sum(1 for _, fast in taken if fast)} fast samples")
+
+
+if __name__ == "__main__":
+    main()
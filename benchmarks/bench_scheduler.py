@@ -0,0 +1,194 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import field_node
+import gpio_sim
+import protocol
+import scheduler
+
+# Benchmark of the node timer scheduler with many actuators: a random
+# stream of on(duration)/off/extend commands is replayed against a fake
+# clock, the output of every actuator is checked against the expected
+# deadline after each step, and the thread count is compared with the old
+# one-thread-per-command approach. A short run on the real clock checks
+# the worker thread. Scenarios on the fake clock check cancellation,
+# extension, an older timer facing a newer command, periodic timers and
+# the refusal of NaN and infinite delays.
+# Exits with status 1 on any wrong output, so it can gate a change.
+#
+# Usage: python benchmarks/bench_scheduler.py --actuators 1000 --commands 200000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# Function to run the fake clock scenarios, returns the list of failures
+def check_scenarios():
+    failures = []
+
+    def expect(condition, message):
+        if not condition:
+            failures.append(message)
+
+    def setup():
+        clock = FakeClock()
+        timers = scheduler.TimerScheduler(clock)
+        output = [0]
+        actuator = scheduler.Actuator("led", lambda level: output.__setitem__(0, level), timers, log=lambda message: None)
+        return clock, timers, output, actuator
+
+    def advance(clock, timers, now):
+        clock.now = now
+        timers.run_pending()
+
+    # A cancelled timer never runs and leaves nothing pending
+    clock, timers, output, actuator = setup()
+    fired = []
+    timer = timers.schedule(1.0, fired.append, 1)
+    timers.cancel(timer)
+    advance(clock, timers, 5.0)
+    expect(not fired and len(timers) == 0, "cancelled timer ran or stayed pending")
+
+    # Turning off cancels the switch-off of the previous command
+    actuator.turn_on(5.0)
+    advance(clock, timers, 6.0)
+    actuator.turn_on(5.0)
+    actuator.turn_off()
+    actuator.turn_on()
+    advance(clock, timers, 20.0)
+    expect(output[0] == 1 and len(timers) == 0, "switch-off of a cancelled command turned the output off")
+
+    # Extension moves the switch-off, shorter or longer
+    clock, timers, output, actuator = setup()
+    actuator.turn_on(5.0)
+    advance(clock, timers, 3.0)
+    expect(actuator.extend(2.0), "extend of a pending command failed")
+    advance(clock, timers, 6.9)
+    expect(output[0] == 1, "output off before its extended deadline")
+    advance(clock, timers, 7.0)
+    expect(output[0] == 0 and not actuator.extend(2.0), "output on after its extended deadline, or extended once off")
+
+    # An older timer never turns off a newer command
+    clock, timers, output, actuator = setup()
+    actuator.turn_on(5.0)
+    old_token = actuator.token
+    advance(clock, timers, 1.0)
+    actuator.turn_on(10.0)
+    actuator.expire(old_token)  # Old timer already popped by the worker when the new command came
+    advance(clock, timers, 5.5)
+    expect(output[0] == 1, "older timer turned off a newer command")
+    advance(clock, timers, 11.0)
+    expect(output[0] == 0, "newer command not turned off at its deadline")
+
+    # Periodic timers run on absolute deadlines and skip the missed runs
+    clock, timers, output, actuator = setup()
+    runs = []
+    timers.every(1.0, lambda: runs.append(clock.now))
+    for step in range(1, 21):
+        advance(clock, timers, step * 0.5 + 0.01)
+    advance(clock, timers, 100.2)
+    advance(clock, timers, 100.5)
+    expect(len(runs) == 11 and timers.heap[0][0] == 101.0, f"periodic timer drifted or ran a burst: {runs}")
+
+    # Non-finite delays are refused, by the scheduler and by the LED command of a node,
+    # and the timers behind them still run
+    clock, timers, output, actuator = setup()
+    for delay in (float("nan"), float("inf")):
+        try:
+            timers.schedule(delay, print)
+            expect(False, f"timer scheduled in {delay} seconds")
+        except ValueError:
+            pass
+    led = field_node.LedController(gpio_sim.SimulatedPi(), 17, timers, log=lambda message: None)
+    for duration in (float("nan"), float("inf"), 0.0):
+        expect(led.handle_command(protocol.CMD_LED_ON, duration) == protocol.ACK_ERROR,
+               f"LED command of {duration} seconds accepted")
+    fired = []
+    timers.schedule(0.1, fired.append, 1)
+    advance(clock, timers, 0.2)
+    expect(fired == [1] and len(timers) == 0, "timer not run after the refused delays")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actuators", type=int, default=1000)
+    parser.add_argument("--commands", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    clock = FakeClock()
+    timers = scheduler.TimerScheduler(clock)
+    outputs = [0] * args.actuators
+    actuators = [scheduler.Actuator(f"actuator {i}", lambda level, i=i: outputs.__setitem__(i, level), timers, log=lambda message: None)
+                 for i in range(args.actuators)]
+    deadlines = [None] * args.actuators  # Expected switch-off time, None when off
+
+    errors = 0
+    began = time.perf_counter()
+    for _ in range(args.commands):
+        clock.now += rng.expovariate(args.actuators / 2.0)
+        timers.run_pending()
+        if rng.random() < 0.001:
+            # Every output must match the deadline of the last command
+            for i in range(args.actuators):
+                expected = deadlines[i] is not None and deadlines[i] > clock.now
+                errors += outputs[i] != expected
+        i = rng.randrange(args.actuators)
+        if deadlines[i] is not None and deadlines[i] <= clock.now:
+            deadlines[i] = None
+        action = rng.random()
+        if action < 0.7:
+            duration = rng.uniform(0.5, 10)
+            actuators[i].turn_on(duration)
+            deadlines[i] = clock.now + duration
+        elif action < 0.85:
+            actuators[i].turn_off()
+            deadlines[i] = None
+        elif deadlines[i] is not None:
+            actuators[i].extend(2.0)
+            deadlines[i] += 2.0
+    elapsed = time.perf_counter() - began
+
+    print(f"{args.commands} commands on {args.actuators} actuators in {elapsed:.2f}s "
+          f"({args.commands / elapsed:,.0f} commands/s), {errors} wrong outputs, {len(timers)} timers pending")
+    print(f"threads: 1 scheduler thread (thread per command would have started {args.commands} threads)")
+    failures = check_scenarios()
+    if errors:
+        failures.append(f"{errors} wrong outputs in the random command stream")
+
+    # Real clock: one worker thread serves every timer
+    before = threading.active_count()
+    timers = scheduler.TimerScheduler().start()
+    fired = []
+    for i in range(10000):
+        timers.schedule(rng.uniform(0, 0.2), fired.append, i)
+    during = threading.active_count()
+    time.sleep(0.5)
+    print(f"real clock: {len(fired)} of 10000 timers fired, threads {before} -> {during}")
+    timers.stop()
+    if len(fired) != 10000:
+        failures.append(f"{10000 - len(fired)} timers not fired on the real clock")
+    if during != before + 1:
+        failures.append(f"{during - before} threads started for 10000 timers, expected 1")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("checks: every output matched its last command")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import and startup time of each mode of the dashboard, every run in a new
+# Python process (nothing cached in memory but the OS file cache):
+#
+#   import core      the headless core
+#   import app       the entry point, must not load tkinter
+#   import gui       the window code (tkinter, tk_tools only with a panel)
+#   headless start   MonitoringCore ready (ingestion listening) and closed
+#   window start     MonitoringCore and the Tk window with the overview of
+#                    all the fields drawn (needs a display)
+#
+# Also checks which of tkinter and tk_tools each mode loaded. The median of
+# --runs runs is reported, `python -X importtime app.py` details an import.
+#
+# Usage: python benchmarks/bench_startup.py --fields 200 --runs 10
+
+SETUP = f"""
+import sys, time
+sys.path.insert(0, {ROOT!r})
+began = time.perf_counter()
+"""
+
+REPORT = """
+elapsed = time.perf_counter() - began
+print(elapsed, "tkinter" in sys.modules, "tk_tools" in sys.modules)
+"""
+
+START_CORE = """
+import core
+monitor = core.MonitoringCore(fields_file=FIELDS, port=0, history_directory=None, metrics_port=0, stream_port=0)
+monitor.close()
+"""
+
+START_WINDOW = """
+import tkinter as tk
+import core
+import gui
+monitor = core.MonitoringCore(fields_file=FIELDS, port=0, history_directory=None, metrics_port=0, stream_port=0)
+root = tk.Tk()
+gui.MonitoringApp(root, monitor)
+root.update()
+monitor.close()
+root.destroy()
+"""
+
+
+# Function to run `code` in new processes, returns (median seconds, tkinter loaded, tk_tools loaded)
+def measure(code, runs, fields_file):
+    results = []
+    for _ in range(runs):
+        program = SETUP + code.replace("FIELDS", repr(fields_file)) + REPORT
+        output = subprocess.run([sys.executable, "-c", program], capture_output=True, text=True, cwd=ROOT)
+        if output.returncode != 0:
+            return None, output.stderr.strip().splitlines()[-1]
+        elapsed, tkinter_loaded, tk_tools_loaded = output.stdout.split()[-3:]
+        results.append((float(elapsed), tkinter_loaded == "True", tk_tools_loaded == "True"))
+    results.sort()
+    return results[len(results) // 2], None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import fields
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fields.json")
+        fields.save_fields(path, [fields.FieldConfig(i + 1, f"Field {i + 1}", f"10.0.{i // 250}.{i % 250 + 1}", 12347)
+                                  for i in range(args.fields)])
+        modes = [("import core", "import core"), ("import app", "import app"), ("import gui", "import gui"),
+                 ("headless start", START_CORE), ("window start", START_WINDOW)]
+        print(f"{args.fields} fields, median of {args.runs} runs")
+        for name, code in modes:
+            result, error = measure(code, args.runs, path)
+            if result is None:
+                print(f"  {name:15} failed: {error}")
+                continue
+            elapsed, tkinter_loaded, tk_tools_loaded = result
+            loaded = ", ".join(module for module, flag in (("tkinter", tkinter_loaded), ("tk_tools", tk_tools_loaded))
+                               if flag) or "no Tk module"
+            print(f"  {name:15} {elapsed * 1000:7.1f} ms  ({loaded})")
+
+
+if __name__ == "__main__":
+    main()
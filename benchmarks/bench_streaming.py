@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingestion
+import protocol
+import streaming
+
+# Fan-out of the local stream (streaming.py) to many subscribers over
+# localhost. The subscribers run as asyncio clients in a child process,
+# with mixed filters: every field, two fields, two sensors, one field and
+# one sensor without alerts. A few more subscribers never read (stalled,
+# small receive buffer): their queues fill and drop the oldest messages.
+#
+#   rate    samples of --fields fields published one by one at --rate,
+#           latency from publishing to read by the subscriber
+#   burst   --burst samples published as fast as possible from another
+#           thread than the event loop, as the ingestion thread does
+#
+# For each phase: latency percentiles over every sample read, samples read
+# against the ones expected by the filters, messages dropped, and the time
+# publish_sample() takes on the publishing thread (waiting for the GIL
+# held by the event loop thread included).
+#
+# Usage: python benchmarks/bench_streaming.py --subscribers 100 --rate 200 --samples 2000 --burst 20000
+
+
+def subscription(index, field_count):
+    kind = index % 4
+    if kind == 0:
+        return {}
+    if kind == 1:
+        return {"fields": [index % field_count, (index + 1) % field_count]}
+    if kind == 2:
+        return {"sensors": [0, 2]}
+    return {"fields": [index % field_count], "sensors": [1], "alerts": False}
+
+
+def percentiles(values):
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return f"p50 {pick(0.5):.2f} ms, p90 {pick(0.9):.2f} ms, p99 {pick(0.99):.2f} ms, max {values[-1] * 1000:.2f} ms"
+
+
+async def subscriber(port, request, first_burst, latencies, counts, ready):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+    writer.write(streaming.encode(request))
+    await writer.drain()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            counts[3] = time.monotonic()
+            message = json.loads(line)
+            kind = message["type"]
+            if kind == "sample":
+                phase = 1 if message["seq"] >= first_burst else 0
+                latencies[phase].append(time.time() - message["timestamp"])
+                counts[phase] += 1
+            elif kind == "dropped":
+                counts[2] += message["count"]
+            elif kind == "subscribed":
+                ready()
+    finally:
+        writer.close()
+
+
+# Child process: the subscribers, report once the parent sends anything on the pipe and they read everything
+def run_subscribers(port, count, field_count, first_burst, conn):
+    async def main():
+        latencies = ([], [])
+        counts = [[0, 0, 0, 0.0] for _ in range(count)]  # Rate phase, burst phase, dropped, last read
+        subscribed = 0
+
+        def ready():
+            nonlocal subscribed
+            subscribed += 1
+            if subscribed == count:
+                conn.send("ready")
+
+        tasks = [asyncio.create_task(subscriber(port, subscription(index, field_count), first_burst, latencies,
+                                                counts[index], ready))
+                 for index in range(count)]
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        # Lines still in the socket buffers: read until nothing comes for a second
+        while time.monotonic() - max(count[3] for count in counts) < 1.0:
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        conn.send((percentiles(latencies[0]), percentiles(latencies[1]), counts))
+
+    asyncio.run(main())
+
+
+# Function to count the samples a subscription expects out of `samples` samples sent round robin
+def expected(request, samples, field_count):
+    fields = request.get("fields")
+    if fields is None:
+        return samples
+    return sum(1 for seq in range(samples) if seq % field_count in fields)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--stalled", type=int, default=2, help="subscribers that never read")
+    parser.add_argument("--fields", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=200, help="samples per second of the first phase")
+    parser.add_argument("--samples", type=int, default=2000, help="samples of the first phase")
+    parser.add_argument("--burst", type=int, default=20000, help="samples of the burst phase")
+    args = parser.parse_args()
+
+    background = ingestion.BackgroundLoop().start()
+    server = streaming.StreamServer(port=0)
+    background.submit(server.start()).result()
+
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=run_subscribers,
+                                      args=(server.port, args.subscribers, args.fields, args.samples, child))
+    process.start()
+    parent.recv()
+
+    stalled = []
+    for _ in range(args.stalled):
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.connect(("127.0.0.1", server.port))
+        sock.sendall(streaming.encode({}))
+        stalled.append(sock)
+    while len(server.subscribers) < args.subscribers + args.stalled:
+        time.sleep(0.001)
+    stalled_subscribers = server.subscribers[-args.stalled:] if args.stalled else ()
+
+    seq = 0
+    publish_time = [0.0, 0.0]
+
+    def publish(count, rate, phase):
+        nonlocal seq
+        for _ in range(count):
+            sample = protocol.Sample(seq % args.fields, (seq % 100, 1.0, 2.0, 3.0), seq // 10, True, time.time(), seq)
+            began = time.perf_counter()
+            server.publish_sample(sample)
+            publish_time[phase] += time.perf_counter() - began
+            seq += 1
+            if rate:
+                time.sleep(1 / rate)
+
+    # Function to wait until the subscribers that read have nothing queued
+    def drain(timeout=60.0):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end and any(subscriber.queue for subscriber in server.subscribers
+                                             if subscriber not in stalled_subscribers):
+            time.sleep(0.01)
+        time.sleep(0.5)
+
+    began = time.perf_counter()
+    publish(args.samples, args.rate, 0)
+    drain()
+    burst_began = time.perf_counter()
+    publish(args.burst, None, 1)
+    burst_elapsed = time.perf_counter() - burst_began
+    drain()
+    parent.send("stop")
+    rate_latency, burst_latency, counts = parent.recv()
+    process.join()
+
+    requests = [subscription(index, args.fields) for index in range(args.subscribers)]
+    wanted = [sum(expected(request, args.samples, args.fields) for request in requests),
+              sum(expected(request, args.samples + args.burst, args.fields) - expected(request, args.samples, args.fields)
+                  for request in requests)]
+    read = [sum(count[phase] for count in counts) for phase in (0, 1)]
+    dropped = sum(count[2] for count in counts)
+    print(f"{args.subscribers} subscribers ({args.stalled} more never read), {args.fields} fields, "
+          f"queue of {streaming.STREAM_QUEUE} messages per subscriber")
+    print(f"  rate   {args.samples} samples at {args.rate:g}/s: latency {rate_latency}")
+    print(f"         {read[0]} of {wanted[0]} samples read, publish {publish_time[0] / args.samples * 1e6:.1f} us/sample")
+    print(f"  burst  {args.burst} samples in {burst_elapsed * 1000:.0f} ms ({args.burst / burst_elapsed:,.0f} samples/s): "
+          f"latency {burst_latency}")
+    print(f"         {read[1]} of {wanted[1]} samples read, {dropped} dropped, "
+          f"publish {publish_time[1] / args.burst * 1e6:.1f} us/sample")
+    print(f"  stalled subscribers: {sum(subscriber.dropped for subscriber in stalled_subscribers)} messages dropped, "
+          f"{sum(len(subscriber.queue) for subscriber in stalled_subscribers)} queued; "
+          f"{time.perf_counter() - began:.1f} s in all")
+
+    for sock in stalled:
+        sock.close()
+    background.submit(server.stop()).result()
+    background.stop()
+
+
+if __name__ == "__main__":
+    main()
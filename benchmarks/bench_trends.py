@@ -0,0 +1,128 @@
+import argparse
+import os
+import random
+import sys
+import time
+import tkinter as tk
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gui
+import protocol
+import trends
+
+# Trend strips under the gauges: cost of one trend tick, where every field
+# closes a point (the worst case, one point per tick). First the headless
+# part (trends.TrendBuffer, adding the values of a tick and closing the
+# points of every field), then, with a display, the strips of the open
+# panels: gui.TrendStrip appending one segment per point against a strip
+# redrawn as one line of all its points (coords) every tick. The time
+# includes the Tk redraw (update_idletasks).
+#
+# Usage: python benchmarks/bench_trends.py --fields 1000 10000 --panels 12 48
+
+
+def bench_buffer(count, ticks, rng):
+    buffer = trends.TrendBuffer()
+    values = [[rng.uniform(0, 100) for _ in protocol.SENSORS] for _ in range(count)]
+    adds = []
+    advances = []
+    now = 1_700_000_000.0
+    buffer.advance(now)
+    for _ in range(ticks):
+        began = time.perf_counter()
+        for field_id in range(count):
+            buffer.add(field_id, values[field_id])
+        added = time.perf_counter()
+        now += buffer.period
+        buffer.advance(now)
+        advances.append(time.perf_counter() - added)
+        adds.append(added - began)
+    adds.sort()
+    advances.sort()
+    print(f"{count:6} fields, buffer: add {adds[len(adds) // 2] / count * 1e6:.2f} us/sample, "
+          f"closing the points p50 {advances[len(advances) // 2] * 1e3:.3f} ms max {advances[-1] * 1e3:.3f} ms, "
+          f"{buffer.points[0].nbytes} bytes of points per field")
+
+
+# Strip redrawn whole every tick: one line item, all its coordinates set again
+class FullRedrawStrip(tk.Canvas):
+    def __init__(self, parent, width=trends.TREND_WIDTH):
+        super().__init__(parent, width=width, height=gui.TrendStrip.HEIGHT, bg="white", highlightthickness=0)
+        self.line = self.create_line(0, 0, 0, 0, fill="blue")
+
+    def draw(self, values):
+        y = 1 + (gui.TrendStrip.HEIGHT - 3) * (1 - np.clip(np.nan_to_num(values), 0, 100) / 100)
+        coords = np.empty(2 * len(values))
+        coords[0::2] = np.arange(len(values))
+        coords[1::2] = y
+        if len(values) >= 2:
+            self.coords(self.line, *coords.tolist())
+
+
+def bench_strips(root, panels, ticks, incremental, rng):
+    buffer = trends.TrendBuffer()
+    frame = tk.Frame(root)
+    frame.pack()
+    strips = []
+    for field_id in range(panels):
+        for sensor in range(len(protocol.SENSORS)):
+            strip = gui.TrendStrip(frame) if incremental else FullRedrawStrip(frame)
+            strip.grid(row=field_id // 4, column=(field_id % 4) * 4 + sensor)
+            strips.append((field_id, sensor, strip))
+    now = 1_700_000_000.0
+    buffer.advance(now)
+    values = [[50.0] * len(protocol.SENSORS) for _ in range(panels)]
+    # Full strips first, the steady state of a dashboard running for a while
+    for tick in range(buffer.width + ticks):
+        for field_values in values:
+            for sensor in range(len(field_values)):
+                field_values[sensor] = min(100.0, max(0.0, field_values[sensor] + rng.gauss(0, 2)))
+        for field_id, field_values in enumerate(values):
+            buffer.add(field_id, field_values)
+        if tick == buffer.width:
+            durations = []
+            root.update()
+        began = time.perf_counter()
+        now += buffer.period
+        buffer.advance(now)
+        for field_id, sensor, strip in strips:
+            if incremental:
+                strip.append(buffer.series(field_id, sensor, 1)[0])
+            else:
+                strip.draw(buffer.series(field_id, sensor))
+        root.update_idletasks()
+        if tick >= buffer.width:
+            durations.append(time.perf_counter() - began)
+    frame.destroy()
+    durations.sort()
+    mode = "incremental" if incremental else "full redraw"
+    print(f"{panels:6} panels ({panels * len(protocol.SENSORS)} strips), {mode:11}: "
+          f"tick p50 {durations[len(durations) // 2] * 1e3:.2f} ms, max {durations[-1] * 1e3:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--panels", type=int, nargs="+", default=[12, 48])
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    for count in args.fields:
+        bench_buffer(count, args.ticks, rng)
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"strips skipped, no display: {e}")
+        return
+    for panels in args.panels:
+        for incremental in (True, False):
+            bench_strips(root, panels, args.ticks, incremental, rng)
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
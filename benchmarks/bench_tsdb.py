@@ -0,0 +1,99 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol
+import tsdb
+
+# Benchmark of the time-series store: writes a month of history for 100
+# fields, then times month-long range queries on every series at the
+# 1-hour and 1-minute rollups, and a day of raw points. Then a node
+# replays an hour of spooled backlog after the newer samples of the same
+# hour (relayed): times the merge of the late points and checks that every
+# point is stored in order and counted by the rollups (exits with status 1
+# otherwise).
+#
+# Usage: python benchmarks/bench_tsdb.py --fields 100 --days 30 --step 300
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=100)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--step", type=float, default=300, help="seconds between two samples of a field")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    end = 1_700_000_000.0
+    start = end - args.days * 86400
+    steps = int((end - start) / args.step)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = tsdb.TimeSeriesStore(directory)
+
+        # Write path, as done by the writer thread
+        began = time.perf_counter()
+        for i in range(steps):
+            timestamp = start + i * args.step
+            for field_id in range(1, args.fields + 1):
+                store.write(timestamp, field_id, (rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0, 100)))
+            if i % 1000 == 999:
+                store.flush()
+        store.flush()
+        elapsed = time.perf_counter() - began
+        points = steps * args.fields * len(protocol.SENSORS)
+        print(f"write: {points:,} points in {elapsed:.2f}s ({points / elapsed:,.0f} points/s)")
+
+        # Cost seen by the ingestion thread
+        sample = protocol.Sample(1, (1.0, 2.0, 3.0, 4.0), 0, True)
+        began = time.perf_counter()
+        for _ in range(100000):
+            store.append_sample(sample, end)
+        print(f"append_sample: {(time.perf_counter() - began) / 100000 * 1e6:.2f} us per sample")
+
+        # Reopen from disk so the queries read the mapped files
+        store = tsdb.TimeSeriesStore(directory)
+        began = time.perf_counter()
+        for field_id in range(1, args.fields + 1):
+            for sensor in range(len(protocol.SENSORS)):
+                store.series_for(field_id, sensor, create=False)
+        print(f"open: {args.fields * len(protocol.SENSORS)} series in {(time.perf_counter() - began) * 1000:.1f} ms")
+        for label, resolution, query_start in (("1h rollup, month", 3600, start),
+                                               ("1m rollup, month", 60, start),
+                                               ("raw, last day", 0, end - 86400)):
+            rows = 0
+            began = time.perf_counter()
+            for field_id in range(1, args.fields + 1):
+                for sensor in range(len(protocol.SENSORS)):
+                    result = store.query(field_id, sensor, query_start, end + 1, resolution)
+                    rows += len(result[0])
+            elapsed = time.perf_counter() - began
+            queries = args.fields * len(protocol.SENSORS)
+            print(f"{label:>17}: {queries} series, {rows:,} rows in {elapsed * 1000:.1f} ms ({elapsed / queries * 1000:.3f} ms per series)")
+
+        # Late points: the relayed samples of an hour first, then the backlog of the node
+        live = [end + 3600 + 2 * i for i in range(1800)]
+        backlog = [end + 3600 + 2 * i + 1 for i in range(1800)]
+        for timestamp in live + backlog:
+            store.write(timestamp, 1, (1.0, 2.0, 3.0, 4.0))
+        began = time.perf_counter()
+        store.flush()
+        elapsed = time.perf_counter() - began
+        times, _ = store.query(1, 0, end + 3600, end + 7200, 0)
+        rollup = store.query(1, 0, end + 3600, end + 7200, 60)
+        stored = list(times) == sorted(live + backlog)
+        counted = sum(rollup.count) == len(live) + len(backlog)
+        print(f"late: {len(backlog)} backlog points after {len(live)} newer ones merged in {elapsed * 1000:.1f} ms, "
+              f"{'all stored in order' if stored else 'NOT stored in order'}, "
+              f"{'counted by the rollups' if counted else 'NOT counted by the rollups'}")
+        if not (stored and counted):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingestion
+import sampling
+import uplink
+
+# Outage test of the node uplink against the real ingestion server: a
+# node produces samples at a fixed rate, the dashboard server is stopped
+# for a while and started again on the same port. Checks that every
+# sample taken during the outage reaches the dashboard once, in order and
+# with its original timestamp, and measures the reconnect time, the replay
+# throughput of the backlog and the cost of the spool.
+#
+# Usage: python benchmarks/bench_uplink.py --rate 200 --outage 5
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=200, help="samples per second")
+    parser.add_argument("--outage", type=float, default=5, help="seconds without dashboard")
+    parser.add_argument("--records", type=int, default=200000, help="records for the spool microbenchmark")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    received = []
+    arrivals = {}  # seq -> reception time
+
+    def on_sample(sample):
+        received.append(sample)
+        arrivals[sample.seq] = time.perf_counter()
+
+    background = ingestion.BackgroundLoop().start()
+    quiet = lambda *args: None
+    server = ingestion.IngestionServer(on_sample, host="127.0.0.1", port=0).start_in_thread(background)
+    port = server.port
+
+    link = uplink.Uplink("pi_7", "127.0.0.1", port, uplink.Spool(os.path.join(directory, "uplink.spool")),
+                         min_backoff=0.05, max_backoff=0.5, log=quiet).start()
+    produced = {}
+    seq = 0
+
+    # Function to produce samples at the rate for `seconds`
+    def produce(seconds):
+        nonlocal seq
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            reading = sampling.Reading(seq, time.time(), (seq % 100, 1.0, 2.0, 3.0), seq // 10)
+            produced[seq] = reading.timestamp
+            link.send([reading], True)
+            seq += 1
+            time.sleep(1 / args.rate)
+
+    produce(1.0)
+    server.stop_thread()
+    outage_start = seq
+    produce(args.outage)
+    backlog = len(link.spool)
+    server = ingestion.IngestionServer(on_sample, host="127.0.0.1", port=port).start_in_thread(background)
+    restarted = time.monotonic()
+    while not link.connected:
+        time.sleep(0.001)
+    reconnected = time.monotonic() - restarted
+    produce(1.0)
+    while len(link.spool):
+        time.sleep(0.001)
+    time.sleep(0.2)
+    link.stop()
+    server.stop_thread()
+    background.stop()
+
+    seqs = [sample.seq for sample in received]
+    missing = len(set(produced) - set(seqs))
+    duplicates = len(seqs) - len(set(seqs))
+    out_of_order = sum(1 for a, b in zip(seqs, seqs[1:]) if b < a)
+    wrong_time = sum(1 for sample in received if abs(sample.timestamp - produced[sample.seq]) > 0.0005)
+    replayed = arrivals[outage_start + backlog - 1] - arrivals[outage_start]
+    gap = [sample for sample in received if outage_start <= sample.seq < outage_start + backlog]
+    print(f"produced {len(produced)} samples, backlog of {backlog} at the restart of the server")
+    print(f"received {len(received)}: {missing} missing, {duplicates} duplicates, {out_of_order} out of order, "
+          f"{wrong_time} with a wrong timestamp, {len(gap)} of the outage samples filled in")
+    print(f"reconnected {reconnected * 1000:.0f} ms after the restart, backlog replayed in {replayed * 1000:.1f} ms "
+          f"({backlog / max(replayed, 1e-9):,.0f} samples/s), {link.connections} connections, {link.failed_connects} failed attempts")
+
+    # Spool cost per record
+    spool = uplink.Spool(os.path.join(directory, "bench.spool"), capacity=args.records)
+    readings = [sampling.Reading(i, 1e9 + i, (1.0, 2.0, 3.0, 4.0), i) for i in range(args.records)]
+    began = time.perf_counter()
+    for i in range(0, args.records, 5):
+        spool.append(readings[i:i + 5], True)
+    appended = time.perf_counter() - began
+    began = time.perf_counter()
+    while len(spool):
+        records = spool.peek(uplink.REPLAY_RECORDS)
+        uplink.split_batches(records)
+        spool.pop(len(records))
+    drained = time.perf_counter() - began
+    spool.close()
+    print(f"spool: append {appended / args.records * 1e6:.2f} us/record, peek+split+pop {drained / args.records * 1e6:.2f} us/record")
+
+
+if __name__ == "__main__":
+    main()
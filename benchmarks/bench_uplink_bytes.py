@@ -0,0 +1,99 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol
+import sampling
+import simulator
+import uplink
+
+# Uplink traffic of one field node for one hour, per wire format: the
+# samples of the node sampling loop (fake clock, same settings as the node
+# scripts) are sent through Uplink.encode, one call per send of the loop,
+# like a connected node. The delta frames are decoded back with the
+# dashboard decoder to check the largest error on the values shown.
+# Payload bytes only (TCP/IP headers not counted).
+#
+# Usage: python benchmarks/bench_uplink_bytes.py --hours 1 --deadband 0 0.5 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+# Function to run the sampling loop for `hours`, returns the readings of every send
+def sample_hour(model, hours, seed):
+    rng = random.Random(seed)
+    values = simulator.MODELS[model](rng)
+    clock = FakeClock()
+    sends = []
+    loop = sampling.SamplingLoop(lambda: values.next(clock.now), lambda readings: sends.append(readings),
+                                 period=2, fast_period=0.5, thresholds=(70, 70, 70, 70), max_batch=5,
+                                 clock=clock, wall_clock=lambda: 1_700_000_000.0 + clock.now, sleep=clock.sleep)
+    while clock.now < hours * 3600:
+        loop.run(1)
+    return sends
+
+
+# Function to encode the sends like a connected node, returns (bytes, largest error of the values shown)
+def measure(link, sends):
+    decoder = protocol.FrameDecoder()
+    total = 0
+    shown = None
+    error = 0.0
+    for readings in sends:
+        data = link.encode([(reading, True) for reading in readings])
+        total += len(data)
+        if link.wire_format == "csv":
+            continue
+        samples = {sample.seq: sample for sample in decoder.feed(data)}
+        for reading in readings:
+            shown = samples.get(reading.seq, shown)  # Skipped: the dashboard keeps the last values
+            error = max(error, max(abs(a - b) for a, b in zip(shown.values, reading.values)))
+    return total, error
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--models", nargs="+", default=["walk", "daily", "uniform"], choices=sorted(simulator.MODELS))
+    parser.add_argument("--deadband", type=float, nargs="+", default=[0, 0.5, 1])
+    parser.add_argument("--keyframe-interval", type=float, default=uplink.KEYFRAME_INTERVAL)
+    args = parser.parse_args()
+
+    formats = [("csv", {}), ("binary", {})]
+    formats += [(f"delta {deadband:g}", {"wire_format": "delta", "deadband": deadband,
+                                         "keyframe_interval": args.keyframe_interval}) for deadband in args.deadband]
+    with tempfile.TemporaryDirectory() as directory:
+        spool = uplink.Spool(os.path.join(directory, "bench.spool"), capacity=16)
+        for model in args.models:
+            sends = sample_hour(model, args.hours, seed=1)
+            samples = sum(len(readings) for readings in sends)
+            print(f"{model}: {samples / args.hours:.0f} samples and {len(sends) / args.hours:.0f} sends per hour")
+            for name, options in formats:
+                options = dict(options)
+                options.setdefault("wire_format", name)
+                link = uplink.Uplink("pi_1", "127.0.0.1", spool=spool, **options)
+                total, error = measure(link, sends)
+                line = f"  {name:10} {total / args.hours:10,.0f} bytes/hour {total / samples:6.1f} bytes/sample"
+                if link.wire_format != "csv":
+                    line += f"  max error {error:.3f}"
+                if link.encoder is not None:
+                    line += f"  {link.encoder.skipped / samples:.0%} samples skipped"
+                print(line)
+        spool.close()
+
+
+if __name__ == "__main__":
+    main()
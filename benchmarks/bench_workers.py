@@ -0,0 +1,146 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingestion
+import ingestion_workers
+import protocol
+import sampling
+
+# Ingestion throughput with the decoding in the dashboard process (one
+# IngestionServer thread putting every sample on a queue drained by the
+# main thread, like app.py) and in 1, 2, 4... worker processes writing the
+# latest samples to shared memory (ingestion_workers). Client processes
+# send batch frames to the port as fast as they can; the samples decoded
+# per second are counted on the receiving side.
+#
+# The clients take CPU too: run on a machine with more cores than workers
+# + clients for the scaling to show.
+#
+# Usage: python benchmarks/bench_workers.py --workers 0 1 2 4 8 --clients 4 --nodes 400
+
+
+# Function to build the frames a node sends in a loop, `batches` frames of `batch` samples
+def node_frames(field_id, batch, batches, rng):
+    frames = []
+    seq = 0
+    now = time.time()
+    for _ in range(batches):
+        readings = []
+        for _ in range(batch):
+            readings.append(sampling.Reading(seq, now + seq, tuple(rng.uniform(0, 100) for _ in protocol.SENSORS), seq))
+            seq += 1
+        frames.append(protocol.encode_batch(field_id, readings, True, now))
+    return b"".join(frames)
+
+
+# Client process: its share of the nodes, each on its own connection, sending for `duration` seconds
+def run_client(port, field_ids, batch, duration):
+    rng = random.Random(field_ids[0])
+    connections = []
+    for field_id in field_ids:
+        sock = socket.create_connection(("127.0.0.1", port))
+        connections.append((sock, node_frames(field_id, batch, 20, rng)))
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        for sock, data in connections:
+            try:
+                sock.sendall(data)
+            except OSError:
+                return
+    for sock, _ in connections:
+        sock.close()
+
+
+# Function to count the samples decoded per second while the clients send
+def measure(port, samples, args, context):
+    nodes = list(range(1, args.nodes + 1))
+    duration = args.warmup + args.duration + 1
+    clients = [context.Process(target=run_client, args=(port, nodes[i::args.clients], args.batch, duration), daemon=True)
+               for i in range(args.clients)]
+    for client in clients:
+        client.start()
+    time.sleep(args.warmup)
+    first = samples()
+    began = time.perf_counter()
+    time.sleep(args.duration)
+    rate = (samples() - first) / (time.perf_counter() - began)
+    for client in clients:
+        client.join(5)
+        if client.is_alive():
+            client.terminate()
+    return rate
+
+
+def bench_single(args, context):
+    received = queue.SimpleQueue()
+    server = ingestion.IngestionServer(lambda sample: received.put((time.perf_counter(), sample)),
+                                       host="127.0.0.1", port=0).start_in_thread()
+    running = True
+
+    # Main loop tick of the dashboard: drain the queue, keep the latest sample of each field
+    def drain():
+        while running:
+            latest = {}
+            try:
+                while True:
+                    _, sample = received.get_nowait()
+                    latest[sample.field_id] = sample
+            except queue.Empty:
+                pass
+            time.sleep(0.1)
+
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+    rate = measure(server.port, lambda: server.samples, args, context)
+    running = False
+    drainer.join()
+    server.stop_thread()
+    return rate
+
+
+def bench_workers(args, context, workers):
+    pool = ingestion_workers.IngestionWorkers(workers, host="127.0.0.1", port=0, log_level="WARNING").start()
+    table = pool.table
+
+    # Published by the workers every PUBLISH_INTERVAL, read at that pace
+    def samples():
+        time.sleep(ingestion_workers.PUBLISH_INTERVAL * 1.5)
+        return pool.samples
+
+    rate = measure(pool.port, samples, args, context)
+    changed = len(table.read_changed())
+    pool.stop()
+    return rate, changed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--nodes", type=int, default=400)
+    parser.add_argument("--batch", type=int, default=10, help="samples per frame")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--warmup", type=float, default=1)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{os.cpu_count()} cores, {args.clients} client processes, {args.nodes} nodes, {args.batch} samples per frame")
+    for workers in args.workers:
+        if workers == 0:
+            print(f"in the dashboard process: {bench_single(args, context):12,.0f} samples/s")
+        else:
+            rate, changed = bench_workers(args, context, workers)
+            print(f"{workers:2} worker process(es):     {rate:12,.0f} samples/s ({changed} fields in shared memory)")
+
+
+if __name__ == "__main__":
+    main()
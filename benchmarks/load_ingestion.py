@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingestion
+import protocol
+
+# Load test of the ingestion server: N simulated field nodes connect to one
+# port and stream sample frames. Reports the sustained ingestion rate and
+# checks that every node was identified and every sample received.
+#
+# Usage: python benchmarks/load_ingestion.py --nodes 50 --rate 100 --duration 5
+
+
+# Simulated field node sending `rate` samples per second (0 = as fast as possible)
+async def simulated_node(field_id, port, rate, duration, batch, sent):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    rng = random.Random(field_id)
+    interval = batch / rate if rate else 0
+    start = time.perf_counter()
+    next_send = start
+    uptime = 0
+    while time.perf_counter() - start < duration:
+        frames = bytearray()
+        for _ in range(batch):
+            values = tuple(rng.uniform(0, 100) for _ in protocol.SENSORS)
+            frames += protocol.encode_sample(field_id, values, uptime, True)
+            uptime += 1
+        writer.write(frames)
+        await writer.drain()
+        sent[field_id] = sent.get(field_id, 0) + batch
+        if interval:
+            next_send += interval
+            await asyncio.sleep(max(0, next_send - time.perf_counter()))
+        else:
+            await asyncio.sleep(0)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(args):
+    received = [0]
+
+    def on_sample(sample):
+        received[0] += 1
+
+    server = await ingestion.IngestionServer(on_sample, host="127.0.0.1", port=0).start()
+    sent = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(simulated_node(field_id, server.port, args.rate, args.duration, args.batch, sent)
+                           for field_id in range(1, args.nodes + 1)))
+    # Let the server drain what is still in flight
+    total = sum(sent.values())
+    while received[0] < total and time.perf_counter() - start < args.duration + 5:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await server.stop()
+
+    print(f"{args.nodes} nodes, {total} samples sent, {received[0]} received in {elapsed:.2f}s")
+    print(f"ingestion rate: {received[0] / elapsed:,.0f} samples/s")
+    print(f"nodes identified: {len(server.nodes)}, invalid frames: {server.invalid_frames}")
+    if received[0] != total or len(server.nodes) != args.nodes:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=100, help="samples per second per node, 0 for unlimited")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--batch", type=int, default=1, help="frames written per send")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
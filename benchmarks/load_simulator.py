@@ -0,0 +1,134 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import control
+import ingestion
+import protocol
+
+# Production-like load on the dashboard ingestion path: the simulator runs
+# N virtual nodes in a separate process (so its CPU is not counted), this
+# process runs the ingestion server like app.py and a consumer draining
+# the samples at the dashboard refresh rate. Reports the ingestion rate,
+# the end-to-end latency (sample taken on the node -> handed to the
+# dashboard), and the CPU used by the dashboard process. With
+# --command-port, the LED command of every node is also sent once per
+# second and the acknowledgement latency reported.
+#
+# Usage: python benchmarks/load_simulator.py --nodes 1000 --rate 1 --duration 20
+#        python benchmarks/load_simulator.py --nodes 200 --ir-loss 0.01 --fault-rate 0.01 --command-port 21000
+
+SIMULATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simulator.py")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=1, help="samples per second per node")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--model", default="walk")
+    parser.add_argument("--ir-loss", type=float, default=0.0)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--command-port", type=int, default=None)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--fps", type=float, default=10, help="dashboard refresh rate of the consumer")
+    args = parser.parse_args()
+
+    latencies = array("d")
+    received = [0]
+    heartbeats_lost = [0]
+    pending = []
+    lock = threading.Lock()
+
+    # Ingestion callback of the dashboard: latency, then hand over to the consumer
+    def on_sample(sample):
+        latencies.append(time.time() - sample.timestamp)
+        with lock:
+            pending.append(sample)
+
+    background = ingestion.BackgroundLoop().start()
+    server = ingestion.IngestionServer(on_sample, host="127.0.0.1", port=0).start_in_thread(background)
+
+    # Consumer like MonitoringApp.process_samples: latest sample per field at each refresh
+    stop = threading.Event()
+
+    def consume():
+        while not stop.wait(1 / args.fps):
+            with lock:
+                batch = pending[:]
+                del pending[:]
+            latest = {}
+            for sample in batch:
+                latest[sample.field_id] = sample
+                if sample.heartbeat is False:
+                    heartbeats_lost[0] += 1
+            received[0] += len(batch)
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+
+    command = [sys.executable, SIMULATOR, "--nodes", str(args.nodes), "--port", str(server.port),
+               "--rate", str(args.rate), "--batch", str(args.batch), "--model", args.model,
+               "--ir-loss", str(args.ir_loss), "--fault-rate", str(args.fault_rate), "--duration", str(args.duration)]
+    if args.command_port is not None:
+        command += ["--command-port", str(args.command_port)]
+    simulator = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+
+    hub = None
+    command_latencies = []
+    if args.command_port is not None:
+        hub = control.ControlHub(background)
+        for i in range(args.nodes):
+            hub.add_node(i + 1, "127.0.0.1", args.command_port + i)
+
+    time.sleep(1)  # Let the nodes connect
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    received_start = received[0]
+    while simulator.poll() is None and time.monotonic() - wall_start < args.duration - 1.5:
+        if hub is not None:
+            futures = [hub.send(i + 1, protocol.CMD_LED_ON, 1.0) for i in range(args.nodes)]
+            for future in futures:
+                try:
+                    command_latencies.append(future.result().latency)
+                except control.CommandError:
+                    pass
+        time.sleep(1)
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+    rate = (received[0] - received_start) / wall
+
+    output, _ = simulator.communicate()
+    time.sleep(2 / args.fps)
+    stop.set()
+    consumer.join()
+    if hub is not None:
+        background.submit(hub.close()).result()
+    server.stop_thread()
+    background.stop()
+
+    print(output.strip())
+    print(f"dashboard: {received[0]} samples received, {rate:,.0f} samples/s during the measure, "
+          f"{len(server.nodes)} nodes seen, {sum(node.connections for node in server.nodes.values())} connections, "
+          f"{server.invalid_frames} invalid frames, {heartbeats_lost[0]} samples without IR heartbeat")
+    print(f"end-to-end latency: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p95 {percentile(latencies, 0.95) * 1000:.2f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+    print(f"dashboard CPU: {cpu / wall:.1%} of one core ({cpu / max(1, rate * wall) * 1e6:.1f} us per sample)")
+    if command_latencies:
+        print(f"commands: {len(command_latencies)} acknowledged, p50 {percentile(command_latencies, 0.5) * 1000:.2f} ms, "
+              f"p99 {percentile(command_latencies, 0.99) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import random
+import time
+from collections import namedtuple
+
+import protocol
+
+# Dashboard side of the command channel: one long-lived connection per
+# node, commands carry an id and are acknowledged by the node, resent on
+# timeout and reported with their round-trip latency. The channels run on
+# the dashboard background event loop and can be driven from the Tk thread
+# through ControlHub.
+
+CONTROL_PORT = 12347
+COMMAND_TIMEOUT = 1.0  # Seconds to wait for an acknowledgement
+COMMAND_RETRIES = 2  # Extra attempts after the first timeout
+LATENCY_SMOOTHING = 0.2  # Weight of the last round trip in the average latency
+
+CommandResult = namedtuple("CommandResult", ["field_id", "command_id", "opcode", "status", "latency", "attempts"])
+
+
+class CommandError(Exception):
+    def __init__(self, field_id, message):
+        super().__init__(message)
+        self.field_id = field_id
+
+
+# Persistent command connection to one node
+class ControlChannel:
+    # Ids start at a random value so a restarted dashboard does not reuse ids the node remembers
+    ids = itertools.count(random.getrandbits(31))
+
+    def __init__(self, field_id, host, port=CONTROL_PORT, timeout=COMMAND_TIMEOUT, retries=COMMAND_RETRIES):
+        self.field_id = field_id
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.pending = {}  # command id -> future resolved by the acknowledgement
+        self.writer = None
+        self.reader_task = None
+        self.lock = None
+        self.latency = None  # Last round trip in seconds
+        self.average_latency = None
+        self.failures = 0
+
+    async def connect(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.writer is None or self.writer.is_closing():
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                self.writer = writer
+                self.reader_task = asyncio.ensure_future(self.read_acks(reader, writer))
+
+    def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def close(self):
+        self.disconnect()
+        if self.reader_task is not None:
+            await self.reader_task
+
+    # Function to resolve the pending commands with the acknowledgements of the node
+    async def read_acks(self, reader, writer):
+        decoder = protocol.FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                for message in decoder.feed(data):
+                    if message.__class__ is protocol.Ack:
+                        future = self.pending.get(message.command_id)
+                        if future is not None and not future.done():
+                            future.set_result(message.status)
+        except (ConnectionError, protocol.ProtocolError):
+            pass
+        finally:
+            if self.writer is writer:
+                self.writer = None
+            writer.close()
+
+    async def send(self, opcode, argument=0.0):
+        command_id = next(self.ids) & 0xFFFFFFFF
+        frame = protocol.encode_command(command_id, opcode, argument)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[command_id] = future
+        error = None
+        try:
+            for attempt in range(1, self.retries + 2):
+                try:
+                    await self.connect()
+                    sent_at = time.perf_counter()
+                    self.writer.write(frame)
+                    await self.writer.drain()
+                    status = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+                except (OSError, asyncio.TimeoutError) as e:
+                    # Reconnect before the next attempt, the node drops the duplicates by id
+                    error = e if str(e) else "timeout"
+                    self.disconnect()
+                    continue
+                self.latency = time.perf_counter() - sent_at
+                if self.average_latency is None:
+                    self.average_latency = self.latency
+                else:
+                    self.average_latency += LATENCY_SMOOTHING * (self.latency - self.average_latency)
+                return CommandResult(self.field_id, command_id, opcode, status, self.latency, attempt)
+            self.failures += 1
+            raise CommandError(self.field_id, f"Field {self.field_id}: no acknowledgement for command {command_id} after {self.retries + 1} attempts ({error})")
+        finally:
+            del self.pending[command_id]
+
+
+# Every command channel of the dashboard, usable from any thread
+class ControlHub:
+    def __init__(self, background):
+        self.background = background  # ingestion.BackgroundLoop running the channels
+        self.channels = {}  # field id -> ControlChannel
+
+    def add_node(self, field_id, host, port=CONTROL_PORT):
+        self.channels[field_id] = ControlChannel(field_id, host, port)
+
+    # Function to send a command from any thread, returns a concurrent.futures.Future
+    # of the CommandResult; callback(future) is called from the event loop thread
+    def send(self, field_id, opcode, argument=0.0, callback=None):
+        future = self.background.submit(self.channels[field_id].send(opcode, argument))
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    # Function to send the same command to many nodes at once (all of them by default)
+    def broadcast(self, opcode, argument=0.0, field_ids=None, callback=None):
+        if field_ids is None:
+            field_ids = list(self.channels)
+        return [self.send(field_id, opcode, argument, callback) for field_id in field_ids]
+
+    async def close(self):
+        for channel in self.channels.values():
+            await channel.close()
+
+    # Same fan-out from a coroutine: CommandResult or CommandError for each node
+    async def fan_out(self, opcode, argument=0.0, field_ids=None):
+        if field_ids is None:
+            field_ids = list(self.channels)
+        return await asyncio.gather(*(self.channels[field_id].send(opcode, argument) for field_id in field_ids),
+                                    return_exceptions=True)
@@ -0,0 +1,340 @@
+import logging
+import queue
+import time
+from collections import namedtuple
+
+import alerting
+import control
+import fields
+import ingestion
+import ingestion_workers
+import metrics
+import protocol
+import pumps
+import recording
+import streaming
+import trends
+import tsdb
+
+# Headless core of the dashboard: the field states, the ingestion of the
+# node data (server, worker processes or replay of a recorded session),
+# the alert rules, the trends, the pump automation and the commands, the
+# history, the metrics endpoint and the local stream of the samples and
+# alerts (streaming.py). It never imports tkinter: the Tk window
+# (gui.py) and the daemon mode of app.py are front ends that call tick() on
+# their own loop and show or log what changed.
+
+# Alert rules: margin to leave an alert and minimum duration of a breach (s)
+ALERT_HYSTERESIS = 1.0
+ALERT_MIN_DURATION = 0.0
+
+# Automatic watering: the pump starts when the soil humidity goes below PUMP_START
+# and stops above PUMP_STOP, with minimum durations and a daily water budget
+PUMP_SENSOR = protocol.SOIL_HUMIDITY
+PUMP_START = 30
+PUMP_STOP = 40
+PUMP_MIN_ON = 30  # Seconds
+PUMP_MIN_OFF = 60  # Seconds
+PUMP_FLOW = 2.0  # Liters per minute
+PUMP_DAILY_BUDGET = 120  # Liters per day
+
+# Automatically add the fields that connect without being in fields.json
+DISCOVER_FIELDS = True
+
+# What changed since the previous tick: discovered is the FieldConfig of the new fields,
+# samples the latest sample of each known field (already applied to its FieldState),
+# alerts the alerting.AlertEvents, pump_events (field id, on, value, reason) of the
+# automation and commands the finished command futures (see control.ControlHub.send)
+TickChanges = namedtuple("TickChanges", ["discovered", "samples", "alerts", "pump_events", "commands"])
+
+logger = logging.getLogger(__name__)
+
+
+class MonitoringCore:
+    def __init__(self, fields_file=fields.DEFAULT_FILE, port=ingestion.DEFAULT_PORT,
+                 history_directory=tsdb.DEFAULT_DIRECTORY, metrics_port=metrics.METRICS_PORT, record=None, replay=None,
+                 replay_speed=1.0, workers=0, log_level="INFO", stream_port=streaming.STREAM_PORT):
+        if workers and (record is not None or replay is not None):
+            raise ValueError("Sessions can only be recorded or replayed without ingestion workers")
+
+        # State of each field (values, pump, panel widgets) by id
+        self.states = {}  # field id -> fields.FieldState
+        self.alerts = alerting.ThresholdEngine()  # Threshold rules of every field, evaluated once per tick
+        self.trends = trends.TrendBuffer()  # Recent values of every field, for the strips under the gauges
+        self.heartbeat_received = True
+        self.sample_queue = queue.SimpleQueue()  # (perf_counter at reception, sample) from the ingestion thread
+        self.command_results = queue.SimpleQueue()  # Finished commands, from the event loop thread
+        self.node_events = queue.SimpleQueue()  # Node connections, from the ingestion thread
+        self.pump_events = queue.SimpleQueue()  # Pumps started and stopped by the automation, from the event loop thread
+        self.registry = fields.FieldRegistry(fields.load_fields(fields_file), discover=DISCOVER_FIELDS)
+
+        # Instrumentation (seconds), served with the ingestion counters by the metrics endpoint
+        self.queue_wait = metrics.Histogram()  # Received -> taken by the tick
+        self.render_time = metrics.Histogram()  # Tick that applied samples, drawing included with the window
+        self.latency = metrics.Histogram()  # Sample taken on the node -> shown
+        self.samples_applied = 0
+        self.samples_coalesced = 0  # Replaced by a newer sample of the same field before being shown
+        self.samples_unknown = 0  # Dropped, field unknown and discovery disabled
+
+        # Asyncio loop of the sockets (ingestion and commands), next to the loop of the front end
+        self.background = ingestion.BackgroundLoop().start()
+        # Local stream of the samples and alerts, started before the ingestion
+        self.stream = streaming.StreamServer(port=stream_port)
+        self.background.submit(self.stream.start()).result()
+        self.control = control.ControlHub(self.background)
+
+        # Pump automation, on its own tick of the asyncio loop (never during a replay)
+        self.automation = replay is None
+        self.pumps = pumps.PumpController(pumps.PumpEngine(), self.control, on_event=self.queue_pump_event,
+                                          on_command=self.command_results.put)
+        for config in self.registry:
+            self.register_field(config)
+
+        # Sensor history, written to disk by its own thread (none if history_directory is None,
+        # written by the ingestion processes if there are any)
+        self.history = None
+        if history_directory is not None and not workers:
+            self.history = tsdb.TimeSeriesStore(history_directory).start()
+
+        # Start the ingestion server, every field node connects to the same port; its raw
+        # reads can be recorded to a session file, or a recorded session replayed into it
+        self.workers = workers
+        self.recorder = None if record is None else recording.SessionRecorder(record)
+        self.replayer = None
+        if workers:
+            # Decoding in separate processes, the latest samples are read from shared memory
+            self.ingestion = ingestion_workers.IngestionWorkers(workers, port=port, history_directory=history_directory,
+                                                                log_level=log_level).start()
+            self.node_events = self.ingestion.node_events
+            self.pumps.table = self.ingestion.table
+        else:
+            self.ingestion = ingestion.IngestionServer(self.queue_sample, port=port, on_node_status=self.node_events.put,
+                                                       recorder=self.recorder, on_late=self.queue_late_sample)
+            if replay is None:
+                self.ingestion.start_in_thread(self.background)
+            else:
+                self.replayer = recording.SessionReplayer(replay, self.ingestion, replay_speed).start()
+        self.metrics_server = metrics.MetricsServer(self.metrics_snapshot, port=metrics_port)
+        self.background.submit(self.metrics_server.start()).result()
+        if self.automation:
+            self.pumps.start(self.background)
+
+    # Function to add a field: state, alert rules, control channel and pump rule
+    def register_field(self, config):
+        state = self.states[config.field_id] = fields.FieldState(config)
+        for sensor in range(len(protocol.SENSORS)):
+            self.alerts.set_rule(config.field_id, sensor, upper=100, hysteresis=ALERT_HYSTERESIS, min_duration=ALERT_MIN_DURATION)
+        if config.address is not None:
+            self.control.add_node(config.field_id, config.address, config.control_port)
+        self.pumps.call(self.pumps.engine.set_rule, config.field_id, PUMP_SENSOR, PUMP_START, PUMP_STOP,
+                        PUMP_MIN_ON, PUMP_MIN_OFF, PUMP_FLOW, PUMP_DAILY_BUDGET)
+        return state
+
+    # Called from the ingestion thread: only queue the sample, the states are changed by the tick
+    def queue_sample(self, sample):
+        # Batched samples carry the time they were taken on the node
+        taken = sample.timestamp if sample.timestamp is not None else time.time()
+        if self.history is not None:
+            self.history.append_sample(sample, taken)
+        if self.automation:
+            self.pumps.engine.update(sample.field_id, sample.values, taken)  # Same thread as its tick
+        self.stream.publish_sample(sample)
+        self.sample_queue.put((time.perf_counter(), sample))
+
+    # Called from the ingestion thread with the backlog samples older than the samples already
+    # relayed for their field: only kept in the history, the live state has newer values
+    def queue_late_sample(self, sample):
+        if self.history is not None:
+            self.history.append_sample(sample, sample.timestamp)
+
+    # Called from the event loop thread by the pump automation
+    def queue_pump_event(self, field_id, on, value, reason):
+        self.pump_events.put((field_id, on, value, reason))
+
+    # Function to take everything that arrived since the previous tick and apply it to the states
+    def tick(self, now=None):
+        began = time.perf_counter()
+        discovered = self.discover_fields()
+        latest = self.take_samples(began)
+        samples = [sample for sample in latest.values() if self.apply_sample(sample)]
+        # Also every tick without data, for the minimum duration rules
+        alerts = self.alerts.evaluate(time.time() if now is None else now)
+        if self.stream.subscribers:
+            self.publish_alerts(alerts)
+        return TickChanges(discovered, samples, alerts, self.take_pump_events(), self.take_command_results())
+
+    # Function to record the tick latency of the samples once shown (drawn, or logged without window)
+    def record_tick(self, samples, began):
+        if samples:
+            shown = time.time()
+            for sample in samples:
+                if sample.timestamp is not None:
+                    self.latency.record(max(0.0, shown - sample.timestamp))
+            self.render_time.record(time.perf_counter() - began)
+
+    # Function to add the fields that connected without being in the field file
+    def discover_fields(self):
+        discovered = []
+        while True:
+            try:
+                node = self.node_events.get_nowait()
+            except queue.Empty:
+                break
+            config = self.registry.discover(node.field_id, node.address)
+            if config is not None:
+                self.register_field(config)
+                discovered.append(config)
+        return discovered
+
+    # Function to drain the samples, keeping the latest one of each field
+    def take_samples(self, began):
+        latest = {}
+        drained = 0
+        if self.workers:
+            # Latest sample of the fields written by the ingestion workers since the last tick,
+            # the only ones streamed in this mode (the workers decode in other processes)
+            for sample, writes in self.ingestion.table.read_changed():
+                latest[sample.field_id] = sample
+                self.stream.publish_sample(sample)
+                drained += writes
+        else:
+            try:
+                while True:
+                    received, sample = self.sample_queue.get_nowait()
+                    self.queue_wait.record(max(0.0, began - received))
+                    latest[sample.field_id] = sample
+                    drained += 1
+            except queue.Empty:
+                pass
+        self.samples_coalesced += drained - len(latest)
+        return latest
+
+    # Function to store a sample in the state of its field, False if the field is unknown
+    def apply_sample(self, sample):
+        state = self.states.get(sample.field_id)
+        if state is None:
+            self.samples_unknown += 1
+            return False  # Unknown field and discovery disabled
+        self.samples_applied += 1
+        state.update(sample.values, sample.uptime)
+        if sample.heartbeat is not None:
+            self.heartbeat_received = sample.heartbeat
+        self.alerts.update(state.field_id, state.values)
+        self.trends.add(state.field_id, state.values)
+        return True
+
+    # Function to take the pumps started and stopped by the automation
+    def take_pump_events(self):
+        events = []
+        while True:
+            try:
+                field_id, on, value, reason = self.pump_events.get_nowait()
+            except queue.Empty:
+                break
+            self.states[field_id].pump_active = on
+            events.append((field_id, on, value, reason))
+        return events
+
+    def take_command_results(self):
+        futures = []
+        while True:
+            try:
+                futures.append(self.command_results.get_nowait())
+            except queue.Empty:
+                break
+        return futures
+
+    # Function to format the message of an alert raised at (row, sensor) of the alert engine
+    def alert_message(self, row, sensor):
+        field_id = self.alerts.field_ids[row]
+        value = round(float(self.alerts.values[row, sensor]), 2)
+        upper = self.alerts.upper[row, sensor]
+        sensor_name = protocol.SENSORS[sensor]
+        uptime = self.states[field_id].uptime
+        uptime = "" if uptime is None else protocol.format_uptime(uptime)
+        if value > upper:
+            return f"{sensor_name} of Field {field_id} exceeds the limit : {value} > {upper:g}, should be investigated. (at {uptime})"
+        return f"{sensor_name} of Field {field_id} is below the limit : {value} < {self.alerts.lower[row, sensor]:g}, should be investigated. (at {uptime})"
+
+    # Function to publish the alerts raised and cleared by a tick on the stream
+    def publish_alerts(self, alerts):
+        events = []
+        for row, sensor in zip(*alerts.raised):
+            events.append((int(self.alerts.field_ids[row]), int(sensor), "raised",
+                           round(float(self.alerts.values[row, sensor]), 2), self.alert_message(row, sensor)))
+        for row, sensor in zip(*alerts.cleared):
+            events.append((int(self.alerts.field_ids[row]), int(sensor), "cleared",
+                           round(float(self.alerts.values[row, sensor]), 2), None))
+        self.stream.publish_alerts(events)
+
+    # Function to send a command through the persistent channel of the field, the result
+    # comes back with the commands of a tick
+    def send_command(self, field_id, opcode, argument=0.0):
+        self.control.send(field_id, opcode, argument, callback=self.command_results.put)
+
+    # Function to enable or disable the automatic control of the pump of a field
+    def set_automatic(self, field_id, enabled):
+        self.states[field_id].automatic = enabled
+        self.pumps.call(self.pumps.engine.set_enabled, field_id, enabled)
+
+    # Function to tell the automation a pump was turned off by hand
+    def pump_turned_off(self, field_id):
+        state = self.states[field_id]
+        state.led_on = False
+        state.pump_active = False
+        self.pumps.call(self.pumps.engine.turned_off, field_id, time.time())
+
+    # Function to turn off the pumps of every field with one fan-out command
+    # (the automation is disabled, so it does not start them again)
+    def turn_off_all_pumps(self):
+        self.control.broadcast(protocol.CMD_LED_OFF, callback=self.command_results.put)
+        for state in self.states.values():
+            self.set_automatic(state.field_id, False)
+            state.led_on = False
+            state.pump_active = False
+
+    # Function to collect the histograms and counters of the pipeline, called by the metrics endpoint
+    def metrics_snapshot(self):
+        ingestion = self.ingestion
+        return {
+            "histograms": {
+                "parse_time": ingestion.parse_time.snapshot(),
+                "transit": ingestion.transit.snapshot(),
+                "queue_wait": self.queue_wait.snapshot(),
+                "render_time": self.render_time.snapshot(),
+                "latency": self.latency.snapshot(),
+            },
+            "counters": {
+                "nodes_connected": ingestion.nodes_connected,
+                "samples_received": ingestion.samples,
+                "bytes_received": ingestion.bytes_received,
+                "invalid_frames": ingestion.invalid_frames,
+                "samples_duplicate": ingestion.duplicates,
+                "samples_late": ingestion.late,
+                "samples_applied": self.samples_applied,
+                "samples_coalesced": self.samples_coalesced,
+                "samples_unknown": self.samples_unknown,
+                "queue_depth": self.sample_queue.qsize(),
+                "command_failures": sum(channel.failures for channel in list(self.control.channels.values())),
+                "pump_commands": self.pumps.commands,
+                "pumps_running": int(self.pumps.engine.on.sum()),
+                "stream_subscribers": len(self.stream.subscribers),
+                "stream_dropped": self.stream.dropped,
+            },
+        }
+
+    # Function to stop the ingestion and write the history, once the front end is closed
+    def close(self):
+        self.pumps.stop()
+        self.background.submit(self.metrics_server.stop()).result()
+        self.background.submit(self.stream.stop()).result()
+        if self.replayer is not None:
+            self.replayer.stop()
+        if self.workers:
+            self.ingestion.stop()
+        else:
+            self.ingestion.stop_thread()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.history is not None:
+            self.history.stop()
@@ -0,0 +1,87 @@
+import logging
+import math
+
+import gpio_backend
+import protocol
+import scheduler
+
+# Timing-sensitive logic of the field nodes, shared by rasp_sender.py and
+# rasp_receiver.py. `pi` is any GPIO backend (see gpio_backend.py) and
+# `timers` the scheduler.TimerScheduler of the node, so these classes run
+# the same on a Raspberry Pi, on the in-memory GPIO in real time, or in
+# simulated time in the benchmarks. Heartbeat detection is
+# heartbeat.HeartbeatMonitor.
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_RETRY = 0.05  # Seconds before retrying a heartbeat that found an IR data frame on the LED
+
+
+# IR heartbeat: a pulse on the transmitter every `period` seconds
+class HeartbeatTransmitter:
+    def __init__(self, pi, gpio, timers, period=2.0, pulse=0.1, busy=None):
+        self.pi = pi
+        self.gpio = gpio
+        self.timers = timers
+        self.period = period
+        self.pulse = pulse  # Seconds the IR transmitter stays on
+        self.busy = busy  # busy() is True while an IR data frame is being sent (ir_link.IrTransmitter.busy)
+        self.timer = None
+        self.sent = 0
+        self.delayed = 0  # Heartbeats sent late, after a data frame
+        pi.set_mode(gpio, gpio_backend.OUTPUT)
+
+    # Function to send the heartbeats on a fixed period, the first one now
+    def start(self):
+        self.timer = self.timers.every(self.period, self.send, delay=0)
+        return self
+
+    def stop(self):
+        if self.timer is not None:
+            self.timers.cancel(self.timer)
+            self.timer = None
+
+    # Function to send one heartbeat, switched off by a timer
+    def send(self):
+        if self.busy is not None and self.busy():
+            # The frame lasts a fraction of a second, the heartbeat follows it
+            self.delayed += 1
+            self.timers.schedule(HEARTBEAT_RETRY, self.send)
+            return
+        self.pi.write(self.gpio, 1)
+        self.timers.schedule(self.pulse, self.pi.write, self.gpio, 0)
+        self.sent += 1
+
+
+# LED (pump) driven by the commands of the computer
+class LedController:
+    def __init__(self, pi, gpio, timers, log=logger.info):
+        self.log = log
+        pi.set_mode(gpio, gpio_backend.OUTPUT)
+        pi.write(gpio, 0)  # Make sure the LED is off initially
+        self.led = scheduler.Actuator("LED", lambda level: pi.write(gpio, level), timers, log=log)
+
+    @property
+    def active(self):
+        return self.led.active
+
+    # Function to execute an LED control command, returns the protocol.ACK_* status
+    def handle_command(self, opcode, argument):
+        self.log(f"Received command: {opcode} {argument}")
+
+        # Check if the command is to turn on the LED with a duration
+        if opcode == protocol.CMD_LED_ON:
+            duration = argument
+            # NaN and infinity fit in the float argument of a command, the scheduler refuses them
+            if not (math.isfinite(duration) and duration > 0):
+                self.log("Invalid duration value received.")
+                return protocol.ACK_ERROR
+            # Replaces the switch-off timer of any previous command
+            self.led.turn_on(duration)
+            return protocol.ACK_OK
+        elif opcode == protocol.CMD_LED_OFF:
+            self.log("Turning off LED immediately.")
+            self.led.turn_off()
+            return protocol.ACK_OK
+        self.log("Invalid command received.")
+        return protocol.ACK_UNKNOWN_COMMAND
@@ -0,0 +1,112 @@
+import json
+import os
+from collections import namedtuple
+
+import node_control
+import protocol
+
+# Field list of the dashboard. The known fields are read from a JSON file:
+#
+#   {"fields": [{"id": 1, "name": "Field 1", "address": "192.168.137.21"}, ...]}
+#
+# ("control_port" is optional). A node that connects with a field id that
+# is not in the file is added at runtime with the address it connected
+# from, so new fields show up without editing the file.
+#
+# FieldState holds everything the dashboard keeps about one field, indexed
+# by sensor id (the order of protocol.SENSORS), so applying a sample does
+# no string formatting or dictionary lookups by name.
+
+DEFAULT_FILE = "fields.json"
+
+FieldConfig = namedtuple("FieldConfig", ["field_id", "name", "address", "control_port"])
+
+
+# Function to read the field list, empty if the file does not exist
+def load_fields(path=DEFAULT_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        document = json.load(f)
+    configs = []
+    for entry in document.get("fields", []):
+        field_id = int(entry["id"])
+        configs.append(FieldConfig(field_id, entry.get("name", f"Field {field_id}"), entry.get("address"),
+                                   int(entry.get("control_port", node_control.CONTROL_PORT))))
+    return configs
+
+
+def save_fields(path, configs):
+    document = {"fields": [{"id": config.field_id, "name": config.name, "address": config.address,
+                            "control_port": config.control_port} for config in configs]}
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+
+class FieldRegistry:
+    def __init__(self, configs=(), discover=True):
+        self.fields = {}  # field id -> FieldConfig
+        self.discover_unknown = discover  # Accept fields missing from the file
+        for config in configs:
+            self.add(config)
+
+    def __contains__(self, field_id):
+        return field_id in self.fields
+
+    def __iter__(self):
+        return iter(self.fields.values())
+
+    def __len__(self):
+        return len(self.fields)
+
+    def get(self, field_id):
+        return self.fields.get(field_id)
+
+    def add(self, config):
+        self.fields[config.field_id] = config
+        return config
+
+    # Function to register a field seen on the network, returns its FieldConfig or None
+    # if it is already known or discovery is disabled
+    def discover(self, field_id, address):
+        if field_id in self.fields or not self.discover_unknown:
+            return None
+        host = address[0] if isinstance(address, tuple) else address
+        return self.add(FieldConfig(field_id, f"Field {field_id}", host, node_control.CONTROL_PORT))
+
+
+# Dashboard state of one field. The widgets of the full panel are None
+# while the panel is closed.
+class FieldState:
+    __slots__ = ("field_id", "name", "title", "values", "uptime", "led_on", "pump_active", "automatic", "panel",
+                 "gauges", "trends", "sliders", "pump_label", "pump_time_label", "latency_label", "pump_switch", "auto_switch")
+
+    def __init__(self, config):
+        self.field_id = config.field_id
+        self.name = config.name
+        self.title = f"Monitoring Field {config.field_id}"  # Formatted once, for the panel and the messages
+        self.values = [0.0] * len(protocol.SENSORS)  # Last value of each sensor, rounded to 2 decimals
+        self.uptime = None  # Seconds since the node started, as last reported
+        self.led_on = False  # Pump switched on from the dashboard
+        self.pump_active = False  # Pump running under automatic control (pumps.PumpEngine)
+        self.automatic = True  # Automatic control of the pump enabled
+        self.forget_panel()
+
+    # Function to drop the widget references once the panel is destroyed
+    def forget_panel(self):
+        self.panel = None
+        self.gauges = None  # Gauge of each sensor
+        self.trends = None  # Trend strip under each gauge (gui.TrendStrip)
+        self.sliders = None  # Upper limit slider of each sensor
+        self.pump_label = None
+        self.pump_time_label = None
+        self.latency_label = None
+        self.pump_switch = None
+        self.auto_switch = None
+
+    # Function to store the values of a sample, in place
+    def update(self, values, uptime):
+        state_values = self.values
+        for sensor, value in enumerate(values):
+            state_values[sensor] = round(value, 2)
+        self.uptime = uptime
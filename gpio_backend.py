@@ -0,0 +1,185 @@
+import threading
+import time
+
+import gpio_sim
+from gpio_sim import EITHER_EDGE, FALLING_EDGE, INPUT, OUTPUT, RISING_EDGE, TIMEOUT, Pulse
+from heartbeat import tick_diff
+
+# GPIO backends of the field nodes. The node logic only uses a small part
+# of the pigpio.pi() interface: set_mode, read, write, callback,
+# set_watchdog, get_current_tick and stop, plus the waveforms of the IR
+# data link (wave_add_generic, wave_create, wave_delete, wave_chain,
+# wave_tx_busy). Three backends provide it:
+#
+#   "pigpio"  the pigpio daemon of the Raspberry Pi (pigpio imported only here)
+#   "fake"    in-memory GPIO whose time follows the real clock (RealtimePi)
+#   "replay"  in-memory GPIO replaying the edges of a recorded trace (ReplayPi)
+#
+# gpio_sim.SimulatedPi is the same in-memory GPIO with a simulated clock,
+# for benchmarks that move the time themselves.
+#
+# A trace is a text file with one edge per line: microseconds since the
+# first edge, GPIO and level. TraceRecorder writes one from any backend.
+
+BACKENDS = ("pigpio", "fake", "replay")
+REALTIME_STEP = 0.005  # Seconds between two clock updates of the in-memory backends
+
+
+class GpioError(Exception):
+    pass
+
+
+# In-memory GPIO whose simulated time follows the monotonic clock (scaled by
+# `speed`) once started: edges get the tick of the moment they are written,
+# and a thread moves the time forward between edges so the watchdogs fire.
+# Not started, it keeps the simulated time of gpio_sim.SimulatedPi.
+class RealtimePi(gpio_sim.SimulatedPi):
+    def __init__(self, speed=1.0):
+        super().__init__()
+        self.speed = speed
+        self.origin = None
+        self.lock = threading.RLock()  # Writes come from several node threads
+        self.running = False
+        self.thread = None
+
+    # Function to bring the simulated time to the current time
+    def sync(self):
+        if self.running:
+            with self.lock:
+                self.advance_to(max(self.now, int((time.monotonic() - self.origin) * self.speed * 1e6)))
+
+    def get_current_tick(self):
+        self.sync()
+        return super().get_current_tick()
+
+    def write(self, gpio, level):
+        with self.lock:
+            self.sync()
+            super().write(gpio, level)
+
+    def advance_to(self, end):
+        with self.lock:
+            super().advance_to(end)
+
+    def wave_chain(self, data):
+        with self.lock:
+            self.sync()
+            return super().wave_chain(data)
+
+    def wave_tx_busy(self):
+        with self.lock:
+            self.sync()
+            return super().wave_tx_busy()
+
+    def start(self):
+        self.origin = time.monotonic() - self.now / 1e6 / self.speed
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while self.running:
+            time.sleep(REALTIME_STEP)
+            self.sync()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+        super().stop()
+
+
+# In-memory GPIO that plays the edges of a trace as the time moves forward
+class ReplayPi(RealtimePi):
+    def __init__(self, events, speed=1.0):
+        super().__init__(speed)
+        self.events = events  # [(microseconds, gpio, level)] sorted by time
+        self.position = 0
+
+    @property
+    def finished(self):
+        return self.position >= len(self.events)
+
+    def advance_to(self, end):
+        with self.lock:
+            while self.position < len(self.events) and self.events[self.position][0] <= end:
+                when, gpio, level = self.events[self.position]
+                self.position += 1
+                super().advance_to(max(self.now, when))
+                gpio_sim.SimulatedPi.write(self, gpio, level)
+            super().advance_to(end)
+
+    # Function to play the rest of the trace at once (simulated time, not started)
+    def replay(self):
+        if self.events:
+            self.advance_to(self.events[-1][0])
+        return self.position
+
+
+# Records the edges of some GPIOs of a backend, for a later replay
+class TraceRecorder:
+    def __init__(self, pi, gpios):
+        self.events = []
+        self.elapsed = 0  # Microseconds of the last edge since the first one, unwrapped
+        self.last_tick = None
+        self.callbacks = [pi.callback(gpio, EITHER_EDGE, self.on_edge) for gpio in gpios]
+
+    def on_edge(self, gpio, level, tick):
+        if level == TIMEOUT:
+            return
+        if self.last_tick is not None:
+            self.elapsed += tick_diff(self.last_tick, tick)
+        self.last_tick = tick
+        self.events.append((self.elapsed, gpio, level))
+
+    def cancel(self):
+        for callback in self.callbacks:
+            callback.cancel()
+
+    def save(self, path):
+        save_trace(path, self.events)
+
+
+def save_trace(path, events):
+    with open(path, "w") as f:
+        f.write("# microseconds gpio level\n")
+        for when, gpio, level in events:
+            f.write(f"{when} {gpio} {level}\n")
+
+
+def load_trace(path):
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            when, gpio, level = line.split()
+            events.append((int(when), int(gpio), int(level)))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+# Function to open a GPIO backend by name, raises GpioError when it is not available
+def open_backend(name="pigpio", trace=None, speed=1.0):
+    if name == "pigpio":
+        try:
+            import pigpio
+        except ImportError:
+            raise GpioError("pigpio is not installed.")
+        pi = pigpio.pi()
+        if not pi.connected:
+            raise GpioError("Failed to connect to pigpio daemon.")
+        return pi
+    if name == "fake":
+        return RealtimePi(speed).start()
+    if name == "replay":
+        if trace is None:
+            raise GpioError("The replay backend needs a trace file.")
+        try:
+            return ReplayPi(load_trace(trace), speed).start()
+        except (OSError, ValueError) as e:
+            raise GpioError(f"Cannot load trace {trace}: {e}")
+    raise GpioError(f"Unknown GPIO backend {name!r}, expected one of {', '.join(BACKENDS)}.")
@@ -0,0 +1,188 @@
+# Simulated pigpio.pi() for running the node logic off-device. Time only
+# moves when advance() is called, edges are delivered synchronously to the
+# registered callbacks with the simulated tick, and watchdogs fire like the
+# pigpio ones (level 2, every timeout without edge on the GPIO). Waveforms
+# (wave_add_generic, wave_create, wave_chain) are played on the simulated
+# clock too: their edges are written at the tick of each pulse.
+
+from collections import deque, namedtuple
+
+INPUT = 0
+OUTPUT = 1
+
+RISING_EDGE = 0
+FALLING_EDGE = 1
+EITHER_EDGE = 2
+TIMEOUT = 2
+
+WAVE_MAX_IDS = 250  # Wave ids of pigpio, a chain byte is a wave id below it
+
+# Pulse of a waveform, like pigpio.pulse: GPIO mask switched on, mask switched off, microseconds before the next one
+Pulse = namedtuple("Pulse", ["gpio_on", "gpio_off", "delay"])
+
+
+class SimulatedCallback:
+    def __init__(self, pi, gpio, edge, func):
+        self.pi = pi
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+
+    def cancel(self):
+        if self in self.pi.callbacks:
+            self.pi.callbacks.remove(self)
+
+
+class SimulatedPi:
+    connected = True
+
+    def __init__(self):
+        self.now = 0  # Simulated time in microseconds
+        self.levels = {}
+        self.modes = {}
+        self.callbacks = []
+        self.watchdogs = {}  # gpio -> [timeout in us, tick of the next timeout]
+        self.waves = {}  # wave id -> [Pulse]
+        self.new_wave = []  # Pulses added since the last wave_create
+        self.wave_events = deque()  # (time, gpio mask on, gpio mask off) of the waveform being sent
+
+    def get_current_tick(self):
+        return self.now & 0xFFFFFFFF
+
+    def set_mode(self, gpio, mode):
+        self.modes[gpio] = mode
+
+    def read(self, gpio):
+        return self.levels.get(gpio, 0)
+
+    # Function to change the level of a GPIO (output or simulated input signal)
+    def write(self, gpio, level):
+        level = 1 if level else 0
+        if self.levels.get(gpio, 0) == level:
+            return
+        self.levels[gpio] = level
+        watchdog = self.watchdogs.get(gpio)
+        if watchdog is not None:
+            watchdog[1] = self.now + watchdog[0]
+        self.notify(gpio, level)
+
+    def notify(self, gpio, level):
+        tick = SimulatedPi.get_current_tick(self)  # Time of the edge, not synced again by the subclasses
+        for callback in list(self.callbacks):
+            if callback.gpio != gpio:
+                continue
+            if level == TIMEOUT or callback.edge == EITHER_EDGE or callback.edge == (RISING_EDGE if level else FALLING_EDGE):
+                callback.func(gpio, level, tick)
+
+    def callback(self, gpio, edge=RISING_EDGE, func=None):
+        callback = SimulatedCallback(self, gpio, edge, func)
+        self.callbacks.append(callback)
+        return callback
+
+    def set_watchdog(self, gpio, timeout_ms):
+        if timeout_ms:
+            self.watchdogs[gpio] = [timeout_ms * 1000, self.now + timeout_ms * 1000]
+        else:
+            self.watchdogs.pop(gpio, None)
+
+    # Function to move the simulated time forward, firing the watchdogs on the way
+    def advance(self, seconds):
+        self.advance_to(self.now + int(seconds * 1e6))
+
+    # Function to move the simulated time to `end` (microseconds), playing the
+    # waveform and firing the watchdogs on the way
+    def advance_to(self, end):
+        while True:
+            due = [(watchdog[1], gpio) for gpio, watchdog in self.watchdogs.items() if watchdog[1] <= end]
+            if self.wave_events and self.wave_events[0][0] <= end and (not due or self.wave_events[0][0] <= min(due)[0]):
+                when, gpio_on, gpio_off = self.wave_events.popleft()
+                self.now = when
+                self.switch(gpio_on, 1)
+                self.switch(gpio_off, 0)
+                continue
+            if not due:
+                break
+            when, gpio = min(due)
+            self.now = when
+            self.watchdogs[gpio][1] = when + self.watchdogs[gpio][0]
+            self.notify(gpio, TIMEOUT)
+        self.now = end
+
+    # Function to send a pulse of `width` seconds on a GPIO
+    def pulse(self, gpio, width):
+        self.write(gpio, 1)
+        self.advance(width)
+        self.write(gpio, 0)
+
+    def switch(self, mask, level):
+        gpio = 0
+        while mask:
+            if mask & 1:
+                SimulatedPi.write(self, gpio, level)  # Not the locked write of the subclasses, already in advance_to
+            mask >>= 1
+            gpio += 1
+
+    def wave_clear(self):
+        self.waves.clear()
+        self.new_wave = []
+
+    def wave_add_generic(self, pulses):
+        self.new_wave.extend(Pulse(*pulse) for pulse in pulses)
+        return len(self.new_wave)
+
+    def wave_create(self):
+        wave_id = next(wave_id for wave_id in range(WAVE_MAX_IDS) if wave_id not in self.waves)
+        self.waves[wave_id] = self.new_wave
+        self.new_wave = []
+        return wave_id
+
+    def wave_delete(self, wave_id):
+        del self.waves[wave_id]
+
+    # Function to send the waves of a pigpio chain from now: wave ids, loops
+    # (255 0 ... 255 1 x y) and delays (255 2 x y)
+    def wave_chain(self, data):
+        pulses = self.chain_pulses(list(data))
+        when = self.now
+        self.wave_events.clear()
+        for pulse in pulses:
+            self.wave_events.append((when, pulse.gpio_on, pulse.gpio_off))
+            when += pulse.delay
+        return 0
+
+    def chain_pulses(self, data):
+        pulses = []
+        stack = []  # Start of the loops being read, in `pulses`
+        index = 0
+        while index < len(data):
+            byte = data[index]
+            if byte != 255:
+                pulses.extend(self.waves[byte])
+                index += 1
+                continue
+            command = data[index + 1]
+            if command == 0:
+                stack.append(len(pulses))
+                index += 2
+            elif command in (1, 2):
+                count = data[index + 2] + 256 * data[index + 3]
+                if command == 1:
+                    start = stack.pop()
+                    pulses.extend(pulses[start:] * max(0, count - 1))
+                else:
+                    pulses.append(Pulse(0, 0, count))
+                index += 4
+            else:
+                raise ValueError(f"Unsupported wave chain command 255 {command}")
+        return pulses
+
+    def wave_tx_busy(self):
+        return 1 if self.wave_events else 0
+
+    def wave_tx_stop(self):
+        self.wave_events.clear()
+
+    def stop(self):
+        self.callbacks.clear()
+        self.watchdogs.clear()
+        self.wave_events.clear()
@@ -0,0 +1,546 @@
+import tkinter as tk
+import time
+import math
+from collections import deque
+import protocol
+import alert_log
+import control
+import trends
+from core import PUMP_SENSOR
+
+# Tk window of the dashboard, on top of core.MonitoringCore which does all the
+# rest (ingestion, states, alerts, pumps); loaded by app.main only when a
+# window is opened. tk_tools is only imported when the first panel of a
+# field opens.
+
+# Maximum number of interface refreshes per second
+MAX_FPS = 10
+
+# Refresh of the trends under the gauges (ms), one point per trends.TREND_PERIOD seconds
+TREND_INTERVAL = 1000
+
+# View of the alert log: only the visible rows are drawn
+class AlertLogView(tk.Frame):
+    def __init__(self, parent, log, rows=10):
+        super().__init__(parent)
+        self.log = log
+        self.entries = []  # Entries matching the filter, oldest first
+        self.offset = 0  # Index of the first visible entry
+        self.follow = True  # Stay on the newest alerts until the user scrolls up
+        self.rendered_version = None
+
+        # Text filter
+        filter_frame = tk.Frame(self)
+        filter_frame.pack(fill="x")
+        tk.Label(filter_frame, text="Filter :", font=("Arial", 10)).pack(side="left")
+        self.filter_text = tk.StringVar()
+        self.filter_text.trace_add("write", lambda *args: self.refresh(force=True))
+        tk.Entry(filter_frame, textvariable=self.filter_text).pack(side="left", fill="x", expand=True)
+
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.scroll)
+        self.scrollbar.pack(side="right", fill="y")
+
+        rows_frame = tk.Frame(self)
+        rows_frame.pack(side="left", fill="both", expand=True)
+        self.labels = []
+        for _ in range(rows):
+            label = tk.Label(rows_frame, text="", font=("Arial", 10), fg="red", anchor="w", justify="left", width=50, height=2, wraplength=380)
+            label.pack(anchor="w", pady=2)
+            label.bind("<MouseWheel>", self.on_mousewheel)
+            self.labels.append(label)
+
+    # Function to redraw the rows if the log or the filter changed
+    def refresh(self, force=False):
+        if not force and self.log.version == self.rendered_version:
+            return
+        self.rendered_version = self.log.version
+        self.entries = self.log.filtered(self.filter_text.get())
+        max_offset = max(0, len(self.entries) - len(self.labels))
+        self.offset = max_offset if self.follow else min(self.offset, max_offset)
+        self.draw()
+
+    def draw(self):
+        for i, label in enumerate(self.labels):
+            index = self.offset + i
+            text = self.entries[index].text() if index < len(self.entries) else ""
+            if label.cget("text") != text:
+                label.config(text=text)
+        total = len(self.entries)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(self.labels)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # Scrollbar command: ("moveto", fraction) or ("scroll", amount, "units"/"pages")
+    def scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            offset = int(float(amount) * len(self.entries))
+        else:
+            step = len(self.labels) if unit == "pages" else 1
+            offset = self.offset + int(amount) * step
+        max_offset = max(0, len(self.entries) - len(self.labels))
+        self.offset = min(max(0, offset), max_offset)
+        self.follow = self.offset == max_offset
+        self.draw()
+
+    def on_mousewheel(self, event):
+        self.scroll("scroll", -1 if event.delta > 0 else 1, "units")
+
+# Overview: one tile per field, all drawn on a single Canvas. The items of
+# a tile are created once, then only their coordinates and colors change;
+# a click on a tile opens the full panel.
+class FieldOverview(tk.Frame):
+    TILE_WIDTH = 160
+    TILE_HEIGHT = 74
+    BAR_WIDTH = 100
+    SHORT_NAMES = ("Soil", "Water", "Temp", "Fert")
+
+    def __init__(self, parent, on_open, columns=4, rows=7):
+        super().__init__(parent)
+        self.on_open = on_open  # on_open(field_id) when a tile is clicked
+        self.columns = columns
+        self.tiles = {}  # field id -> (bar items with their top, pump item)
+        self.drawn = {}  # Canvas item -> last coordinates or color drawn
+
+        self.canvas = tk.Canvas(self, width=columns * self.TILE_WIDTH, height=rows * self.TILE_HEIGHT, bg="white", highlightthickness=0)
+        scrollbar = tk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.canvas.bind("<MouseWheel>", lambda event: self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units"))
+
+    def add_field(self, field_id, name):
+        index = len(self.tiles)
+        x = (index % self.columns) * self.TILE_WIDTH + 4
+        y = (index // self.columns) * self.TILE_HEIGHT + 4
+        tag = f"tile{field_id}"
+        canvas = self.canvas
+        canvas.create_rectangle(x, y, x + self.TILE_WIDTH - 8, y + self.TILE_HEIGHT - 8, fill="#f4f4f4", outline="gray", tags=tag)
+        canvas.create_text(x + 6, y + 3, text=name, anchor="nw", font=("Arial", 9, "bold"), tags=tag)
+        pump = canvas.create_oval(x + self.TILE_WIDTH - 24, y + 5, x + self.TILE_WIDTH - 16, y + 13, fill="red", outline="", tags=tag)
+        bars = []
+        left = x + 40
+        for sensor, short_name in enumerate(self.SHORT_NAMES):
+            top = y + 20 + sensor * 11
+            canvas.create_text(x + 6, top - 1, text=short_name, anchor="nw", font=("Arial", 7), tags=tag)
+            canvas.create_rectangle(left, top, left + self.BAR_WIDTH, top + 7, outline="lightgray", tags=tag)
+            bars.append((canvas.create_rectangle(left, top, left, top + 7, fill="green", outline="", tags=tag), left, top))
+        self.tiles[field_id] = (bars, pump)
+        canvas.tag_bind(tag, "<Button-1>", lambda event: self.on_open(field_id))
+        rows = index // self.columns + 1
+        canvas.configure(scrollregion=(0, 0, self.columns * self.TILE_WIDTH, rows * self.TILE_HEIGHT))
+
+    # Function to move the bars of a field, only the ones whose length changed
+    def update_field(self, field_id, values):
+        bars, _ = self.tiles[field_id]
+        for (bar, left, top), value in zip(bars, values):
+            right = left + round(min(100.0, max(0.0, value)) * self.BAR_WIDTH / 100)
+            if self.drawn.get(bar) != right:
+                self.canvas.coords(bar, left, top, right, top + 7)
+                self.drawn[bar] = right
+
+    def set_alert(self, field_id, sensor, active):
+        self.set_color(self.tiles[field_id][0][sensor][0], "red" if active else "green")
+
+    def set_pump(self, field_id, on):
+        self.set_color(self.tiles[field_id][1], "green" if on else "red")
+
+    def set_color(self, item, color):
+        if self.drawn.get(item) != color:
+            self.canvas.itemconfigure(item, fill=color)
+            self.drawn[item] = color
+
+# Recent trend of a sensor under its gauge, one pixel per point of trends.TrendBuffer.
+# A new point adds a single segment on the right and deletes the oldest one; the
+# strip scrolls by moving the visible area of the Canvas, the other segments do not move.
+class TrendStrip(tk.Canvas):
+    HEIGHT = 24
+
+    def __init__(self, parent, width=trends.TREND_WIDTH):
+        super().__init__(parent, width=width, height=self.HEIGHT, bg="white", highlightthickness=0, borderwidth=0)
+        self.width = width
+        self.segments = deque()  # Line item of each point (None for a gap), oldest first
+        self.x = 0  # Canvas x of the newest point, one pixel further for every point
+        self.last = math.nan
+
+    def y(self, value):
+        return 1 + (self.HEIGHT - 3) * (1 - min(100.0, max(0.0, value)) / 100)
+
+    # Function to draw the whole strip, when the panel opens
+    def draw(self, values):
+        for item in self.segments:
+            if item is not None:
+                self.delete(item)
+        self.segments.clear()
+        self.last = math.nan
+        for value in values.tolist():
+            self.add_point(value)
+        self.scroll()
+
+    # Function to append the newest point: one segment drawn, one deleted
+    def append(self, value):
+        self.add_point(float(value))
+        self.scroll()
+
+    def add_point(self, value):
+        self.x += 1
+        item = None
+        if not math.isnan(value) and not math.isnan(self.last):
+            item = self.create_line(self.x - 1, self.y(self.last), self.x, self.y(value), fill="blue")
+        self.segments.append(item)
+        if len(self.segments) > self.width:
+            oldest = self.segments.popleft()
+            if oldest is not None:
+                self.delete(oldest)
+        self.last = value
+
+    # Function to show the last `width` pixels
+    def scroll(self):
+        self.configure(scrollregion=(self.x - self.width + 1, 0, self.x + 1, self.HEIGHT))
+        self.xview_moveto(0)
+
+class MonitoringApp:
+    def __init__(self, root, core, max_fps=MAX_FPS):
+        self.root = root
+        self.core = core  # core.MonitoringCore, stopped by its owner once the window is closed
+        self.root.title("Interface de Surveillance")
+
+        self.root.resizable(False, False)  # Disable resizing
+        
+        self.states = core.states  # field id -> fields.FieldState, the widgets of its panel included
+        self.drawn = {}  # Last value drawn by each widget
+        self.frame_interval = max(1, int(1000 / max_fps))
+
+        # Overview of the fields and communication type, the full panels
+        # are only created when a field is opened
+        self.overview = FieldOverview(self.root, self.open_field)
+        self.overview.grid(row=0, column=0, rowspan=2, padx=20, pady=20, sticky="n")
+        self.add_communication_line(0, 1)
+        for state in self.states.values():
+            self.overview.add_field(state.field_id, state.name)
+
+        self.root.after(self.frame_interval, self.process_samples)
+        self.root.after(TREND_INTERVAL, self.update_trends)
+
+    # Function to open the full panel of a field in its own window, built on first use
+    def open_field(self, field_id):
+        state = self.states[field_id]
+        if state.panel is not None:
+            state.panel.lift()
+            return
+        state.panel = tk.Toplevel(self.root)
+        state.panel.title(f"Monitoring {state.name}")
+        state.panel.resizable(False, False)
+        state.panel.protocol("WM_DELETE_WINDOW", lambda: self.close_field(field_id))
+        self.create_monitoring_section(state.panel, state, 0, 0)
+        self.update_sensor_values(state)
+
+    # Function to close the panel of a field and forget its widgets
+    def close_field(self, field_id):
+        state = self.states[field_id]
+        for widget in (*state.gauges, state.pump_label, state.pump_time_label, state.latency_label, state.pump_switch,
+                       state.auto_switch):
+            self.drawn.pop(widget, None)
+        state.panel.destroy()
+        state.forget_panel()
+
+    def create_monitoring_section(self, parent, state, row, col):
+        frame = tk.LabelFrame(parent, text=state.title, padx=10, pady=10)
+        frame.grid(row=row, column=col, padx=20, pady=20, sticky="n")
+
+        # Add the gauges and the indicators
+        self.add_gauges_and_indicator(frame, state)
+
+    def add_gauges_and_indicator(self, frame, state):
+        # Create a sub-frame for the gauges
+        gauges_frame = tk.Frame(frame)
+        gauges_frame.grid(row=0, column=0, padx=10, pady=10)
+
+        # Add the gauges in a 2x2 grid, ordered by sensor id
+        state.gauges = [None] * len(protocol.SENSORS)
+        state.trends = [None] * len(protocol.SENSORS)
+        self.add_gauge(gauges_frame, state, protocol.SOIL_HUMIDITY, 0, 0)
+        self.add_gauge(gauges_frame, state, protocol.WATER_LEVEL, 0, 1)
+        self.add_gauge(gauges_frame, state, protocol.TEMPERATURE, 1, 0)
+        self.add_gauge(gauges_frame, state, protocol.FERTILIZER_LEVEL, 1, 1)
+
+        # Create a sub-frame for the pump indicator
+        indicator_frame = tk.Frame(frame)
+        indicator_frame.grid(row=0, column=1, padx=10, pady=10, sticky="n")
+
+        pump_label = tk.Label(indicator_frame, text="Pump: OFF", fg="red", font=("Arial", 12))
+        pump_label.pack(pady=5)
+
+        pump_time_label = tk.Label(indicator_frame, text="Time: 0s", font=("Arial", 10))
+        pump_time_label.pack(pady=5)
+
+        latency_label = tk.Label(indicator_frame, text="Latency: -", font=("Arial", 10))
+        latency_label.pack(pady=5)
+
+        # Register the indicators
+        state.pump_label = pump_label
+        state.pump_time_label = pump_time_label
+        state.latency_label = latency_label
+
+        # Add the customization section below
+        self.add_parameter_customization(frame, state)
+
+    def add_gauge(self, frame, state, sensor, row, col):
+        import tk_tools  # Only needed once a panel is opened
+
+        # Add a caption above the gauge
+        tk.Label(frame, text=protocol.SENSORS[sensor], font=("Arial", 10)).grid(row=row * 3, column=col, pady=5)
+
+        # Create a rotary gauge
+        gauge = tk_tools.RotaryScale(frame, max_value=100.0, unit="", size=100)
+        gauge.grid(row=row * 3 + 1, column=col, padx=20, pady=(10, 2))
+
+        # Recent trend below, drawn from the points already kept
+        strip = TrendStrip(frame, self.core.trends.width)
+        strip.grid(row=row * 3 + 2, column=col, padx=20, pady=(0, 10))
+        strip.draw(self.core.trends.series(state.field_id, sensor))
+
+        # Register the gauge for later updates
+        state.gauges[sensor] = gauge
+        state.trends[sensor] = strip
+
+    def add_parameter_customization(self, frame, state):
+        # Add a customization section
+        customization_frame = tk.Frame(frame, bg="lightgray", padx=10, pady=10)
+        customization_frame.grid(row=1, column=0, columnspan=2, pady=10)
+
+        # Title
+        tk.Label(customization_frame, text="Parameter personalisation for alerting", font=("Arial", 10, "bold"), bg="lightgray").grid(row=0, column=0, columnspan=4, pady=5)
+
+        # Sliders for the parameters
+        # Slider values are cached in the alert engine, refreshed only when a slider moves
+        field_id = state.field_id
+        alerts = self.core.alerts
+        row = alerts.row_for(field_id)
+        state.sliders = [None] * len(protocol.SENSORS)
+        slider_sensors = [protocol.WATER_LEVEL, protocol.TEMPERATURE, protocol.SOIL_HUMIDITY, protocol.FERTILIZER_LEVEL]
+        for i, sensor in enumerate(slider_sensors):
+            tk.Label(customization_frame, text=protocol.SENSORS[sensor], font=("Arial", 10), bg="lightgray").grid(row=1, column=i, padx=5)
+            slider = tk.Scale(customization_frame, from_=0, to=100, orient="vertical", bg="lightgray",
+                              command=lambda value, sensor=sensor: alerts.set_rule(field_id, sensor, upper=float(value)))
+            slider.set(float(alerts.upper[row, sensor]))  # Limit kept while the panel was closed
+
+            slider.grid(row=2, column=i, padx=5)
+            state.sliders[sensor] = slider
+
+        # Indicators for "Active pump"
+        tk.Label(customization_frame, text="Activate pump", font=("Arial", 10), bg="lightgray").grid(row=3, column=0, padx=5, columnspan=2)
+
+        def toggle_switch():
+            current_state = pump_switch.cget("text")
+            activation_time_value = activation_time.get()  # Get the value from the entry field
+
+            if current_state == "OFF":
+                try:
+                    duration = float(activation_time_value)
+                except ValueError:
+                    duration = math.nan
+                # float() also reads "nan" and "inf", the node refuses them
+                if not (math.isfinite(duration) and duration > 0):
+                    self.update_communication_line(f"Invalid time of activation for {state.title} : {activation_time_value!r}")
+                    return
+                pump_switch.config(text="ON", bg="green")
+                # Send command to turn on LED for the pump for the activation time
+                self.send_led_command(field_id, protocol.CMD_LED_ON, duration)
+                state.led_on = True
+            else:
+                pump_switch.config(text="OFF", bg="red")
+                # Send command to turn off the LED, also stops a pump started by the automation
+                self.send_led_command(field_id, protocol.CMD_LED_OFF)
+                self.core.pump_turned_off(field_id)
+            self.update_pump_indicator(state)
+
+
+        if state.led_on:
+            pump_switch = tk.Button(customization_frame, text="ON", bg="green", width=6, command=toggle_switch)
+        else:
+            pump_switch = tk.Button(customization_frame, text="OFF", bg="red", width=6, command=toggle_switch)
+        pump_switch.grid(row=4, column=0, padx=5, columnspan=2)
+        state.pump_switch = pump_switch
+
+        tk.Label(customization_frame, text="Time of activation", font=("Arial", 10), bg="lightgray").grid(row=3, column=2, padx=5, columnspan=2)
+        activation_time = tk.Entry(customization_frame, width=10)
+        activation_time.insert(0, "1")  # Default value inserted
+        activation_time.grid(row=4, column=2, padx=5, columnspan=2)
+        
+        self.activation_time = activation_time  # Store the reference to the entry field
+
+        # Automation of the pump of the field (PUMP_* rules of core.py)
+        tk.Label(customization_frame, text="Automatic pump", font=("Arial", 10), bg="lightgray").grid(row=5, column=0, padx=5, columnspan=2)
+
+        def toggle_automatic():
+            self.set_automatic(state, not state.automatic)
+
+        auto_switch = tk.Button(customization_frame, width=6, command=toggle_automatic)
+        auto_switch.grid(row=6, column=0, padx=5, columnspan=2)
+        state.auto_switch = auto_switch
+        self.set_automatic(state, state.automatic)
+
+    # Function to enable or disable the automatic control of the pump of a field
+    def set_automatic(self, state, enabled):
+        self.core.set_automatic(state.field_id, enabled)
+        self.show_automatic(state)
+
+    def show_automatic(self, state):
+        if state.auto_switch is not None:
+            state.auto_switch.config(text="ON" if state.automatic else "OFF", bg="green" if state.automatic else "red")
+
+
+    # Function to send a command through the persistent channel of the field, the result
+    # comes back with the commands of a core tick and is shown by the main loop tick
+    def send_led_command(self, field_id, opcode, argument=0.0):
+        self.core.send_command(field_id, opcode, argument)
+
+    # Function to turn off the pumps of every field, and show them off (the core also
+    # disables their automation)
+    def turn_off_all_pumps(self):
+        self.core.turn_off_all_pumps()
+        for state in self.states.values():
+            self.show_automatic(state)
+            self.update_pump_indicator(state)
+            if state.pump_switch is not None:
+                state.pump_switch.config(text="OFF", bg="red")
+
+    # Function to show the pumps started and stopped by the automation
+    def show_pump_events(self, events):
+        for field_id, on, value, reason in events:
+            self.update_pump_indicator(self.states[field_id])
+            self.update_communication_line(f"Pump of Field {field_id} {reason} : {protocol.SENSORS[PUMP_SENSOR]} {value:.2f}",
+                                           ("pump", field_id))
+
+    # Function to show the pump state in the overview and in the panel if it is open
+    def update_pump_indicator(self, state):
+        on = state.led_on or state.pump_active
+        self.overview.set_pump(state.field_id, on)
+        if state.pump_label is not None:
+            if on:
+                self.configure_if_changed(state.pump_label, text="Pump: ON", fg="green")
+            else:
+                self.configure_if_changed(state.pump_label, text="Pump: OFF", fg="red")
+
+    # Function to show the outcome of the finished commands
+    def show_command_results(self, futures):
+        for future in futures:
+            try:
+                result = future.result()
+            except control.CommandError as e:
+                self.update_communication_line(f"Command failed : {e}", ("command", e.field_id))
+                latency_label = self.states[e.field_id].latency_label
+                if latency_label is not None:
+                    self.configure_if_changed(latency_label, text="Latency: timeout", fg="red")
+                continue
+            except OSError as e:
+                self.update_communication_line(f"Command failed : {e}")
+                continue
+            latency_label = self.states[result.field_id].latency_label
+            if latency_label is not None:
+                channel = self.core.control.channels[result.field_id]
+                text = f"Latency: {result.latency * 1000:.1f} ms (avg {channel.average_latency * 1000:.1f})"
+                self.configure_if_changed(latency_label, text=text, fg="black")
+            if result.status != protocol.ACK_OK:
+                self.update_communication_line(f"Command {result.command_id} refused by Field {result.field_id} (status {result.status})")
+
+    def add_communication_line(self, row, col):
+        frame = tk.Frame(self.root, width=800, height=50)  # Fixed width of 400px for the communication line
+        frame.grid(row=row, column=col, padx=10, pady=1, sticky="n")
+
+        tk.Label(frame, text="Communication type/state", font=("Arial", 12, "bold"), anchor="center",width=50).pack()
+        tk.Canvas(frame, height=5, width=200, bg="blue").pack(pady=10)
+
+        # Command sent to every field at once
+        tk.Button(frame, text="Turn off all pumps", command=self.turn_off_all_pumps).pack(pady=5)
+
+        # Alert log: fixed number of rows drawn from a bounded log
+        self.alert_log = alert_log.AlertLog()
+        self.alert_view = AlertLogView(frame, self.alert_log)
+        self.alert_view.pack(fill="both", expand=True)
+
+         # Create another frame with the label "IR Comm: Established"
+        self.ir_comm_frame = tk.Frame(self.root, width=800, height=30)
+        self.ir_comm_frame.grid(row=row + 1, column=col, padx=10, pady=1, sticky="n")
+
+        self.ir_comm_label = tk.Label(self.ir_comm_frame, text="IR Comm : Established", font=("Arial", 12, "bold"), fg="green", anchor="center", width=50)
+        self.ir_comm_label.pack()
+        
+    def update_communication_line(self, message, key=None):
+        # Repeated alerts with the same key are merged into one row
+        self.alert_log.add(message if key is None else key, message)
+
+    # Function to redraw a widget only if one of its options changed since the last draw
+    def configure_if_changed(self, widget, **options):
+        if self.drawn.get(widget) != options:
+            widget.config(**options)
+            self.drawn[widget] = options
+
+    def update_sensor_values(self, state):
+        # Update the sensor values and the indicators of the field
+        for gauge, value in zip(state.gauges, state.values):
+            # Only move the gauges whose value changed
+            if self.drawn.get(gauge) != value:
+                gauge.set_value(value)
+                self.drawn[gauge] = value
+
+        # The pump state comes from the automation (pumps.py) or the button of the panel
+        self.update_pump_indicator(state)
+        # The uptime text is only formatted when it changed
+        if state.uptime is not None and self.drawn.get(state.pump_time_label) != state.uptime:
+            state.pump_time_label.config(text=f"Time: {protocol.format_uptime(state.uptime)}s")
+            self.drawn[state.pump_time_label] = state.uptime
+
+    # Main loop tick: take the latest sample of each field from the core and redraw once
+    def process_samples(self):
+        began = time.perf_counter()
+        changes = self.core.tick()
+        for config in changes.discovered:
+            self.overview.add_field(config.field_id, config.name)
+            self.update_communication_line(f"New field discovered : Field {config.field_id} ({config.address})")
+        for sample in changes.samples:
+            self.show_sample(self.states[sample.field_id])
+        self.show_alerts(changes.alerts)
+        self.show_pump_events(changes.pump_events)
+        self.show_command_results(changes.commands)
+        self.alert_view.refresh()
+
+        # Tk redraws the changed widgets when the tick returns, the render time is the work done here
+        self.core.record_tick(changes.samples, began)
+        self.root.after(self.frame_interval, self.process_samples)
+
+    # Trend tick: close the points of the period for every field, and append them to the
+    # strips of the open panels
+    def update_trends(self):
+        buffer = self.core.trends
+        added = buffer.advance(time.time())
+        if added:
+            for state in self.states.values():
+                if state.trends is None:
+                    continue
+                for sensor, strip in enumerate(state.trends):
+                    if added == 1:
+                        strip.append(buffer.series(state.field_id, sensor, 1)[0])
+                    else:
+                        strip.draw(buffer.series(state.field_id, sensor))
+        self.root.after(TREND_INTERVAL, self.update_trends)
+
+    # Function to log the new alerts and color the overview bars
+    def show_alerts(self, events):
+        alerts = self.core.alerts
+        for row, sensor in zip(*events.raised):
+            self.update_communication_line(self.core.alert_message(row, sensor), (alerts.field_ids[row], sensor))
+            self.overview.set_alert(alerts.field_ids[row], sensor, True)
+        for row, sensor in zip(*events.cleared):
+            self.overview.set_alert(alerts.field_ids[row], sensor, False)
+
+    # Function to show the new values of a field, the full panel only if it is open
+    def show_sample(self, state):
+        self.overview.update_field(state.field_id, state.values)
+        if state.panel is not None:
+            self.update_sensor_values(state)
+        if self.core.heartbeat_received:
+            self.configure_if_changed(self.ir_comm_label, text="IR Comm : Established", fg="green")
+        else:
+            self.configure_if_changed(self.ir_comm_label, text="IR Comm : Lost", fg="red")
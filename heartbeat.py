@@ -0,0 +1,122 @@
+import math
+
+# Event-driven IR heartbeat monitor. One pigpio callback stays registered
+# for the whole run: every rising edge of the IR receiver is a heartbeat,
+# timestamped with the pigpio tick of the edge. A pigpio watchdog on the
+# same GPIO fires when no edge arrived within the timeout, which reports
+# the link as lost without any polling; the next heartbeat reports it as
+# recovered. Heartbeat intervals give the jitter and the loss rate.
+#
+# When the same receiver also gets the data frames of ir_link, min_pulse
+# makes the callback watch both edges: only a pulse lasting at least
+# min_pulse is a heartbeat (timestamped with its rising edge), the short
+# marks of the frames and the noise are not.
+#
+# `pi` only needs callback(gpio, edge, func) and set_watchdog(gpio, ms), so
+# a simulated GPIO source (gpio_sim.SimulatedPi) can replace pigpio.pi().
+
+# pigpio constants, repeated here so the module imports without pigpio
+RISING_EDGE = 0
+EITHER_EDGE = 2
+TIMEOUT = 2  # Level reported by the watchdog
+
+LINK_LOST = "lost"
+LINK_RECOVERED = "recovered"
+
+
+# Function to compute the microseconds between two pigpio ticks (32 bit, wraps every ~72 min)
+def tick_diff(start, end):
+    return (end - start) & 0xFFFFFFFF
+
+
+class HeartbeatMonitor:
+    def __init__(self, pi, gpio, timeout=5.0, period=2.0, on_event=None, min_pulse=None):
+        self.pi = pi
+        self.gpio = gpio
+        self.timeout = timeout  # Seconds without heartbeat before the link is lost
+        self.period = period  # Expected seconds between two heartbeats, for the loss rate
+        self.on_event = on_event  # on_event(LINK_LOST or LINK_RECOVERED, tick)
+        self.min_pulse = min_pulse  # Seconds, shorter pulses are not heartbeats (None: every rising edge is one)
+        self.rise_tick = None  # Tick of the rising edge of the current pulse, with min_pulse
+        self.link_up = False
+        self.last_tick = None
+        self.silent_timeouts = 0  # Watchdog timeouts since the last heartbeat
+        self.heartbeats = 0
+        self.expected = 0  # Heartbeats expected between the first and the last one received
+        self.losses = 0  # Number of link losses
+        # Running mean and variance of the intervals (Welford), in microseconds
+        self.intervals = 0
+        self.mean_interval = 0.0
+        self.m2 = 0.0
+
+        self.callback = pi.callback(gpio, RISING_EDGE if min_pulse is None else EITHER_EDGE, self.on_edge)
+        pi.set_watchdog(gpio, int(timeout * 1000))
+
+    def cancel(self):
+        self.pi.set_watchdog(self.gpio, 0)
+        self.callback.cancel()
+
+    # pigpio callback, runs on the pigpio thread
+    def on_edge(self, gpio, level, tick):
+        if level == TIMEOUT:
+            self.silent_timeouts += 1
+            if self.link_up:
+                self.link_up = False
+                self.losses += 1
+                self.emit(LINK_LOST, tick)
+            return
+        if self.min_pulse is not None:
+            if level:
+                self.rise_tick = tick
+                return
+            rise_tick, self.rise_tick = self.rise_tick, None
+            if rise_tick is None or tick_diff(rise_tick, tick) < self.min_pulse * 1e6:
+                return
+            tick = rise_tick
+
+        if self.last_tick is not None:
+            interval = tick_diff(self.last_tick, tick)
+            if self.silent_timeouts:
+                # Ticks wrap every 2^32 us: the watchdog timeouts tell how many wraps were missed
+                silence = self.silent_timeouts * self.timeout * 1e6
+                interval += round((silence - interval) / 2 ** 32) * 2 ** 32
+            beats = max(1, round(interval / (self.period * 1e6)))
+            self.expected += beats
+            if beats == 1:
+                # Jitter only from consecutive heartbeats
+                self.intervals += 1
+                delta = interval - self.mean_interval
+                self.mean_interval += delta / self.intervals
+                self.m2 += delta * (interval - self.mean_interval)
+        self.heartbeats += 1
+        self.last_tick = tick
+        self.silent_timeouts = 0
+        if not self.link_up:
+            self.link_up = True
+            self.emit(LINK_RECOVERED, tick)
+
+    def emit(self, event, tick):
+        if self.on_event is not None:
+            self.on_event(event, tick)
+
+    # Standard deviation of the heartbeat intervals in seconds
+    def jitter(self):
+        if self.intervals < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.intervals - 1)) / 1e6
+
+    # Fraction of the expected heartbeats that never arrived
+    def loss_rate(self):
+        if not self.expected:
+            return 0.0
+        return (self.expected - (self.heartbeats - 1)) / self.expected
+
+    def stats(self):
+        return {
+            "link_up": self.link_up,
+            "heartbeats": self.heartbeats,
+            "losses": self.losses,
+            "mean_interval": self.mean_interval / 1e6,
+            "jitter": self.jitter(),
+            "loss_rate": self.loss_rate(),
+        }
@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import threading
+import time
+from array import array
+
+import metrics
+import protocol
+
+# Asyncio ingestion server: every field node connects to the same port and
+# is identified by the field id carried in its frames. A node that
+# reconnects simply takes over its entry, the dashboard keeps running.
+#
+# The server measures the decoding time of every read and, for the frames
+# stamped with their send time, the transit time from the node (both
+# clocks are expected to be set by NTP).
+#
+# A node whose uplink is down sends its samples through the other node
+# (peer_link.py): those frames are flagged as relayed and do not take over
+# the entry of the field. The node sends the same samples again from its
+# spool once reconnected, so samples already received are dropped by
+# sequence number (SequenceFilter). The samples of that backlog older than
+# the newest relayed one were never relayed (lost on the way to the other
+# node, or taken before the relay was up): they are late for the live
+# state of the field, and go to on_late (the history) instead of
+# on_sample until the direct samples catch up with the relayed ones.
+
+DEFAULT_PORT = 12345
+READ_SIZE = 65536
+DEDUP_WINDOW = 65536  # Sequence numbers remembered per relayed field, 9 hours of samples every 0.5 second
+DEDUP_TOLERANCE = 0.1  # Seconds between the node timestamps of two copies of a sample (millisecond rounding)
+
+logger = logging.getLogger(__name__)
+
+
+# Connection state of one field node
+class NodeState:
+    def __init__(self, field_id):
+        self.field_id = field_id
+        self.address = None
+        self.connected = False
+        self.connections = 0  # Number of times the node (re)connected
+        self.samples = 0
+        self.last_seen = None
+        self.writer = None
+
+
+# Samples already received, by field and sequence number. Only the fields
+# that sent relayed samples can get copies, so a field is tracked from its
+# first relayed sample on: its direct and relayed samples then fill a ring
+# of DEDUP_WINDOW slots. A sample is a copy when the slot of its sequence
+# number holds the same number with the same node timestamp: a node that
+# restarts numbers its samples from 0 again, at other times.
+class SequenceFilter:
+    def __init__(self, window=DEDUP_WINDOW):
+        self.window = window
+        self.fields = {}  # field id -> (sequence numbers, node timestamps), indexed by seq % window
+        self.duplicates = 0
+
+    def is_duplicate(self, sample):
+        slots = self.fields.get(sample.field_id)
+        if slots is None:
+            if not sample.relayed or sample.seq is None:
+                return False
+            slots = self.fields[sample.field_id] = (array("q", [-1]) * self.window, array("d", [0.0]) * self.window)
+        elif sample.seq is None:
+            return False
+        seqs, timestamps = slots
+        index = sample.seq % self.window
+        if seqs[index] == sample.seq and abs(timestamps[index] - sample.timestamp) < DEDUP_TOLERANCE:
+            self.duplicates += 1
+            return True
+        seqs[index] = sample.seq
+        timestamps[index] = sample.timestamp
+        return False
+
+
+# Decoding state of one node connection, a socket or a recorded one being replayed
+class Connection:
+    def __init__(self, address, writer):
+        self.address = address
+        self.writer = writer
+        self.decoder = None  # Binary frames or legacy CSV lines, picked from the first bytes
+        self.node = None
+
+
+# Event loop running in a daemon thread, so asyncio code can live next to the Tk main loop
+class BackgroundLoop:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    # Function to run a coroutine on the loop from any thread
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class IngestionServer:
+    def __init__(self, on_sample, host="0.0.0.0", port=DEFAULT_PORT, on_node_status=None, recorder=None,
+                 reuse_port=False, on_late=None):
+        self.on_sample = on_sample  # Called with every decoded protocol.Sample
+        self.on_late = on_late  # Called with the late backlog samples, on_sample gets them when None
+        self.on_node_status = on_node_status  # Called with (NodeState) on connect/disconnect
+        self.recorder = recorder  # recording.SessionRecorder of the raw reads, or None
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port  # Share the port with other processes (Linux balances the connections)
+        self.nodes = {}  # field id -> NodeState
+        self.sequences = SequenceFilter()
+        self.relayed_until = {}  # field id -> node timestamp of its newest relayed sample, until caught up
+        self.handlers = {}  # connection handler task -> writer
+        self.server = None
+        self.background = None
+        # Counters and histograms (seconds)
+        self.samples = 0
+        self.bytes_received = 0
+        self.invalid_frames = 0
+        self.relayed = 0  # Samples forwarded by another node
+        self.late = 0  # Backlog samples older than the relayed ones
+        self.parse_time = metrics.Histogram()  # Decoding of one read
+        self.transit = metrics.Histogram()  # Node send -> received here
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                 reuse_port=self.reuse_port or None)
+        # Report the real port when started on port 0
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Waiting for field nodes on port %s...", self.port)
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in self.handlers.values():
+                writer.close()
+            # The handlers end on the closed connections, before the loop may be stopped
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+            await self.server.wait_closed()
+
+    @property
+    def duplicates(self):
+        return self.sequences.duplicates
+
+    @property
+    def nodes_connected(self):
+        return sum(node.connected for node in list(self.nodes.values()))
+
+    # Function to start the server on an event loop thread, a new one unless `background` is given
+    def start_in_thread(self, background=None):
+        self.owns_background = background is None
+        self.background = BackgroundLoop().start() if background is None else background
+        self.background.submit(self.start()).result()
+        return self
+
+    def stop_thread(self):
+        if self.background is not None:
+            self.background.submit(self.stop()).result()
+            if self.owns_background:
+                self.background.stop()
+
+    # Function to register the node of a connection once its id is known
+    def attach_node(self, field_id, address, writer):
+        node = self.nodes.get(field_id)
+        if node is None:
+            node = self.nodes[field_id] = NodeState(field_id)
+        elif node.writer is not None and node.writer is not writer:
+            # The node reconnected before the old connection timed out
+            node.writer.close()
+        node.address = address
+        node.writer = writer
+        node.connected = True
+        node.connections += 1
+        logger.info("Connection established with %s for field %s", address, field_id)
+        if self.on_node_status:
+            self.on_node_status(node)
+        return node
+
+    def detach_node(self, node, writer):
+        if node.writer is not writer:
+            return  # Already replaced by a newer connection
+        node.writer = None
+        node.connected = False
+        logger.info("Connection lost with field %s", node.field_id)
+        if self.on_node_status:
+            self.on_node_status(node)
+
+    # Function to decode one read of a connection and hand over its samples,
+    # `received` is the time of the read (the recorded one when replaying)
+    def receive(self, connection, data, received):
+        if connection.decoder is None:
+            connection.decoder = protocol.decoder_for(data)
+        decoder = connection.decoder
+
+        began = time.perf_counter()
+        messages = decoder.feed(data)
+        self.parse_time.record(time.perf_counter() - began)
+        self.bytes_received += len(data)
+        if decoder.invalid_frames:
+            self.invalid_frames += decoder.invalid_frames
+            decoder.invalid_frames = 0
+
+        # Only telemetry is expected from the nodes on this port
+        samples = [message for message in messages if message.__class__ is protocol.Sample]
+        if not samples:
+            return
+        if samples[-1].relayed:
+            # The connection of the relaying node, the field keeps its own entry
+            self.relayed += len(samples)
+        else:
+            node = connection.node
+            if node is None or node.field_id != samples[-1].field_id:
+                node = connection.node = self.attach_node(samples[-1].field_id, connection.address, connection.writer)
+            node.samples += len(samples)
+            node.last_seen = received
+        self.samples += len(samples)
+        is_duplicate = self.sequences.is_duplicate
+        relayed_until = self.relayed_until
+        for sample in samples:
+            if sample.sent is not None:
+                self.transit.record(max(0.0, received - sample.sent))
+            if is_duplicate(sample):
+                continue
+            if ((sample.relayed or sample.field_id in relayed_until) and sample.timestamp is not None
+                    and self.is_late(sample)):
+                self.late += 1
+                if self.on_late is not None:
+                    self.on_late(sample)
+                    continue
+            self.on_sample(sample)
+
+    # Function to tell if a direct sample is older than the newest relayed sample of its
+    # field, which is forgotten once the direct samples caught up
+    def is_late(self, sample):
+        until = self.relayed_until.get(sample.field_id)
+        if sample.relayed:
+            if until is None or sample.timestamp > until:
+                self.relayed_until[sample.field_id] = sample.timestamp
+            return False
+        if sample.timestamp < until:
+            return True
+        del self.relayed_until[sample.field_id]
+        return False
+
+    def close_connection(self, connection):
+        if connection.decoder is not None:
+            self.invalid_frames += connection.decoder.invalid_frames
+            connection.decoder.invalid_frames = 0
+        if connection.node is not None:
+            self.detach_node(connection.node, connection.writer)
+
+    async def handle_connection(self, reader, writer):
+        connection = Connection(writer.get_extra_info("peername"), writer)
+        recording = None if self.recorder is None else self.recorder.open_connection(connection.address)
+        task = asyncio.current_task()
+        self.handlers[task] = writer
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                received = time.time()
+                if recording is not None:
+                    self.recorder.data(recording, data, received)
+                self.receive(connection, data, received)
+        except (ConnectionError, protocol.ProtocolError) as e:
+            logger.warning("Error receiving data from %s: %s", connection.address, e)
+        finally:
+            if recording is not None:
+                self.recorder.close_connection(recording)
+            del self.handlers[task]
+            self.close_connection(connection)
+            writer.close()
@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import multiprocessing
+import socket
+import struct
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import ingestion
+import logs
+import metrics
+import protocol
+import tsdb
+
+# Multi-process ingestion for dashboards with many fields: the node
+# connections are spread over worker processes that all listen on the
+# dashboard port (SO_REUSEPORT, the Linux kernel balances the connections),
+# so decoding runs on several cores instead of under the GIL of the Tk
+# process.
+#
+# Each worker writes the latest sample of every field it receives into a
+# table in shared memory, one row per field id (the protocol field ids are
+# 16 bits), and the dashboard reads the rows that changed in place, without
+# copying the table or pickling samples. A row is written under a sequence
+# lock: its version is odd while it is written, and the number of writes
+# since the last read tells how many samples were replaced before being
+# shown. The direct and relayed connections of a field can go to two
+# workers, so the writers of a row also take one of LOCK_STRIPES process
+# locks (picked by field id); the readers never take them. The counters
+# and histograms of the workers are published in the same shared memory
+# once per PUBLISH_INTERVAL, and the dashboard stops the workers with a
+# flag there.
+#
+# The history of every field is written by one more process, the only
+# writer of the history directory (same layout as without workers): the
+# workers send it their samples in batches of up to HISTORY_BATCH, at least
+# once per PUBLISH_INTERVAL, so the samples of a field stay in one series
+# whichever worker received them.
+#
+# Each worker also drops the copies of the samples it already received
+# (ingestion.SequenceFilter): a sample relayed by the other node and sent
+# again by its own node is only dropped when both connections went to the
+# same worker, and the same goes for the backlog samples older than the
+# relayed ones (ingestion.IngestionServer on_late), only written to the
+# history.
+
+MAX_FIELDS = 1 << 16
+PUBLISH_INTERVAL = 0.2  # Seconds between two publications of the worker counters, and stop checks
+START_TIMEOUT = 10.0
+LOCK_STRIPES = 64  # Process locks shared by the writers of the rows
+HISTORY_BATCH = 1000  # Samples per batch sent to the history writer
+
+# Row of a field: version, 4 sensors, time taken (received when the node did not
+# send it), uptime, heartbeat (-1 when unknown)
+ROW = struct.Struct("=8d")
+VERSION = struct.Struct("=d")
+DATA = struct.Struct("=7d")
+VALUES, TAKEN, UPTIME, HEARTBEAT = 1, 5, 6, 7  # Columns of the row
+
+# Stats of a worker: started and stop flags, counters, then for each histogram: count, total, max
+# and the bucket counts. The stop flag is set by the dashboard (no lock to take in the worker)
+STARTED, STOP, SAMPLES, BYTES, INVALID_FRAMES, NODES, DUPLICATES, LATE = range(8)
+COUNTERS = 8
+HISTOGRAMS = ("parse_time", "transit")
+HISTOGRAM_WIDTH = 3 + len(metrics.BUCKETS) + 1
+STATS_WIDTH = COUNTERS + len(HISTOGRAMS) * HISTOGRAM_WIDTH
+
+# Connection or disconnection of a node, sent by the workers to the dashboard
+NodeStatus = namedtuple("NodeStatus", ["field_id", "address", "connected"])
+
+logger = logging.getLogger(__name__)
+
+
+# Latest sample of every field and the stats of the workers, in shared memory
+class SharedTable:
+    def __init__(self, workers, name=None, fields=MAX_FIELDS, locks=None):
+        size = fields * ROW.size + workers * STATS_WIDTH * 8
+        self.memory = shared_memory.SharedMemory(name, create=name is None, size=size)
+        self.name = self.memory.name
+        self.buffer = self.memory.buf
+        self.fields = fields
+        self.rows = np.ndarray((fields, ROW.size // 8), dtype=np.float64, buffer=self.buffer)
+        self.stats = np.ndarray((workers, STATS_WIDTH), dtype=np.float64, buffer=self.buffer, offset=fields * ROW.size)
+        self.seen = np.zeros(fields)  # Reader side: version of each row at its last read
+        self.locks = locks  # Writer side: LOCK_STRIPES process locks, row of field id i under lock i % LOCK_STRIPES
+
+    # Function to write the latest sample of a field (worker side)
+    def write(self, sample, taken):
+        offset = sample.field_id * ROW.size
+        buffer = self.buffer
+        with self.locks[sample.field_id % len(self.locks)]:
+            version = int(VERSION.unpack_from(buffer, offset)[0]) | 1  # Odd while the row is written
+            VERSION.pack_into(buffer, offset, version)
+            DATA.pack_into(buffer, offset + VERSION.size, *sample.values, taken, sample.uptime,
+                           -1 if sample.heartbeat is None else sample.heartbeat)
+            VERSION.pack_into(buffer, offset, version + 1)
+
+    # Function to read the fields written since the last call (reader side):
+    # (protocol.Sample, number of samples written since the last read) for each
+    def read_changed(self):
+        changed = []
+        for field_id in np.flatnonzero(self.rows[:, 0] != self.seen).tolist():
+            offset = field_id * ROW.size
+            while True:
+                row = ROW.unpack_from(self.buffer, offset)
+                if not row[0] % 2 and VERSION.unpack_from(self.buffer, offset)[0] == row[0]:
+                    break  # Not written while it was read
+            writes = int(row[0] - self.seen[field_id]) // 2
+            self.seen[field_id] = row[0]
+            heartbeat = None if row[HEARTBEAT] < 0 else bool(row[HEARTBEAT])
+            changed.append((protocol.Sample(field_id, row[VALUES:TAKEN], int(row[UPTIME]), heartbeat, row[TAKEN]),
+                            writes))
+        return changed
+
+    # Function to copy the rows of an array of field ids (reader side), each one read
+    # while it was not written: even version, the same before and after the copy
+    def read_rows(self, field_ids):
+        rows = np.empty((len(field_ids), self.rows.shape[1]))
+        pending = np.arange(len(field_ids))
+        while len(pending):
+            ids = field_ids[pending]
+            before = self.rows[ids, 0]
+            copied = self.rows[ids]
+            done = (before % 2 == 0) & (self.rows[ids, 0] == before)
+            rows[pending[done]] = copied[done]
+            pending = pending[~done]
+        return rows
+
+    # Function to publish the counters and histograms of a worker
+    def publish(self, index, server):
+        stats = self.stats[index]
+        stats[SAMPLES] = server.samples
+        stats[BYTES] = server.bytes_received
+        stats[INVALID_FRAMES] = server.invalid_frames
+        stats[NODES] = server.nodes_connected
+        stats[DUPLICATES] = server.duplicates
+        stats[LATE] = server.late
+        for number, name in enumerate(HISTOGRAMS):
+            histogram = getattr(server, name)
+            start = COUNTERS + number * HISTOGRAM_WIDTH
+            stats[start:start + 3] = (histogram.count, histogram.total, histogram.max)
+            stats[start + 3:start + HISTOGRAM_WIDTH] = histogram.counts
+
+    # Function to merge a histogram of every worker
+    def histogram(self, name):
+        start = COUNTERS + HISTOGRAMS.index(name) * HISTOGRAM_WIDTH
+        histogram = metrics.Histogram()
+        for stats in self.stats:
+            histogram.merge(stats[start + 3:start + HISTOGRAM_WIDTH], *stats[start:start + 3])
+        return histogram
+
+    def close(self):
+        # The views must go before the shared memory can be closed
+        del self.rows, self.stats, self.buffer
+        self.memory.close()
+
+
+# Main function of a worker process
+def run_worker(index, table_name, workers, host, port, history_queue, node_events, log_level, locks):
+    logs.setup(log_level)
+    table = SharedTable(workers, table_name, locks=locks)
+    history = []  # (timestamp, field id, values) not sent yet to the history writer
+
+    # Function to send the pending samples to the history writer
+    def send_history():
+        if history:
+            history_queue.put(history[:])
+            del history[:]
+
+    # Also published from the samples: under a heavy load one pass of the event loop
+    # (every connection emptying its socket) can take longer than PUBLISH_INTERVAL
+    next_publish = [0.0]
+
+    def on_sample(sample):
+        now = time.monotonic()
+        if now >= next_publish[0]:
+            next_publish[0] = now + PUBLISH_INTERVAL
+            table.publish(index, server)
+        if sample.field_id >= table.fields:
+            logger.warning("Sample of field %s dropped, field ids go up to %s", sample.field_id, table.fields - 1)
+            return  # Only from a legacy CSV node name
+        taken = sample.timestamp if sample.timestamp is not None else time.time()
+        table.write(sample, taken)
+        if history_queue is not None:
+            history.append((taken, sample.field_id, sample.values))
+            if len(history) >= HISTORY_BATCH:
+                send_history()
+
+    def on_late(sample):
+        if history_queue is not None:
+            history.append((sample.timestamp, sample.field_id, sample.values))
+
+    def on_node_status(node):
+        node_events.put(NodeStatus(node.field_id, node.address, node.connected))
+
+    server = ingestion.IngestionServer(on_sample, host, port, on_node_status, reuse_port=True, on_late=on_late)
+
+    async def serve():
+        await server.start()
+        table.stats[index, STARTED] = 1
+        while not table.stats[index, STOP]:
+            table.publish(index, server)
+            send_history()
+            await asyncio.sleep(PUBLISH_INTERVAL)
+        await server.stop()
+        table.publish(index, server)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if history_queue is not None:
+            send_history()
+        table.close()
+
+
+# Main function of the history writer process: writes the batches of the workers until None
+def run_history_writer(history_directory, history_queue, log_level):
+    logs.setup(log_level)
+    history = tsdb.TimeSeriesStore(history_directory).start()
+    try:
+        while True:
+            batch = history_queue.get()
+            if batch is None:
+                break
+            for timestamp, field_id, values in batch:
+                history.append(timestamp, field_id, values)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        history.stop()
+
+
+# Ingestion on `workers` processes, with the attributes of an IngestionServer the dashboard uses
+class IngestionWorkers:
+    def __init__(self, workers, host="0.0.0.0", port=ingestion.DEFAULT_PORT, history_directory=None,
+                 log_level="INFO"):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.history_directory = history_directory
+        self.log_level = log_level
+        # Spawned, not forked: the dashboard process runs Tk and threads
+        self.context = multiprocessing.get_context("spawn")
+        self.node_events = self.context.Queue()  # NodeStatus from the workers
+        self.locks = [self.context.Lock() for _ in range(LOCK_STRIPES)]  # Writers of the rows, passed to the workers
+        self.history_queue = None if history_directory is None else self.context.Queue()  # Batches of the workers
+        self.history_writer = None
+        self.table = None
+        self.processes = []
+
+    def start(self):
+        self.table = SharedTable(self.workers)
+        placeholder = None
+        if self.port == 0:
+            # Reserve a free port for every worker to share
+            placeholder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            placeholder.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            placeholder.bind((self.host, 0))
+            self.port = placeholder.getsockname()[1]
+        try:
+            if self.history_queue is not None:
+                self.history_writer = self.context.Process(
+                    target=run_history_writer, name="history-writer", daemon=True,
+                    args=(self.history_directory, self.history_queue, self.log_level))
+                self.history_writer.start()
+            for index in range(self.workers):
+                process = self.context.Process(
+                    target=run_worker, name=f"ingestion-{index + 1}", daemon=True,
+                    args=(index, self.table.name, self.workers, self.host, self.port, self.history_queue,
+                          self.node_events, self.log_level, self.locks))
+                process.start()
+                self.processes.append(process)
+            deadline = time.monotonic() + START_TIMEOUT
+            while not self.table.stats[:, STARTED].all():
+                for process in self.processes:
+                    if not process.is_alive():
+                        self.stop()
+                        raise OSError(f"Ingestion worker {process.name} exited with code {process.exitcode}")
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise OSError(f"Ingestion workers not started after {START_TIMEOUT} seconds")
+                time.sleep(0.01)
+        finally:
+            if placeholder is not None:
+                placeholder.close()
+        logger.info("%d ingestion workers waiting for field nodes on port %s", self.workers, self.port)
+        return self
+
+    def stop(self):
+        if self.table is not None:
+            self.table.stats[:, STOP] = 1
+        for process in self.processes:
+            process.join(PUBLISH_INTERVAL * 10)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        if self.history_writer is not None:
+            # After the workers, which send their last batches when they stop
+            self.history_queue.put(None)
+            self.history_writer.join()
+            self.history_writer = None
+        if self.table is not None:
+            self.table.close()
+            self.table.memory.unlink()
+            self.table = None
+
+    # Counters and histograms summed over the workers, as published by them
+    def total(self, column):
+        return int(self.table.stats[:, column].sum())
+
+    @property
+    def samples(self):
+        return self.total(SAMPLES)
+
+    @property
+    def bytes_received(self):
+        return self.total(BYTES)
+
+    @property
+    def invalid_frames(self):
+        return self.total(INVALID_FRAMES)
+
+    @property
+    def nodes_connected(self):
+        return self.total(NODES)
+
+    @property
+    def duplicates(self):
+        return self.total(DUPLICATES)
+
+    @property
+    def late(self):
+        return self.total(LATE)
+
+    @property
+    def parse_time(self):
+        return self.table.histogram("parse_time")
+
+    @property
+    def transit(self):
+        return self.table.histogram("transit")
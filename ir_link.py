@@ -0,0 +1,332 @@
+import binascii
+import struct
+from collections import namedtuple
+
+import gpio_backend
+import protocol
+import sampling
+from heartbeat import tick_diff
+
+# Data frames over the IR link of the field nodes, next to the heartbeat.
+#
+# The transmitter sends a frame as one pigpio wave chain: a wave of the
+# modulated carrier for each mark length and a wave of silence for each
+# space length are created once, and a frame is the list of their ids, so
+# the DMA of pigpio times every symbol and no Python runs while it is
+# sent. The coding is pulse distance, like the NEC remotes but shorter:
+#
+#   header mark, header space, then for each bit (LSB first) a bit mark
+#   followed by a short space (0) or a long space (1), and a stop mark
+#
+# over the bytes: length | payload | CRC-16/CCITT of length and payload.
+#
+# The receiver decodes the demodulated output of the IR receiver from the
+# pigpio tick of each edge (FrameDecoder.edge, called by the pigpio
+# callback), so it only needs (level, tick) pairs: a synthetic trace
+# decodes like the real GPIO. Marks shorter than MIN_MARK of a bit mark
+# are noise and merged into the space around them; a frame with a symbol
+# out of its timing window or a bad CRC is counted as a frame error.
+
+CARRIER = 38000  # Hz, carrier of the usual IR receivers
+DUTY = 0.33  # Fraction of a carrier period the LED is on
+MIN_MARK = 0.25  # Shortest mark accepted, as a fraction of the bit mark
+TOLERANCE = 0.4  # Timing window of the header symbols, as a fraction of their length
+MAX_CHAIN = 600  # Bytes of a pigpio wave chain, one per symbol
+
+# Symbol lengths in microseconds
+IrTiming = namedtuple("IrTiming", ["header_mark", "header_space", "bit_mark", "zero_space", "one_space"])
+DEFAULT_TIMING = IrTiming(2000, 1500, 300, 300, 900)  # About 1100 bits per second
+
+LENGTH = struct.Struct("!B")
+CRC = struct.Struct("!H")
+# Symbols of a frame: header mark and space, a mark and a space per bit, stop mark
+MAX_PAYLOAD = (MAX_CHAIN - 3) // 16 - LENGTH.size - CRC.size
+
+# Sensor reading sent over IR: field id, sequence number, node timestamp, uptime and
+# the 4 sensors in fixed point (value * protocol.DELTA_SCALE)
+IR_READING = struct.Struct("!HIdI4h")
+
+# Decoder states
+IDLE, HEADER, DATA, STOP = range(4)
+
+
+# Function to scale every symbol of a timing, for faster or more robust links
+def scaled(timing, factor):
+    return IrTiming(*(max(1, round(length * factor)) for length in timing))
+
+
+def encode_frame(payload):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"IR payload of {len(payload)} bytes, at most {MAX_PAYLOAD}")
+    data = LENGTH.pack(len(payload)) + payload
+    return data + CRC.pack(binascii.crc_hqx(data, 0xFFFF))
+
+
+# Function to get the symbols of a frame: lengths in microseconds, marks and spaces alternating
+def frame_symbols(payload, timing=DEFAULT_TIMING):
+    symbols = [timing.header_mark, timing.header_space]
+    for byte in encode_frame(payload):
+        for bit in range(8):
+            symbols.append(timing.bit_mark)
+            symbols.append(timing.one_space if byte >> bit & 1 else timing.zero_space)
+    symbols.append(timing.bit_mark)
+    return symbols
+
+
+# Function to turn symbols into the (level, tick) edges of the receiver, for tests and benchmarks
+def symbol_edges(symbols, start=0, mark_level=1):
+    edges = []
+    tick = start
+    for index, length in enumerate(symbols):
+        edges.append((mark_level if index % 2 == 0 else 1 - mark_level, tick & 0xFFFFFFFF))
+        tick += length
+    edges.append((1 - mark_level, tick & 0xFFFFFFFF))
+    return edges
+
+
+def encode_reading(field_id, reading):
+    values = [max(-protocol.DELTA_LIMIT, min(protocol.DELTA_LIMIT, round(value * protocol.DELTA_SCALE)))
+              for value in reading.values]
+    return IR_READING.pack(field_id, reading.seq & 0xFFFFFFFF, reading.timestamp, reading.uptime, *values)
+
+
+# Function to decode a reading frame: (field id, sampling.Reading)
+def decode_reading(payload):
+    if len(payload) != IR_READING.size:
+        raise protocol.ProtocolError(f"IR reading of {len(payload)} bytes, expected {IR_READING.size}")
+    field_id, seq, timestamp, uptime, *values = IR_READING.unpack(payload)
+    return field_id, sampling.Reading(seq, timestamp, tuple(value / protocol.DELTA_SCALE for value in values), uptime)
+
+
+# Frame decoder fed with the edges of the demodulated receiver output
+class FrameDecoder:
+    def __init__(self, timing=DEFAULT_TIMING, mark_level=1, on_frame=None):
+        self.timing = timing
+        self.mark_level = mark_level  # Level of the receiver output while it sees the carrier
+        self.on_frame = on_frame  # on_frame(payload, tick of the end of the frame)
+        self.min_mark = timing.bit_mark * MIN_MARK
+        self.bit_threshold = (timing.zero_space + timing.one_space) / 2
+        self.max_space = timing.one_space + (timing.one_space - timing.zero_space)
+        self.mark_threshold = (timing.bit_mark + timing.header_mark) / 2
+        self.level = None  # Normalized level: 1 in a mark
+        self.last_tick = None  # Tick of the last edge
+        self.space_start = None  # Tick the current space started, to merge the glitches into it
+        self.pending_space = None  # Length of the space before the current mark
+        self.mark_start = None
+        self.reset()
+        # Counters
+        self.frames = 0
+        self.crc_errors = 0
+        self.framing_errors = 0  # Frames started by a header and cut by a symbol out of its window
+        self.glitches = 0
+        self.payload_bytes = 0
+        self.airtime = 0  # Microseconds of the frames received, header to stop mark
+
+    def reset(self):
+        self.state = IDLE
+        self.data = bytearray()
+        self.byte = 0
+        self.bits = 0
+        self.length = None
+        self.frame_start = None
+
+    # Function to process an edge, `level` as read on the GPIO
+    def edge(self, level, tick):
+        level = 1 if level == self.mark_level else 0
+        if level == self.level:
+            return
+        if self.level is None:
+            self.level = level
+            self.last_tick = tick
+            if level == 0:
+                self.space_start = tick
+            else:
+                self.mark_start = tick
+            return
+        duration = tick_diff(self.last_tick, tick)
+        if level == 1:
+            # A space ended, it is processed once the mark after it proves not to be noise
+            self.pending_space = duration
+            self.mark_start = tick
+        else:
+            if duration < self.min_mark and self.space_start is not None:
+                # Glitch: the space before it goes on
+                self.glitches += 1
+                self.level = 0
+                self.last_tick = self.space_start
+                return
+            if self.pending_space is not None:
+                self.on_space(self.pending_space)
+                self.pending_space = None
+            self.on_mark(duration, tick)
+            self.space_start = tick
+        self.level = level
+        self.last_tick = tick
+
+    def on_mark(self, duration, tick):
+        timing = self.timing
+        if duration >= self.mark_threshold:
+            if self.state != IDLE:
+                self.framing_errors += 1
+            self.reset()
+            if abs(duration - timing.header_mark) <= timing.header_mark * TOLERANCE:
+                self.state = HEADER
+                self.frame_start = self.mark_start
+            return
+        if self.state == STOP:
+            self.finish(tick)
+        elif self.state == HEADER:
+            self.error()  # A bit mark instead of the header space
+
+    def on_space(self, duration):
+        timing = self.timing
+        if self.state == HEADER:
+            if abs(duration - timing.header_space) <= timing.header_space * TOLERANCE:
+                self.state = DATA
+            else:
+                self.error()
+        elif self.state == DATA:
+            if duration > self.max_space:
+                self.error()
+                return
+            if duration >= self.bit_threshold:
+                self.byte |= 1 << self.bits
+            self.bits += 1
+            if self.bits == 8:
+                self.add_byte(self.byte)
+                self.byte = 0
+                self.bits = 0
+        elif self.state == STOP:
+            self.error()
+
+    def add_byte(self, byte):
+        self.data.append(byte)
+        if self.length is None:
+            self.length = byte
+            if byte > MAX_PAYLOAD:
+                self.error()
+                return
+        if len(self.data) == LENGTH.size + self.length + CRC.size:
+            self.state = STOP
+
+    def finish(self, tick):
+        data = bytes(self.data)
+        body, (crc,) = data[:-CRC.size], CRC.unpack(data[-CRC.size:])
+        if binascii.crc_hqx(body, 0xFFFF) != crc:
+            self.crc_errors += 1
+            self.reset()
+            return
+        payload = body[LENGTH.size:]
+        self.frames += 1
+        self.payload_bytes += len(payload)
+        self.airtime += tick_diff(self.frame_start, tick)
+        self.reset()
+        if self.on_frame is not None:
+            self.on_frame(payload, tick)
+
+    def error(self):
+        self.framing_errors += 1
+        self.reset()
+
+    # Payload bits per second while a frame is on the air
+    def bitrate(self):
+        if not self.airtime:
+            return 0.0
+        return self.payload_bytes * 8 / (self.airtime / 1e6)
+
+    # Fraction of the frames started (valid header) that could not be decoded
+    def frame_error_rate(self):
+        errors = self.crc_errors + self.framing_errors
+        if not errors:
+            return 0.0
+        return errors / (self.frames + errors)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "crc_errors": self.crc_errors,
+            "framing_errors": self.framing_errors,
+            "glitches": self.glitches,
+            "frame_error_rate": self.frame_error_rate(),
+            "bitrate": self.bitrate(),
+        }
+
+
+# Decoder on the pigpio callback of the IR receiver GPIO
+class IrReceiver:
+    def __init__(self, pi, gpio, timing=DEFAULT_TIMING, mark_level=1, on_frame=None):
+        self.decoder = FrameDecoder(timing, mark_level, on_frame)
+        self.callback = pi.callback(gpio, gpio_backend.EITHER_EDGE, self.on_edge)
+
+    # pigpio callback, runs on the pigpio thread
+    def on_edge(self, gpio, level, tick):
+        if level != gpio_backend.TIMEOUT:  # Watchdog of the heartbeat monitor on the same GPIO
+            self.decoder.edge(level, tick)
+
+    def cancel(self):
+        self.callback.cancel()
+
+    def stats(self):
+        return self.decoder.stats()
+
+
+# Frames sent as pigpio wave chains on the IR LED
+class IrTransmitter:
+    def __init__(self, pi, gpio, timing=DEFAULT_TIMING, carrier=CARRIER, duty=DUTY):
+        self.pi = pi
+        self.gpio = gpio
+        self.timing = timing
+        pi.set_mode(gpio, gpio_backend.OUTPUT)
+        pi.write(gpio, 0)
+        period = 1e6 / carrier
+        self.on_time = max(1, round(period * duty))
+        self.off_time = max(1, round(period) - self.on_time)
+        # Wave id of each symbol length
+        self.marks = {length: self.create_mark(length) for length in {timing.header_mark, timing.bit_mark}}
+        self.spaces = {length: self.create_space(length)
+                       for length in {timing.header_space, timing.zero_space, timing.one_space}}
+        # Counters
+        self.frames = 0
+        self.skipped = 0  # Not sent, the LED was busy
+        self.payload_bytes = 0
+        self.airtime = 0  # Microseconds
+
+    # Function to create the wave of a mark: carrier cycles for `length` microseconds
+    def create_mark(self, length):
+        mask = 1 << self.gpio
+        cycles = max(1, round(length / (self.on_time + self.off_time)))
+        self.pi.wave_add_generic([gpio_backend.Pulse(mask, 0, self.on_time),
+                                  gpio_backend.Pulse(0, mask, self.off_time)] * cycles)
+        return self.pi.wave_create()
+
+    def create_space(self, length):
+        self.pi.wave_add_generic([gpio_backend.Pulse(0, 1 << self.gpio, length)])
+        return self.pi.wave_create()
+
+    # Function to tell whether a frame or a heartbeat pulse is on the LED
+    def busy(self):
+        return bool(self.pi.wave_tx_busy())
+
+    # Function to send a frame, False if the LED is busy (frame or heartbeat pulse)
+    def send(self, payload):
+        symbols = frame_symbols(payload, self.timing)
+        if self.busy() or self.pi.read(self.gpio):
+            self.skipped += 1
+            return False
+        chain = [(self.marks if index % 2 == 0 else self.spaces)[length] for index, length in enumerate(symbols)]
+        self.pi.wave_chain(chain)
+        self.frames += 1
+        self.payload_bytes += len(payload)
+        self.airtime += sum(symbols)
+        return True
+
+    def close(self):
+        for wave_id in (*self.marks.values(), *self.spaces.values()):
+            self.pi.wave_delete(wave_id)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "bitrate": self.payload_bytes * 8 / (self.airtime / 1e6) if self.airtime else 0.0,
+        }
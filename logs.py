@@ -0,0 +1,54 @@
+import logging
+import time
+
+# Logging of the dashboard and the field nodes, with the standard logging
+# module: every message has a level, and the console shows INFO and above
+# unless setup() is given another level. The per-sample messages of the hot
+# loops are DEBUG and use %-style arguments, so they cost nothing when they
+# are not shown.
+#
+# RateLimitFilter keeps a message that repeats (the same call site, e.g. a
+# connection error retried every second) from flooding the console: after
+# `burst` messages in `interval` seconds the rest are dropped, and the next
+# message shown tells how many were.
+
+RATE_INTERVAL = 10.0
+RATE_BURST = 5
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=RATE_INTERVAL, burst=RATE_BURST, clock=time.monotonic):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.clock = clock
+        self.windows = {}  # (logger, file, line) -> [window start, messages in the window]
+        self.suppressed = 0
+
+    def filter(self, record):
+        key = (record.name, record.pathname, record.lineno)
+        now = self.clock()
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if window is not None and window[1] > self.burst:
+                record.msg = f"{record.msg} ({window[1] - self.burst} similar messages suppressed)"
+            self.windows[key] = [now, 1]
+            return True
+        window[1] += 1
+        if window[1] <= self.burst:
+            return True
+        self.suppressed += 1
+        return False
+
+
+# Function to send the log messages to the console, returns the rate limit filter
+def setup(level="INFO", interval=RATE_INTERVAL, burst=RATE_BURST):
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(FORMAT))
+    rate_limit = RateLimitFilter(interval, burst)
+    handler.addFilter(rate_limit)
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    return rate_limit
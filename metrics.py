@@ -0,0 +1,116 @@
+import asyncio
+import bisect
+import json
+
+# Low-overhead instrumentation of the node -> dashboard pipeline. A
+# Histogram has fixed logarithmic buckets: recording a value is one bisect
+# and a few additions, with no allocation, so it can sit in the ingestion
+# and render paths. Counters stay plain attributes of the objects that own
+# them (IngestionServer.invalid_frames, Uplink.sent_records...).
+#
+# MetricsServer serves a snapshot of the histograms and counters as JSON on
+# a local port, from the asyncio loop of the dashboard:
+#
+#   curl http://127.0.0.1:12350/metrics
+
+METRICS_PORT = 12350
+BUCKETS_PER_DECADE = 20  # Percentiles within about 12 %
+
+
+# Function to build the upper bounds of logarithmic buckets from `low` to `high`
+def log_buckets(low=1e-6, high=1e3, per_decade=BUCKETS_PER_DECADE):
+    bounds = []
+    bound = low
+    factor = 10 ** (1 / per_decade)
+    while bound < high * factor:
+        bounds.append(bound)
+        bound *= factor
+    return tuple(bounds)
+
+
+BUCKETS = log_buckets()  # 1 us to 1000 s, for durations in seconds
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)  # Last bucket: above the highest bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    # Function to add the values of another histogram with the same bounds (of another process)
+    def merge(self, counts, count, total, maximum):
+        for index, value in enumerate(counts):
+            self.counts[index] += int(value)
+        self.count += int(count)
+        self.total += total
+        self.max = max(self.max, maximum)
+
+    # Function to estimate a percentile, the upper bound of the bucket it falls in
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.max, self.bounds[index]) if index < len(self.bounds) else self.max
+        return 0.0
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+# Local HTTP endpoint: any GET returns snapshot() as JSON
+class MetricsServer:
+    def __init__(self, snapshot, host="127.0.0.1", port=METRICS_PORT):
+        self.snapshot = snapshot  # Called on the event loop thread, returns a JSON-serializable dict
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # Headers are not used
+            if request.startswith(b"GET "):
+                body = json.dumps(self.snapshot(), indent=2).encode()
+                status = b"200 OK"
+            else:
+                body = b"Only GET is supported\n"
+                status = b"405 Method Not Allowed"
+            writer.write(b"HTTP/1.0 " + status + b"\r\nContent-Type: application/json\r\nContent-Length: "
+                         + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
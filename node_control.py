@@ -0,0 +1,74 @@
+import logging
+import socket
+import threading
+from collections import OrderedDict
+
+import protocol
+
+# Node side of the command channel: the dashboard keeps a connection open
+# and sends command frames, every command is acknowledged with its status.
+# The status of the last commands is remembered by id, so a command resent
+# by the dashboard after a timeout is acknowledged again without running it
+# twice.
+
+CONTROL_PORT = 12347
+RECENT_COMMANDS = 256
+
+logger = logging.getLogger(__name__)
+
+
+class CommandServer:
+    def __init__(self, handler, port=CONTROL_PORT):
+        self.handler = handler  # handler(opcode, argument) -> protocol.ACK_* status
+        self.port = port
+        self.recent = OrderedDict()  # command id -> status
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(('0.0.0.0', self.port))  # Listen on all interfaces
+        self.server_socket.listen(5)
+        self.port = self.server_socket.getsockname()[1]  # Real port when started on port 0
+        logger.info("Listening for control commands on port %s...", self.port)
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def serve_forever(self):
+        while True:
+            client, address = self.server_socket.accept()
+            logger.info("Control connection from %s", address)
+            threading.Thread(target=self.handle_connection, args=(client, address), daemon=True).start()
+
+    # Function to serve one persistent dashboard connection
+    def handle_connection(self, client, address):
+        decoder = protocol.FrameDecoder()
+        try:
+            while True:
+                data = client.recv(4096)
+                if not data:
+                    break
+                for message in decoder.feed(data):
+                    if message.__class__ is protocol.Command:
+                        client.sendall(protocol.encode_ack(message.command_id, self.execute(message)))
+        except (OSError, protocol.ProtocolError) as e:
+            logger.warning("Error on control connection from %s: %s", address, e)
+        finally:
+            client.close()
+            logger.info("Control connection from %s closed", address)
+
+    def execute(self, command):
+        with self.lock:
+            status = self.recent.get(command.command_id)
+            if status is None:
+                try:
+                    status = self.handler(command.opcode, command.argument)
+                except Exception as e:
+                    logger.error("Error executing command %s: %s", command, e)
+                    status = protocol.ACK_ERROR
+                self.recent[command.command_id] = status
+                if len(self.recent) > RECENT_COMMANDS:
+                    self.recent.popitem(last=False)
+            return status
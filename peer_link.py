@@ -0,0 +1,262 @@
+import logging
+import random
+import socket
+import threading
+import time
+from collections import deque
+
+import protocol
+import sampling
+import uplink
+
+# Relay between the two field nodes. The nodes keep one TCP connection open
+# between them (PeerChannel): one node waits for it, the other connects and
+# reconnects with exponential backoff, and both send on it. A node whose
+# uplink to the dashboard is down sends its new samples on the channel as
+# batch frames; the other node forwards them to the dashboard (Relay) on a
+# connection of their own, with the name of the first node and in frames
+# flagged as relayed, through a spool like its own samples.
+#
+# The node still keeps the samples in its own spool, and sends them again
+# once its uplink is back: the dashboard drops the copies by sequence
+# number (ingestion.SequenceFilter). The channel only holds the samples
+# not sent yet in memory, its spool is the one of the node.
+
+PEER_PORT = 12346
+SEND_QUEUE = 2000  # Samples waiting for the channel, the oldest are dropped
+READ_SIZE = 65536
+RELAY_SPOOL = "relay_pi_{}.spool"  # Spool of the samples relayed for a node, by field id
+RELAY_CAPACITY = 20000
+
+logger = logging.getLogger(__name__)
+
+
+class PeerChannel:
+    def __init__(self, node_name, on_samples=None, host=None, port=PEER_PORT, min_backoff=uplink.MIN_BACKOFF,
+                 max_backoff=uplink.MAX_BACKOFF, log=logger.info):
+        self.node_name = node_name
+        self.field_id = protocol.field_id_from_name(node_name)
+        self.on_samples = on_samples  # on_samples(samples) with the protocol.Sample list of the other node
+        self.host = host  # Address of the other node, None to wait for its connection
+        self.port = port
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.log = log
+        self.queue = deque()  # (Reading, heartbeat) not sent yet
+        self.condition = threading.Condition()
+        self.socket = None
+        self.server_socket = None
+        self.running = False
+        # Counters
+        self.connections = 0
+        self.failed_connects = 0
+        self.sent_records = 0
+        self.sent_bytes = 0
+        self.dropped = 0  # Samples dropped from the full queue
+        self.received_samples = 0
+
+    @property
+    def connected(self):
+        return self.socket is not None
+
+    def start(self):
+        self.running = True
+        if self.host is None:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind(('0.0.0.0', self.port))
+            self.server_socket.listen(1)
+            self.port = self.server_socket.getsockname()[1]  # Real port when started on port 0
+            self.log(f"Listening on port {self.port} for the other node...")
+            target = self.serve
+        else:
+            target = self.run
+        threading.Thread(target=target, daemon=True).start()
+        threading.Thread(target=self.run_sender, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            sock, self.socket = self.socket, None
+            self.condition.notify_all()
+        if self.server_socket is not None:
+            self.server_socket.close()
+        if sock is not None:
+            sock.close()
+
+    # Function to queue samples for the other node, never blocks on the network
+    def send(self, readings, heartbeat=None):
+        with self.condition:
+            for reading in readings:
+                if len(self.queue) == SEND_QUEUE:
+                    self.queue.popleft()
+                    self.dropped += 1
+                self.queue.append((reading, heartbeat))
+            self.condition.notify_all()
+
+    # Function to use a new connection to the other node, replacing the previous one
+    def attach(self, sock, address):
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.condition:
+            old, self.socket = self.socket, sock
+            self.connections += 1
+            self.condition.notify_all()
+        if old is not None:
+            old.close()
+        self.log(f"Connected to the other node {address[0]}:{address[1]}")
+
+    def detach(self, sock):
+        with self.condition:
+            if self.socket is sock:
+                self.socket = None
+        sock.close()
+
+    # Thread of the waiting node: the newest connection of the other node is the channel
+    def serve(self):
+        while self.running:
+            try:
+                sock, address = self.server_socket.accept()
+            except OSError:
+                return  # Closed by stop()
+            self.attach(sock, address)
+            threading.Thread(target=self.receive, args=(sock,), daemon=True).start()
+
+    # Thread of the connecting node: keeps the channel open
+    def run(self):
+        backoff = self.min_backoff
+        while self.running:
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=uplink.CONNECT_TIMEOUT)
+            except OSError as e:
+                self.failed_connects += 1
+                self.log(f"Error connecting to the other node: {e}")
+                # Same backoff with jitter as the uplink
+                retry_at = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+                with self.condition:
+                    while self.running and time.monotonic() < retry_at:
+                        self.condition.wait(retry_at - time.monotonic())
+                backoff = min(self.max_backoff, backoff * 2)
+                continue
+            backoff = self.min_backoff
+            self.attach(sock, (self.host, self.port))
+            self.receive(sock)
+
+    # Function to read the samples of the other node until the connection is closed
+    def receive(self, sock):
+        decoder = protocol.FrameDecoder()
+        try:
+            while True:
+                data = sock.recv(READ_SIZE)
+                if not data:
+                    break
+                samples = [message for message in decoder.feed(data) if message.__class__ is protocol.Sample]
+                if samples:
+                    self.received_samples += len(samples)
+                    if self.on_samples is not None:
+                        self.on_samples(samples)
+        except (OSError, protocol.ProtocolError) as e:
+            if self.running:
+                self.log(f"Connection to the other node lost: {e}")
+        finally:
+            self.detach(sock)
+
+    # Sender thread: batch frames of the queued samples, as soon as the channel is up
+    def run_sender(self):
+        while True:
+            with self.condition:
+                while self.running and (self.socket is None or not self.queue):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                records = list(self.queue)
+                self.queue.clear()
+                sock = self.socket
+            data = b"".join(protocol.encode_batch(self.field_id, readings, heartbeat, time.time())
+                            for readings, heartbeat in uplink.split_batches(records))
+            try:
+                sock.sendall(data)
+            except OSError as e:
+                self.log(f"Connection to the other node lost: {e}")
+                self.detach(sock)
+                with self.condition:
+                    # Sent again on the next connection, before the newer samples, as far as the queue holds them
+                    room = max(0, SEND_QUEUE - len(self.queue))
+                    self.dropped += max(0, len(records) - room)
+                    self.queue.extendleft(reversed(records[len(records) - room:]))
+                continue
+            self.sent_records += len(records)
+            self.sent_bytes += len(data)
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "connections": self.connections,
+            "sent": self.sent_records,
+            "received": self.received_samples,
+            "dropped": self.dropped,
+        }
+
+
+# Forwards the samples of the other nodes to the dashboard, one relayed uplink per node
+class Relay:
+    def __init__(self, host, port=12345, wire_format="binary", deadband=0.0, keyframe_interval=uplink.KEYFRAME_INTERVAL,
+                 spool_path=RELAY_SPOOL, capacity=RELAY_CAPACITY, log=logger.info):
+        self.host = host
+        self.port = port
+        self.wire_format = wire_format  # "binary" or "delta", the "csv" frames cannot be flagged as relayed
+        self.deadband = deadband
+        self.keyframe_interval = keyframe_interval
+        self.spool_path = spool_path
+        self.capacity = capacity
+        self.log = log
+        self.uplinks = {}  # field id -> uplink.Uplink
+        self.lock = threading.Lock()  # Samples come from the channel thread and the pigpio thread (IR)
+        self.forwarded = 0
+
+    def uplink_for(self, field_id):
+        with self.lock:
+            link = self.uplinks.get(field_id)
+            if link is None:
+                spool = uplink.Spool(self.spool_path.format(field_id), self.capacity)
+                link = uplink.Uplink(f"pi_{field_id}", self.host, self.port, spool, self.wire_format, self.deadband,
+                                     self.keyframe_interval, log=self.log, relayed=True).start()
+                self.uplinks[field_id] = link
+            return link
+
+    # Function to forward protocol.Sample of other nodes (PeerChannel on_samples)
+    def forward(self, samples):
+        run = []
+        for sample in samples:
+            if sample.seq is None:
+                continue  # Only batched samples, with their sequence number for the deduplication
+            if run and (sample.field_id != run[-1].field_id or sample.heartbeat != run[-1].heartbeat):
+                self.forward_run(run)
+                run = []
+            run.append(sample)
+        if run:
+            self.forward_run(run)
+
+    def forward_run(self, samples):
+        readings = [sampling.Reading(sample.seq, sample.timestamp, sample.values, sample.uptime) for sample in samples]
+        self.uplink_for(samples[0].field_id).send(readings, samples[0].heartbeat)
+        self.forwarded += len(readings)
+
+    # Function to forward one sampling.Reading of another node (IR data link)
+    def forward_reading(self, field_id, reading, heartbeat=None):
+        self.uplink_for(field_id).send([reading], heartbeat)
+        self.forwarded += 1
+
+    def stop(self):
+        with self.lock:
+            links = list(self.uplinks.values())
+            self.uplinks.clear()
+        for link in links:
+            link.stop()
+
+    def stats(self):
+        return {
+            "forwarded": self.forwarded,
+            "waiting": sum(len(link.spool) for link in list(self.uplinks.values())),
+        }
@@ -0,0 +1,420 @@
+import re
+import struct
+from collections import namedtuple
+
+# Wire protocol between the Raspberry Pi nodes and the monitoring app.
+#
+# Every binary frame starts with a fixed header:
+#   version (uint8) | message type (uint8) | payload length (uint16)
+# followed by `payload length` bytes. The length prefix lets the receiver
+# cut frames out of the TCP stream no matter how the reads are split or
+# coalesced. The version byte is always < 0x20, which is how a connection
+# is told apart from the legacy CSV format (which starts with "pi_").
+
+PROTOCOL_VERSION = 1
+
+HEADER = struct.Struct("!BBH")
+MAX_PAYLOAD = 0xFFFF
+
+# Message types
+MSG_SAMPLE = 1
+MSG_COMMAND = 2
+MSG_ACK = 3
+MSG_BATCH = 4
+MSG_DELTA = 5
+
+# Sample payload: field id, flags, 4 x float32 sensors, uptime in seconds
+SAMPLE = struct.Struct("!HB4fI")
+
+# Batch payload: field id, flags, sequence number, sample count, node timestamp
+# (epoch seconds) and uptime of the first sample, then for each sample: milliseconds
+# since the first sample and the 4 sensors as float32. With FLAG_SEND_TIME, the
+# entries are followed by the milliseconds between the first sample and the send
+BATCH = struct.Struct("!HBIBdI")
+BATCH_ENTRY = struct.Struct("!H4f")
+SEND_DELAY = struct.Struct("!I")
+MAX_BATCH = 255
+MAX_BATCH_SPAN = 0xFFFF / 1000  # Seconds between the first and the last sample of a batch
+
+# Delta payload: the BATCH header (the count is the number of entries), then for
+# each entry: milliseconds and sequence offset since the first sample, a mask of
+# the sensors sent, and each sensor of the mask as a fixed-point int16 (value *
+# DELTA_SCALE). The other sensors keep the last value received for the field; an
+# entry with every sensor is a keyframe. FLAG_SEND_TIME as for a batch
+DELTA_ENTRY = struct.Struct("!HBB")
+DELTA_VALUE = struct.Struct("!h")
+DELTA_SCALE = 100  # Resolution of 0.01, the precision shown by the dashboard
+DELTA_LIMIT = 0x7FFF
+ALL_SENSORS = 0x0F
+
+# Legacy CSV messages: longest one kept while waiting for its end, and the ends of a
+# message sent without newline (uptime HH:MM:SS, or the heartbeat field after it)
+MAX_CSV_LINE = 256
+CSV_START = re.compile(rb"(?=pi_)")
+CSV_UPTIME_END = re.compile(rb":\d\d:\d\d\s*$")
+CSV_HEARTBEAT_END = re.compile(rb",(True|False|true|false)\s*$")
+
+# Command payload: command id, opcode, argument (duration in seconds for the LED)
+COMMAND = struct.Struct("!IBf")
+# Acknowledgement payload: command id, status
+ACK = struct.Struct("!IB")
+
+# Command opcodes
+CMD_LED_ON = 1
+CMD_LED_OFF = 2
+
+# Acknowledgement status
+ACK_OK = 0
+ACK_ERROR = 1
+ACK_UNKNOWN_COMMAND = 2
+
+# Sample flags
+FLAG_HAS_HEARTBEAT = 0x01  # The node reports the state of the IR link
+FLAG_HEARTBEAT = 0x02      # The IR heartbeat was received
+FLAG_SEND_TIME = 0x04      # The batch carries the time it was sent (node clock)
+FLAG_RELAYED = 0x08        # The batch was forwarded by the other node (peer_link.Relay)
+
+# Order of the sensor values in every frame
+SENSORS = ("Soil humidity", "Water level", "Temperature", "Fertilizer level")
+SOIL_HUMIDITY, WATER_LEVEL, TEMPERATURE, FERTILIZER_LEVEL = range(len(SENSORS))  # Sensor ids
+
+# heartbeat is None when the node does not monitor the IR link; timestamp (node
+# clock) and seq are only known for samples sent in batches, sent (node clock)
+# only for batches with FLAG_SEND_TIME, relayed for batches with FLAG_RELAYED
+Sample = namedtuple("Sample", ["field_id", "values", "uptime", "heartbeat", "timestamp", "seq", "sent", "relayed"],
+                    defaults=(None, None, None, False))
+Command = namedtuple("Command", ["command_id", "opcode", "argument"])
+Ack = namedtuple("Ack", ["command_id", "status"])
+
+
+class ProtocolError(Exception):
+    pass
+
+
+# Function to convert a node name ("pi_1") to its field id (1)
+def field_id_from_name(name):
+    try:
+        return int(name.rsplit("_", 1)[1])
+    except (IndexError, ValueError):
+        raise ProtocolError(f"Invalid node name: {name!r}")
+
+
+# Function to format an uptime in seconds as HH:MM:SS
+def format_uptime(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = int(seconds % 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+# Function to parse an HH:MM:SS uptime back to seconds
+def parse_uptime(text):
+    hours, minutes, seconds = text.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+# Function to build a binary sample frame
+def encode_sample(field_id, values, uptime, heartbeat=None):
+    flags = 0
+    if heartbeat is not None:
+        flags |= FLAG_HAS_HEARTBEAT
+        if heartbeat:
+            flags |= FLAG_HEARTBEAT
+    return HEADER.pack(PROTOCOL_VERSION, MSG_SAMPLE, SAMPLE.size) + SAMPLE.pack(field_id, flags, *values, int(uptime))
+
+
+# Function to get the flags of a batch or delta frame
+def batch_flags(heartbeat, sent, relayed):
+    flags = 0
+    if heartbeat is not None:
+        flags |= FLAG_HAS_HEARTBEAT
+        if heartbeat:
+            flags |= FLAG_HEARTBEAT
+    if sent is not None:
+        flags |= FLAG_SEND_TIME
+    if relayed:
+        flags |= FLAG_RELAYED
+    return flags
+
+
+# Function to build a batch frame from (seq, timestamp, values, uptime) readings,
+# consecutive sequence numbers are expected; `sent` is the epoch time of the send
+def encode_batch(field_id, readings, heartbeat=None, sent=None, relayed=False):
+    if not 0 < len(readings) <= MAX_BATCH:
+        raise ProtocolError(f"Invalid batch size: {len(readings)}")
+    flags = batch_flags(heartbeat, sent, relayed)
+    seq, start, _, uptime = readings[0]
+    if readings[-1][1] - start > MAX_BATCH_SPAN:
+        raise ProtocolError(f"Batch spans more than {MAX_BATCH_SPAN} seconds")
+    length = BATCH.size + BATCH_ENTRY.size * len(readings) + (SEND_DELAY.size if sent is not None else 0)
+    frame = bytearray(HEADER.pack(PROTOCOL_VERSION, MSG_BATCH, length))
+    frame += BATCH.pack(field_id, flags, seq & 0xFFFFFFFF, len(readings), start, int(uptime))
+    for _, timestamp, values, _ in readings:
+        frame += BATCH_ENTRY.pack(round((timestamp - start) * 1000), *values)
+    if sent is not None:
+        # Samples replayed after a long outage: the delay saturates (about 49 days)
+        frame += SEND_DELAY.pack(min(0xFFFFFFFF, max(0, round((sent - start) * 1000))))
+    return bytes(frame)
+
+
+# Delta encoder of one node connection: a value is sent only when it moved by
+# more than `deadband` since the last one sent, and a keyframe (every sensor)
+# at the first sample and every `keyframe_interval` seconds. Readings with no
+# value to send are skipped. Call reset() on every new connection.
+class DeltaEncoder:
+    def __init__(self, deadband=0.0, keyframe_interval=60.0):
+        # Deadband per sensor, or one for all of them (same unit as the values)
+        deadbands = deadband if isinstance(deadband, (tuple, list)) else (deadband,) * len(SENSORS)
+        self.deadbands = tuple(value * DELTA_SCALE for value in deadbands)  # In fixed-point steps
+        self.keyframe_interval = keyframe_interval
+        self.reset()
+        # Counters
+        self.readings = 0
+        self.skipped = 0  # Readings with nothing to send
+        self.values_sent = 0
+
+    def reset(self):
+        self.last = None  # Fixed-point values last sent
+        self.last_keyframe = None  # Node timestamp of the last keyframe
+        self.last_heartbeat = None
+
+    # Function to build a delta frame from (seq, timestamp, values, uptime) readings,
+    # consecutive sequence numbers are expected; returns b"" when nothing is sent
+    def encode(self, field_id, readings, heartbeat=None, sent=None, relayed=False):
+        if not 0 < len(readings) <= MAX_BATCH:
+            raise ProtocolError(f"Invalid batch size: {len(readings)}")
+        if readings[-1][1] - readings[0][1] > MAX_BATCH_SPAN:
+            raise ProtocolError(f"Batch spans more than {MAX_BATCH_SPAN} seconds")
+        entries = bytearray()
+        count = 0
+        first = start = None
+        for offset, (_, timestamp, values, _) in enumerate(readings):
+            self.readings += 1
+            fixed = [max(-DELTA_LIMIT, min(DELTA_LIMIT, round(value * DELTA_SCALE))) for value in values]
+            if self.last is None or timestamp - self.last_keyframe >= self.keyframe_interval:
+                mask = ALL_SENSORS
+                self.last_keyframe = timestamp
+            else:
+                mask = 0
+                for sensor, (value, last, deadband) in enumerate(zip(fixed, self.last, self.deadbands)):
+                    if abs(value - last) > deadband:
+                        mask |= 1 << sensor
+            if not mask and heartbeat == self.last_heartbeat:
+                self.skipped += 1
+                continue
+            self.last_heartbeat = heartbeat  # A change of the IR link is sent even without a value
+            if count == 0:
+                first = offset
+                start = timestamp
+            count += 1
+            entries += DELTA_ENTRY.pack(round((timestamp - start) * 1000), offset - first, mask)
+            last = list(self.last) if self.last is not None else fixed
+            for sensor, value in enumerate(fixed):
+                if mask & 1 << sensor:
+                    entries += DELTA_VALUE.pack(value)
+                    last[sensor] = value
+                    self.values_sent += 1
+            self.last = last
+        if not count:
+            return b""
+        flags = batch_flags(heartbeat, sent, relayed)
+        seq, start, _, uptime = readings[first]
+        length = BATCH.size + len(entries) + (SEND_DELAY.size if sent is not None else 0)
+        frame = bytearray(HEADER.pack(PROTOCOL_VERSION, MSG_DELTA, length))
+        frame += BATCH.pack(field_id, flags, seq & 0xFFFFFFFF, count, start, int(uptime))
+        frame += entries
+        if sent is not None:
+            frame += SEND_DELAY.pack(min(0xFFFFFFFF, max(0, round((sent - start) * 1000))))
+        return bytes(frame)
+
+
+# Function to build a command frame
+def encode_command(command_id, opcode, argument=0.0):
+    return HEADER.pack(PROTOCOL_VERSION, MSG_COMMAND, COMMAND.size) + COMMAND.pack(command_id, opcode, argument)
+
+
+# Function to build an acknowledgement frame
+def encode_ack(command_id, status=ACK_OK):
+    return HEADER.pack(PROTOCOL_VERSION, MSG_ACK, ACK.size) + ACK.pack(command_id, status)
+
+
+# Decoders of the other message types: (payload struct, message class)
+PAYLOADS = {
+    MSG_COMMAND: (COMMAND, Command),
+    MSG_ACK: (ACK, Ack),
+}
+
+
+# Function to build a legacy CSV sample line (compatibility mode)
+def encode_csv_sample(node_name, values, uptime, heartbeat=None):
+    fields = [node_name] + [str(value) for value in values] + [format_uptime(uptime)]
+    if heartbeat is not None:
+        fields.append(str(bool(heartbeat)))
+    return (",".join(fields) + "\n").encode()
+
+
+# Function to parse one legacy CSV message, returns None if it is malformed
+def parse_csv_sample(line):
+    parts = line.strip().split(",")
+    if len(parts) not in (6, 7):
+        return None
+    try:
+        field_id = field_id_from_name(parts[0])
+        values = tuple(float(value) for value in parts[1:5])
+        uptime = parse_uptime(parts[5])
+    except (ProtocolError, ValueError):
+        return None
+    heartbeat = parts[6].lower() == "true" if len(parts) == 7 else None
+    return Sample(field_id, values, uptime, heartbeat)
+
+
+# Streaming decoder for binary frames. feed() accepts any chunk of the TCP
+# stream and returns the messages (Sample, Command, Ack) of every frame
+# completed by that chunk; the bytes of a partial frame are kept until the
+# rest arrives. The full values of delta frames are rebuilt from the last
+# values received for each field on the connection.
+class FrameDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.invalid_frames = 0
+        self.fields = {}  # field id -> fixed-point values of the last delta entry
+
+    def feed(self, data):
+        self.buffer += data
+        buffer = self.buffer
+        messages = []
+        offset = 0
+        end = len(buffer)
+        while end - offset >= HEADER.size:
+            version, msg_type, length = HEADER.unpack_from(buffer, offset)
+            if version == 0 or version >= 0x20:
+                raise ProtocolError(f"Invalid frame header at byte {offset}")
+            frame_end = offset + HEADER.size + length
+            if frame_end > end:
+                break  # Partial frame, wait for more data
+            payload_offset = offset + HEADER.size
+            offset = frame_end
+            # Frames of a newer version or unknown type are skipped thanks to the length prefix
+            if version != PROTOCOL_VERSION:
+                self.invalid_frames += 1
+            elif msg_type == MSG_SAMPLE and length == SAMPLE.size:
+                field_id, flags, s0, s1, s2, s3, uptime = SAMPLE.unpack_from(buffer, payload_offset)
+                heartbeat = bool(flags & FLAG_HEARTBEAT) if flags & FLAG_HAS_HEARTBEAT else None
+                messages.append(Sample(field_id, (s0, s1, s2, s3), uptime, heartbeat))
+            elif msg_type == MSG_BATCH and length >= BATCH.size:
+                field_id, flags, seq, count, start, uptime = BATCH.unpack_from(buffer, payload_offset)
+                entries_end = payload_offset + BATCH.size + count * BATCH_ENTRY.size
+                if frame_end != entries_end + (SEND_DELAY.size if flags & FLAG_SEND_TIME else 0):
+                    self.invalid_frames += 1
+                    continue
+                heartbeat = bool(flags & FLAG_HEARTBEAT) if flags & FLAG_HAS_HEARTBEAT else None
+                sent = start + SEND_DELAY.unpack_from(buffer, entries_end)[0] / 1000 if flags & FLAG_SEND_TIME else None
+                relayed = bool(flags & FLAG_RELAYED)
+                entry_offset = payload_offset + BATCH.size
+                for elapsed, s0, s1, s2, s3 in BATCH_ENTRY.iter_unpack(buffer[entry_offset:entries_end]):
+                    messages.append(Sample(field_id, (s0, s1, s2, s3), uptime + elapsed // 1000, heartbeat, start + elapsed / 1000, seq, sent,
+                                           relayed))
+                    seq = (seq + 1) & 0xFFFFFFFF
+            elif msg_type == MSG_DELTA and length >= BATCH.size:
+                field_id, flags, seq, count, start, uptime = BATCH.unpack_from(buffer, payload_offset)
+                entries_end = frame_end - (SEND_DELAY.size if flags & FLAG_SEND_TIME else 0)
+                samples = self.decode_deltas(buffer, payload_offset + BATCH.size, entries_end, field_id, flags,
+                                             seq, count, start, uptime)
+                if samples is None:
+                    self.invalid_frames += 1
+                else:
+                    messages += samples
+            elif msg_type in PAYLOADS and length == PAYLOADS[msg_type][0].size:
+                payload, message = PAYLOADS[msg_type]
+                messages.append(message(*payload.unpack_from(buffer, payload_offset)))
+            else:
+                self.invalid_frames += 1
+        if offset:
+            del buffer[:offset]
+        return messages
+
+    # Function to rebuild the samples of the entries of a delta frame, None if it is invalid
+    def decode_deltas(self, buffer, offset, end, field_id, flags, seq, count, start, uptime):
+        last = self.fields.get(field_id)
+        heartbeat = bool(flags & FLAG_HEARTBEAT) if flags & FLAG_HAS_HEARTBEAT else None
+        sent = start + SEND_DELAY.unpack_from(buffer, end)[0] / 1000 if flags & FLAG_SEND_TIME else None
+        relayed = bool(flags & FLAG_RELAYED)
+        samples = []
+        for _ in range(count):
+            if offset + DELTA_ENTRY.size > end:
+                return None
+            elapsed, seq_offset, mask = DELTA_ENTRY.unpack_from(buffer, offset)
+            offset += DELTA_ENTRY.size
+            if last is None:
+                if mask != ALL_SENSORS:
+                    return None  # No keyframe received yet for this field
+                last = [0] * len(SENSORS)
+            else:
+                last = list(last)
+            for sensor in range(len(SENSORS)):
+                if mask & 1 << sensor:
+                    if offset + DELTA_VALUE.size > end:
+                        return None
+                    last[sensor] = DELTA_VALUE.unpack_from(buffer, offset)[0]
+                    offset += DELTA_VALUE.size
+            values = tuple(value / DELTA_SCALE for value in last)
+            samples.append(Sample(field_id, values, uptime + elapsed // 1000, heartbeat, start + elapsed / 1000,
+                                  (seq + seq_offset) & 0xFFFFFFFF, sent, relayed))
+        if offset != end:
+            return None
+        if last is not None:
+            self.fields[field_id] = last
+        return samples
+
+
+# Streaming decoder for the legacy CSV format. The nodes in csv mode end each
+# message with a newline. The legacy nodes send it bare, one send() per
+# message: a message then ends where the next node name ("pi_") starts, and
+# the last one of a read is taken as soon as it ends with its uptime, or with
+# its heartbeat field once the node was seen sending one. Only a first
+# message cut right before its heartbeat field is taken without it.
+class CsvDecoder:
+    def __init__(self):
+        self.buffer = b""
+        self.newlines = False  # The node ends its messages with a newline
+        self.heartbeat_field = False  # The node sends the heartbeat after the uptime
+        self.invalid_frames = 0
+
+    def feed(self, data):
+        data = self.buffer + data
+        if self.newlines or b"\n" in data:
+            self.newlines = True
+            messages = data.split(b"\n")
+            self.buffer = messages.pop()  # Last element is an incomplete line (or empty)
+            samples = self.parse(messages)
+        else:
+            messages = CSV_START.split(data)
+            self.buffer = messages.pop()
+            samples = self.parse(messages)
+            if CSV_HEARTBEAT_END.search(self.buffer) or (not self.heartbeat_field and CSV_UPTIME_END.search(self.buffer)):
+                samples += self.parse([self.buffer])
+                self.buffer = b""
+        if len(self.buffer) > MAX_CSV_LINE:
+            raise ProtocolError(f"CSV message longer than {MAX_CSV_LINE} bytes")
+        return samples
+
+    def parse(self, messages):
+        samples = []
+        for message in messages:
+            if not message.strip():
+                continue
+            sample = parse_csv_sample(message.decode(errors="replace"))
+            if sample is None:
+                self.invalid_frames += 1
+            else:
+                samples.append(sample)
+        if samples:
+            self.heartbeat_field = samples[-1].heartbeat is not None
+        return samples
+
+
+# Function to pick the decoder from the first byte received on a connection
+def decoder_for(first_chunk):
+    if first_chunk[0] < 0x20:
+        return FrameDecoder()
+    return CsvDecoder()
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import ingestion_workers
+import protocol
+
+# Automatic pump control, without Tk: one rule per field on one sensor,
+# evaluated for every field in one pass of NumPy operations per tick, like
+# alerting.ThresholdEngine. A pump starts when the value crosses `start`
+# and stops when it crosses `stop`; with start < stop it runs while the
+# value is low (irrigation on soil humidity), with start > stop while it is
+# high. The gap between the two is the hysteresis. A pump also stays on
+# for `min_on` and off for `min_off` seconds, and stops for the day once
+# its daily water budget is used (flow x run time).
+#
+# The node turns its pump on for the duration given in the command, so a
+# pump is started on a lease, renewed while it runs: a pump never runs
+# past its lease (or its budget) if the dashboard stops or a command to
+# turn it off is lost. A field without recent data stops its pump.
+#
+# PumpController runs the engine on its own tick on the dashboard event
+# loop, fed by the ingestion server, and sends the commands to the nodes.
+
+TICK_INTERVAL = 1.0
+LEASE = 60.0  # Seconds a pump runs on one command, renewed while it should run
+RENEW_MARGIN = 15.0  # Seconds before the end of the lease to renew it
+STALE_AFTER = 30.0  # Seconds without data before a pump is stopped
+
+# started, stopped and renewed are row index arrays; over_budget is the part of
+# stopped that used its daily budget
+PumpEvents = namedtuple("PumpEvents", ["started", "stopped", "renewed", "over_budget"])
+
+# Columns of the engine: dtype and value of a row without rule
+COLUMNS = {
+    "field_id": (np.int64, 0),  # Field id of the row, as an array
+    "sensor": (np.int8, protocol.SOIL_HUMIDITY),
+    "value": (np.float32, np.nan),  # NaN until the field reports
+    "updated": (np.float64, -np.inf),  # Node time of the value
+    "start": (np.float32, np.nan),  # NaN: no automation for the field
+    "stop": (np.float32, np.nan),
+    "rising": (bool, False),  # start > stop: runs while the value is high
+    "min_on": (np.float64, 0.0),
+    "min_off": (np.float64, 0.0),
+    "flow": (np.float64, 0.0),  # Liters per minute
+    "budget": (np.float64, np.inf),  # Liters per day
+    "enabled": (bool, True),
+    "on": (bool, False),
+    "switched": (np.float64, -np.inf),  # Time of the last start or stop
+    "lease_until": (np.float64, -np.inf),
+    "used": (np.float64, 0.0),  # Liters used today
+}
+
+logger = logging.getLogger(__name__)
+
+
+class PumpEngine:
+    def __init__(self, capacity=16, lease=LEASE, renew_margin=RENEW_MARGIN, stale_after=STALE_AFTER,
+                 day=lambda now: time.localtime(now)[:3]):
+        self.lease = lease
+        self.renew_margin = renew_margin
+        self.stale_after = stale_after
+        self.day = day  # day(now) -> key of the day, the budgets restart when it changes
+        self.rows = {}  # field id -> row of the columns
+        self.field_ids = []  # row -> field id
+        self.current_day = None
+        self.last_evaluation = None
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        for name, (dtype, fill) in COLUMNS.items():
+            setattr(self, name, np.full(capacity, fill, dtype=dtype))
+
+    # Function to double the capacity, keeping the rules and state of the existing rows
+    def grow(self):
+        old = {name: getattr(self, name) for name in COLUMNS}
+        self.allocate(max(1, 2 * len(self.on)))
+        for name, previous in old.items():
+            getattr(self, name)[:len(previous)] = previous
+
+    def row_for(self, field_id):
+        row = self.rows.get(field_id)
+        if row is None:
+            row = len(self.field_ids)
+            if row == len(self.on):
+                self.grow()
+            self.rows[field_id] = row
+            self.field_ids.append(field_id)
+            self.field_id[row] = field_id
+        return row
+
+    # Function to change the rule of a field, None keeps the current setting
+    def set_rule(self, field_id, sensor=None, start=None, stop=None, min_on=None, min_off=None, flow=None, budget=None):
+        row = self.row_for(field_id)
+        if sensor is not None and sensor != self.sensor[row]:
+            self.sensor[row] = sensor
+            self.value[row] = np.nan  # Wait for a value of the new sensor
+        if start is not None:
+            self.start[row] = start
+        if stop is not None:
+            self.stop[row] = stop
+        self.rising[row] = self.start[row] > self.stop[row]
+        if min_on is not None:
+            self.min_on[row] = min_on
+        if min_off is not None:
+            self.min_off[row] = min_off
+        if flow is not None:
+            self.flow[row] = flow
+        if budget is not None:
+            self.budget[row] = budget
+
+    def set_enabled(self, field_id, enabled):
+        self.enabled[self.row_for(field_id)] = enabled
+
+    # Function to keep the value of the rule sensor, `timestamp` is when it was taken
+    def update(self, field_id, values, timestamp):
+        row = self.rows.get(field_id)
+        if row is None:
+            return  # No rule for the field
+        self.value[row] = values[self.sensor[row]]
+        self.updated[row] = timestamp
+
+    # Function to take the latest values of every field from the table of the ingestion workers
+    # (ingestion_workers.SharedTable) instead of update()
+    def read_table(self, table):
+        count = len(self.field_ids)
+        rows = table.read_rows(self.field_id[:count])  # Through the sequence lock, rows not torn
+        self.value[:count] = rows[np.arange(count), ingestion_workers.VALUES + self.sensor[:count]]
+        self.updated[:count] = np.where(rows[:, 0] > 0, rows[:, ingestion_workers.TAKEN], -np.inf)
+
+    # Function to tell the engine a pump was turned off outside of it (manual command)
+    def turned_off(self, field_id, now):
+        row = self.rows.get(field_id)
+        if row is not None and self.on[row]:
+            self.on[row] = False
+            self.switched[row] = now
+
+    # Function to get the duration of the command of a started or renewed pump
+    def command_duration(self, row):
+        remaining = (self.budget[row] - self.used[row]) / self.flow[row] * 60 if self.flow[row] > 0 else np.inf
+        return float(max(0.0, min(self.lease, remaining)))
+
+    # One vectorized pass over every field
+    def evaluate(self, now):
+        count = len(self.field_ids)
+        value = self.value[:count]
+        start = self.start[:count]
+        stop = self.stop[:count]
+        rising = self.rising[:count]
+        on = self.on[:count]
+        switched = self.switched[:count]
+        lease_until = self.lease_until[:count]
+        used = self.used[:count]
+
+        # Water used by the pumps running since the last pass, budgets restart every day
+        if self.last_evaluation is not None:
+            used += on * self.flow[:count] * (max(0.0, now - self.last_evaluation) / 60)
+        self.last_evaluation = now
+        day = self.day(now)
+        if day != self.current_day:
+            self.current_day = day
+            used[:] = 0.0
+
+        # Comparisons with NaN are False: fields without data or rule never start
+        fresh = now - self.updated[:count] <= self.stale_after
+        should_start = np.where(rising, value > start, value < start) & fresh & self.enabled[:count]
+        should_stop = np.where(rising, value < stop, value > stop)
+        in_budget = used < self.budget[:count]
+        elapsed = now - switched
+
+        started = ~on & should_start & in_budget & (elapsed >= self.min_off[:count])
+        over_budget = on & ~in_budget
+        stopped = on & (over_budget | ~fresh | ~self.enabled[:count] | np.isnan(start)
+                        | (should_stop & (elapsed >= self.min_on[:count])))
+        renewed = on & ~stopped & (now >= lease_until - self.renew_margin)
+
+        on |= started
+        on &= ~stopped
+        switched[started | stopped] = now
+        events = PumpEvents(np.nonzero(started)[0], np.nonzero(stopped)[0], np.nonzero(renewed)[0],
+                            np.nonzero(over_budget)[0])
+        for row in np.concatenate((events.started, events.renewed)):
+            lease_until[row] = now + self.command_duration(row)
+        return events
+
+
+# Tick of the engine on the dashboard event loop, commands sent through control.ControlHub
+class PumpController:
+    def __init__(self, engine, control, interval=TICK_INTERVAL, on_event=None, on_command=None, clock=time.time):
+        self.engine = engine  # Only used from the event loop thread
+        self.control = control
+        self.interval = interval
+        self.on_event = on_event  # on_event(field id, on, value, reason) from the event loop thread
+        self.on_command = on_command  # Callback of the command futures, as for ControlHub.send
+        self.clock = clock
+        self.table = None  # ingestion_workers.SharedTable read at every tick, when the samples are not given to update()
+        self.background = None
+        self.task = None
+        # Counters
+        self.ticks = 0
+        self.commands = 0
+
+    def start(self, background):
+        self.background = background
+        self.task = background.submit(self.run())
+        return self
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    # Function to run an engine method on the event loop from any thread (directly until started)
+    def call(self, method, *args):
+        if self.background is None:
+            method(*args)
+        else:
+            self.background.loop.call_soon_threadsafe(method, *args)
+
+    async def run(self):
+        while True:
+            self.tick()
+            await asyncio.sleep(self.interval)
+
+    def tick(self):
+        engine = self.engine
+        if self.table is not None:
+            engine.read_table(self.table)
+        events = engine.evaluate(self.clock())
+        self.ticks += 1
+        over_budget = set(events.over_budget.tolist())
+        for row in events.started.tolist():
+            self.send(row, protocol.CMD_LED_ON, engine.command_duration(row))
+            self.report(row, True, "started")
+        for row in events.renewed.tolist():
+            self.send(row, protocol.CMD_LED_ON, engine.command_duration(row))
+        for row in events.stopped.tolist():
+            self.send(row, protocol.CMD_LED_OFF)
+            self.report(row, False, "daily budget used" if row in over_budget else "stopped")
+
+    def send(self, row, opcode, argument=0.0):
+        field_id = self.engine.field_ids[row]
+        if field_id not in self.control.channels:
+            return  # Field without control port
+        self.commands += 1
+        self.control.send(field_id, opcode, argument, callback=self.on_command)
+
+    def report(self, row, on, reason):
+        field_id = self.engine.field_ids[row]
+        value = float(self.engine.value[row])
+        logger.info("Pump of field %s %s (%s %.2f)", field_id, reason,
+                    protocol.SENSORS[self.engine.sensor[row]], value)
+        if self.on_event is not None:
+            self.on_event(field_id, on, value, reason)
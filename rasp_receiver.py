@@ -1,183 +1,150 @@
-import pigpio
-import socket
 import time
 import random
-import threading
+import protocol
+import gpio_backend
+import field_node
+import node_control
+import scheduler
+import heartbeat
+import ir_link
+import peer_link
+import sampling
+import uplink
+import logging
+import logs
 
 # Configuration
 ir_rx_pin = 16  # GPIO 16 for IR receiver
 receiver_ip = '192.168.137.1'  # Main computer IP address
-port = 12345  # Port for communication with the main computer
+port = 12345  # Port for communication with the main computer (shared by every field node)
 sender_pi_ip = '192.168.137.73'  # IP of the sender Raspberry Pi
-server_port = 12346  # Port for communication with the sender Raspberry Pi
-timeout = 1  # Timeout in seconds for IR heartbeat
+server_port = 12346  # Port of the relay channel with the sender Raspberry Pi
+heartbeat_timeout = 5  # Seconds without IR heartbeat before the link is reported lost
+heartbeat_period = 2  # Seconds between two heartbeats of the sender Pi
+heartbeat_min_pulse = 0.05  # Seconds, shorter IR pulses (data frames, noise) are not heartbeats
+ir_data = True  # Forward to the main computer the samples the sender Pi sends over IR
+wire_format = "delta"  # "delta" frames (changed values only), "binary" (every value) or "csv" for the legacy compatibility mode
+deadband = 0.5  # Smallest change of a value sent with the "delta" wire format
+keyframe_interval = 60  # Seconds between two messages with every value ("delta" wire format)
+gpio_mode = "pigpio"  # GPIO backend: "pigpio" on the Raspberry Pi, "fake" (in memory) or "replay" (edges of trace_file)
+trace_file = None  # Recorded GPIO trace for the "replay" backend
+sampling_period = 2  # Seconds between two samples
+fast_sampling_period = 0.5  # Seconds between two samples near a threshold or while the IR link is lost
+pump_start = 30  # Soil humidity below which the dashboard starts the pump (PUMP_START in core.py)
+pump_stop = 40  # Soil humidity above which the dashboard stops it (PUMP_STOP in core.py)
+# Per sensor (soil humidity, water level, temperature, fertilizer level): sampled fast near the
+# pump band of the soil humidity, where the dashboard starts and stops the pump
+fast_thresholds = ((pump_start, pump_stop), None, None, None)
+max_batch = 5  # Stable samples sent together in one message
+spool_path = "uplink.spool"  # Samples not sent yet to the main computer, kept across restarts
+log_level = "INFO"  # "DEBUG" to log every sample sent, "WARNING" for errors only
 
 # GPIO configuration for LED
 led_pin = 4  # GPIO 4 for LED
 
-# Initialize pigpio library
-pi = pigpio.pi()
-if not pi.connected:
-    print("Failed to connect to pigpio daemon.")
-    exit()
+# Leveled console logging, repeated messages are rate limited
+logs.setup(log_level)
+logger = logging.getLogger("pi_1")
 
-# Set up LED pin
-pi.set_mode(led_pin, pigpio.OUTPUT)
-pi.write(led_pin, 0)  # Make sure the LED is off initially
+# Initialize the GPIO backend (pigpio daemon on the Raspberry Pi)
+try:
+    pi = gpio_backend.open_backend(gpio_mode, trace_file)
+except gpio_backend.GpioError as e:
+    logger.error("%s", e)
+    exit()
 
 # IR Receiver setup
-pi.set_mode(ir_rx_pin, pigpio.INPUT)
+pi.set_mode(ir_rx_pin, gpio_backend.INPUT)
 
-# Global flag to track LED state
-led_active = False
-led_duration = 0
+# Timers of the node (LED switch-off), all served by a single thread
+timers = scheduler.TimerScheduler().start()
+
+# Set up LED pin
+led_control = field_node.LedController(pi, led_pin, timers)
 
 # Track the start time for uptime calculation
 start_time = time.time()
 
-# Function to calculate uptime
+# Function to calculate uptime in seconds
 def get_uptime():
-    elapsed_time = time.time() - start_time
-    hours = int(elapsed_time // 3600)
-    minutes = int((elapsed_time % 3600) // 60)
-    seconds = int(elapsed_time % 60)
-    return f"{hours:02}:{minutes:02}:{seconds:02}"
-
-# Function to check if a heartbeat has been received
-def check_for_heartbeat():
-    heartbeat_received = False
-
-    def ir_callback(gpio, level, tick):
-        nonlocal heartbeat_received
-        if level == 1:  # IR signal detected
-            heartbeat_received = True
-
-    callback = pi.callback(ir_rx_pin, pigpio.EITHER_EDGE, ir_callback)
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        time.sleep(0.1)
-        if heartbeat_received:
-            break
-    callback.cancel()
-    return heartbeat_received
-
-# Function to send data to the main computer
-def send_data_to_computer(raspberry_pi_id, client_socket,hearbeat_received):
-    try:
-        soil_humidity = random.uniform(0, 100)
-        water_level = random.uniform(0, 100)
-        temperature = random.uniform(0, 100)
-        fertilizer_level = random.uniform(0, 100)
-        hearbeat_received = hearbeat_received
-
-        uptime = get_uptime()  # Get the uptime of the system
-        message = f"{raspberry_pi_id},{soil_humidity},{water_level},{temperature},{fertilizer_level},{uptime},{hearbeat_received}"
-        client_socket.sendall(message.encode())
-        print(f"Sent to computer: {message}")
-    except Exception as e:
-        print(f"Error: {e}")
-
-# Function to send data to the sender Raspberry Pi if no heartbeat is received
-def notify_sender_pi(data):
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    
-    try:
-        client_socket.connect((sender_pi_ip, server_port))
-        print(f"Connected to {sender_pi_ip}:{server_port}")
-        client_socket.sendall(data.encode())
-        print(f"Sent to sender Pi: {data}")
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        client_socket.close()
-
-# Establish persistent connection to the main computer
-def establish_connection_to_computer():
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    return int(time.time() - start_time)
+
+# IR heartbeat monitor and IR data receiver, created below. Their callbacks run on the
+# pigpio thread and may run before the constructors return, so both names exist from here
+heartbeat_monitor = None
+ir_receiver = None
+
+# Function to report the IR link state changes
+def on_heartbeat_event(event, tick):
+    if heartbeat_monitor is None:
+        logger.info("IR link %s (tick %s)", event, tick)
+        return
+    logger.info("IR link %s (tick %s): %s", event, tick, heartbeat_monitor.stats())
+    if ir_receiver is not None:
+        logger.info("IR data: %s", ir_receiver.stats())
+
+# Samples of the sender Pi (relay channel or IR) forwarded to the main computer while its own uplink is down
+relay = peer_link.Relay(receiver_ip, port, wire_format, deadband, keyframe_interval)
+
+# Function to forward a sample received over IR, runs on the pigpio thread
+def on_ir_frame(payload, tick):
     try:
-        client_socket.connect((receiver_ip, port))
-        print(f"Connected to {receiver_ip}:{port}")
-        return client_socket
-    except Exception as e:
-        print(f"Error establishing connection to computer: {e}")
-        return None
-
-# Function to listen for LED control command from the computer
-def listen_for_led_command():
-    global led_active, led_duration
-    led_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    led_socket.bind(('0.0.0.0', 12347))  # Listen on all interfaces on port 12347
-    led_socket.listen(1)  # Only accept one connection
-    print("Listening for LED control command on port 12347...")
-
-    while True:
-        client, address = led_socket.accept()
-        print(f"Connection from {address}")
-
-        try:
-            command = client.recv(1024).decode()
-            print(f"Received command: {command}")
-
-            # Check if the command is to turn on the LED with a duration
-            if command.startswith("TURN_ON_LED"):
-                try:
-                    # Extract the duration from the command
-                    _, duration_str = command.split(",")
-                    duration = float(duration_str.strip())
-                    print(f"Turning on LED for {duration} seconds...")
-                    
-                    # Set global flags for LED
-                    led_active = True
-                    led_duration = duration
-                    pi.write(led_pin, 1)  # Turn on LED
-                    print(f"LED turned on for {duration} seconds.")
-                    
-                    # Start a separate thread to turn off LED after duration
-                    threading.Thread(target=turn_off_led_after_duration).start()
-
-                except ValueError:
-                    print("Invalid duration value received.")
-            elif command == "TURN_OFF_LED":
-                print("Turning off LED immediately.")
-                led_active = False
-                pi.write(led_pin, 0)  # Turn off LED immediately
-            else:
-                print("Invalid command received.")
-        except Exception as e:
-            print(f"Error receiving command: {e}")
-        finally:
-            client.close()
-
-# Function to turn off LED after the specified duration
-def turn_off_led_after_duration():
-    global led_active, led_duration
-    time.sleep(led_duration)
-    if led_active:
-        print(f"LED turned off after {led_duration} seconds.")
-        pi.write(led_pin, 0)  # Turn off LED
-        led_active = False
-
-# Main loop
-client_socket = establish_connection_to_computer()
-if client_socket:
-    # Start the LED listener in a separate thread
-    led_thread = threading.Thread(target=listen_for_led_command)
-    led_thread.daemon = True
-    led_thread.start()
-
-    while True:
-        print("Checking for heartbeat...")
-        if not check_for_heartbeat():
-            print("No heartbeat received. Sending data to the main computer...")
-            print("Notifying sender Pi about no heartbeat...")
-            notify_sender_pi("No heartbeat detected. Receiver is sending data.")
-            send_data_to_computer("pi_1", client_socket,False)
-
-        else:
-            print("Heartbeat received. Sending data to the main computer...")
-            send_data_to_computer("pi_1", client_socket,True)
-
-
-        time.sleep(2)
-else:
-    print("Unable to establish connection to the main computer.")
+        field_id, reading = ir_link.decode_reading(payload)
+    except protocol.ProtocolError as e:
+        logger.warning("Invalid IR frame: %s", e)
+        return
+    relay.forward_reading(field_id, reading)
+    logger.debug("IR sample %s of Field %s forwarded: %s", reading.seq, field_id,
+                 ir_receiver.stats() if ir_receiver is not None else "")
+
+# IR data frames of the sender Pi, decoded on the same GPIO as the heartbeat
+if ir_data:
+    ir_receiver = ir_link.IrReceiver(pi, ir_rx_pin, on_frame=on_ir_frame)
+
+# IR heartbeat monitor, a single callback for the whole run
+heartbeat_monitor = heartbeat.HeartbeatMonitor(pi, ir_rx_pin, timeout=heartbeat_timeout, period=heartbeat_period,
+                                               on_event=on_heartbeat_event, min_pulse=heartbeat_min_pulse)
+
+# Function to read the sensors
+def read_sensors():
+    soil_humidity = random.uniform(0, 100)
+    water_level = random.uniform(0, 100)
+    temperature = random.uniform(0, 100)
+    fertilizer_level = random.uniform(0, 100)
+    values = (soil_humidity, water_level, temperature, fertilizer_level)
+    return values
+
+# Function to send data to the main computer, queued until the connection is up
+def send_data_to_computer(computer_uplink, readings, hearbeat_received):
+    computer_uplink.send(readings, hearbeat_received)
+    state = "Sent to computer" if computer_uplink.connected else "Queued for computer"
+    logger.debug("%s: %d sample(s), last %s %ss heartbeat=%s, %d waiting", state, len(readings),
+                 readings[-1].values, readings[-1].uptime, hearbeat_received, len(computer_uplink.spool))
+
+# Function to send the pending samples, with the IR link state
+def report(readings):
+    heartbeat_received = heartbeat_monitor.link_up
+    if heartbeat_received:
+        logger.debug("Heartbeat received. Sending data to the main computer...")
+    else:
+        logger.debug("No heartbeat received. Sending data to the main computer...")
+    send_data_to_computer(computer_uplink, readings, heartbeat_received)
+    if not computer_uplink.connected and peer.connected:
+        # Uplink down: the samples also go through the sender Pi
+        peer.send(readings, heartbeat_received)
+
+# Persistent relay channel with the sender Raspberry Pi, reconnected in the background when lost
+peer = peer_link.PeerChannel("pi_1", relay.forward, host=sender_pi_ip, port=server_port).start()
+
+# Connection to the main computer, reconnected in the background when lost
+computer_uplink = uplink.Uplink("pi_1", receiver_ip, port, uplink.Spool(spool_path), wire_format,
+                               deadband, keyframe_interval).start()
+
+# Start the LED command server (persistent connection from the computer) in a separate thread
+node_control.CommandServer(led_control.handle_command).start()
+
+# Main loop: samples on a fixed monotonic schedule, faster near the thresholds and while the IR link is lost
+sampler = sampling.SamplingLoop(read_sensors, report, period=sampling_period, fast_period=fast_sampling_period,
+                                thresholds=fast_thresholds, max_batch=max_batch, uptime=get_uptime,
+                                urgent=lambda: not heartbeat_monitor.link_up)
+sampler.run()
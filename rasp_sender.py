@@ -1,161 +1,123 @@
 import random 
-import pigpio
-import socket
 import time
-import threading
+import gpio_backend
+import field_node
+import ir_link
+import peer_link
+import node_control
+import scheduler
+import sampling
+import uplink
+import logging
+import logs
 
 # Configuration
 ir_tx_pin = 5  # GPIO 5 for IR transmitter
 led_pin = 4     # GPIO 4 for LED (same as the first Raspberry Pi)
 receiver_ip = '192.168.137.1'  # Main computer IP address
-port = 12344  # Port for communication with the main computer
-server_port = 12346  # Port for communication with the receiver Raspberry Pi
-
-# Initialize pigpio library
-pi = pigpio.pi()
-if not pi.connected:
-    print("Failed to connect to pigpio daemon.")
+port = 12345  # Port for communication with the main computer (shared by every field node)
+server_port = 12346  # Port of the relay channel with the receiver Raspberry Pi (it connects to this node)
+wire_format = "delta"  # "delta" frames (changed values only), "binary" (every value) or "csv" for the legacy compatibility mode
+deadband = 0.5  # Smallest change of a value sent with the "delta" wire format
+keyframe_interval = 60  # Seconds between two messages with every value ("delta" wire format)
+gpio_mode = "pigpio"  # GPIO backend: "pigpio" on the Raspberry Pi, "fake" (in memory) or "replay" (edges of trace_file)
+trace_file = None  # Recorded GPIO trace for the "replay" backend
+heartbeat_period = 2  # Seconds between two IR heartbeats
+ir_data = True  # Send the samples to the receiver Pi over IR while the main computer is unreachable
+ir_retry_delay = 0.15  # Seconds before sending again a sample that found a heartbeat on the IR LED
+sampling_period = 2  # Seconds between two samples
+fast_sampling_period = 0.5  # Seconds between two samples while a value is near its threshold
+pump_start = 30  # Soil humidity below which the dashboard starts the pump (PUMP_START in core.py)
+pump_stop = 40  # Soil humidity above which the dashboard stops it (PUMP_STOP in core.py)
+# Per sensor (soil humidity, water level, temperature, fertilizer level): sampled fast near the
+# pump band of the soil humidity, where the dashboard starts and stops the pump
+fast_thresholds = ((pump_start, pump_stop), None, None, None)
+max_batch = 5  # Stable samples sent together in one message
+spool_path = "uplink.spool"  # Samples not sent yet to the main computer, kept across restarts
+log_level = "INFO"  # "DEBUG" to log every sample sent, "WARNING" for errors only
+
+# Leveled console logging, repeated messages are rate limited
+logs.setup(log_level)
+logger = logging.getLogger("pi_2")
+
+# Initialize the GPIO backend (pigpio daemon on the Raspberry Pi)
+try:
+    pi = gpio_backend.open_backend(gpio_mode, trace_file)
+except gpio_backend.GpioError as e:
+    logger.error("%s", e)
     exit()
 
-# IR Transmitter setup
-pi.set_mode(ir_tx_pin, pigpio.OUTPUT)
+# Timers of the node (LED switch-off, heartbeat), all served by a single thread
+timers = scheduler.TimerScheduler().start()
 
-# Set up LED pin
-pi.set_mode(led_pin, pigpio.OUTPUT)
-pi.write(led_pin, 0)  # Make sure the LED is off initially
+# IR data frames (pigpio waves) on the same LED, the heartbeat waits for the end of a frame
+ir_data_link = ir_link.IrTransmitter(pi, ir_tx_pin) if ir_data else None
 
-# Global flag to track LED state
-led_active = False
-led_duration = 0
+# IR Transmitter setup, one heartbeat every heartbeat_period seconds
+ir_transmitter = field_node.HeartbeatTransmitter(pi, ir_tx_pin, timers, heartbeat_period,
+                                                 busy=ir_data_link.busy if ir_data_link else None)
+
+# Set up LED pin
+led_control = field_node.LedController(pi, led_pin, timers)
 
 # Track the start time for uptime calculation
 start_time = time.time()
 
-# Function to calculate uptime
+# Function to calculate uptime in seconds
 def get_uptime():
-    elapsed_time = time.time() - start_time
-    hours = int(elapsed_time // 3600)
-    minutes = int((elapsed_time % 3600) // 60)
-    seconds = int(elapsed_time % 60)
-    return f"{hours:02}:{minutes:02}:{seconds:02}"
-
-# Function to send heartbeat via IR
-def send_heartbeat():
-    pi.write(ir_tx_pin, 1)
-    time.sleep(0.1)
-    pi.write(ir_tx_pin, 0)
-
-# Function to send data to the main computer
-def send_data_to_computer(raspberry_pi_id, client_socket):
-    try:
-        soil_humidity = random.uniform(0, 100)
-        water_level = random.uniform(0, 100)
-        temperature = random.uniform(0, 100)
-        fertilizer_level = random.uniform(0, 100)
-        uptime = get_uptime()  # Get the uptime of the system
-        message = f"{raspberry_pi_id},{soil_humidity},{water_level},{temperature},{fertilizer_level},{uptime}"
-        client_socket.sendall(message.encode())
-        print(f"Sent to computer: {message}")
-    except Exception as e:
-        print(f"Error: {e}")
-
-# Function to handle incoming data from the receiver Raspberry Pi
-def receive_data_from_receiver_pi():
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind(('0.0.0.0', server_port))
-    server_socket.listen(1)
-    print(f"Listening on port {server_port} for data from the receiver Pi...")
-
-    while True:
-        client_socket, addr = server_socket.accept()
-        print(f"Connection from {addr}")
-        data = client_socket.recv(1024).decode()
-        if data:
-            print(f"Received data from receiver Pi: {data}")
-        client_socket.close()
-
-# Function to listen for LED control command from the computer
-def listen_for_led_command():
-    global led_active, led_duration
-    led_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    led_socket.bind(('0.0.0.0', 12347))  # Listen on all interfaces on port 12347
-    led_socket.listen(1)  # Only accept one connection
-    print("Listening for LED control command on port 12347...")
-
-    while True:
-        client, address = led_socket.accept()
-        print(f"Connection from {address}")
-
-        try:
-            command = client.recv(1024).decode()
-            print(f"Received command: {command}")
-
-            # Check if the command is to turn on the LED with a duration
-            if command.startswith("TURN_ON_LED"):
-                try:
-                    # Extract the duration from the command
-                    _, duration_str = command.split(",")
-                    duration = float(duration_str.strip())
-                    print(f"Turning on LED for {duration} seconds...")
-                    
-                    # Set global flags for LED
-                    led_active = True
-                    led_duration = duration
-                    pi.write(led_pin, 1)  # Turn on LED
-                    print(f"LED turned on for {duration} seconds.")
-                    
-                    # Start a separate thread to turn off LED after duration
-                    threading.Thread(target=turn_off_led_after_duration).start()
-
-                except ValueError:
-                    print("Invalid duration value received.")
-            elif command == "TURN_OFF_LED":
-                print("Turning off LED immediately.")
-                led_active = False
-                pi.write(led_pin, 0)  # Turn off LED immediately
-            else:
-                print("Invalid command received.")
-        except Exception as e:
-            print(f"Error receiving command: {e}")
-        finally:
-            client.close()
-
-# Function to turn off LED after the specified duration
-def turn_off_led_after_duration():
-    global led_active, led_duration
-    time.sleep(led_duration)
-    if led_active:
-        print(f"LED turned off after {led_duration} seconds.")
-        pi.write(led_pin, 0)  # Turn off LED
-        led_active = False
-
-# Establish persistent connection to the main computer
-def establish_connection_to_computer():
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        client_socket.connect((receiver_ip, port))
-        print(f"Connected to {receiver_ip}:{port}")
-        return client_socket
-    except Exception as e:
-        print(f"Error establishing connection to computer: {e}")
-        return None
-
-# Start a thread to listen for incoming data from the receiver Raspberry Pi
-server_thread = threading.Thread(target=receive_data_from_receiver_pi)
-server_thread.daemon = True
-server_thread.start()
-
-# Start a thread to listen for LED control commands
-led_thread = threading.Thread(target=listen_for_led_command)
-led_thread.daemon = True
-led_thread.start()
-
-# Main loop
-client_socket = establish_connection_to_computer()
-
-while True:
-    print("Sending heartbeat...")
-    send_heartbeat()
-    print("Sending data to main computer...")
-    send_data_to_computer("pi_2", client_socket)
-    time.sleep(2)
+    return int(time.time() - start_time)
+
+# Function to read the sensors
+def read_sensors():
+    soil_humidity = random.uniform(0, 100)
+    water_level = random.uniform(0, 100)
+    temperature = random.uniform(0, 100)
+    fertilizer_level = random.uniform(0, 100)
+    values = (soil_humidity, water_level, temperature, fertilizer_level)
+    return values
+
+# Function to send data to the main computer, queued until the connection is up
+def send_data_to_computer(computer_uplink, readings):
+    computer_uplink.send(readings)
+    state = "Sent to computer" if computer_uplink.connected else "Queued for computer"
+    logger.debug("%s: %d sample(s), last %s %ss, %d waiting", state, len(readings),
+                 readings[-1].values, readings[-1].uptime, len(computer_uplink.spool))
+    if computer_uplink.connected:
+        return
+    # Uplink down: the samples go through the receiver Pi, over the network or else over IR
+    if peer.connected:
+        peer.send(readings)
+    elif ir_data_link is not None:
+        send_data_over_ir(computer_uplink.field_id, readings[-1])
+
+# Function to send the last sample to the receiver Pi over IR, which forwards it to the main computer
+def send_data_over_ir(field_id, reading, retry=True):
+    if ir_data_link.send(ir_link.encode_reading(field_id, reading)):
+        logger.debug("Sent over IR: sample %s, %s", reading.seq, ir_data_link.stats())
+    elif retry:
+        # The heartbeats and the samples share the same period, the sample follows the pulse
+        timers.schedule(ir_retry_delay, send_data_over_ir, field_id, reading, False)
+    else:
+        logger.debug("IR busy, sample %s not sent over IR", reading.seq)
+
+# Samples of the receiver Pi forwarded to the main computer while its own uplink is down
+relay = peer_link.Relay(receiver_ip, port, wire_format, deadband, keyframe_interval)
+
+# Persistent relay channel with the receiver Raspberry Pi, which connects to this node
+peer = peer_link.PeerChannel("pi_2", relay.forward, port=server_port).start()
+
+# Start the LED command server (persistent connection from the computer) in a separate thread
+node_control.CommandServer(led_control.handle_command).start()
+
+# IR heartbeat on its own fixed period, independent of the sampling rate
+ir_transmitter.start()
+
+# Connection to the main computer, reconnected in the background when lost
+computer_uplink = uplink.Uplink("pi_2", receiver_ip, port, uplink.Spool(spool_path), wire_format,
+                               deadband, keyframe_interval).start()
+
+# Main loop: samples on a fixed monotonic schedule, faster near the thresholds
+sampler = sampling.SamplingLoop(read_sensors, lambda readings: send_data_to_computer(computer_uplink, readings),
+                                period=sampling_period, fast_period=fast_sampling_period,
+                                thresholds=fast_thresholds, max_batch=max_batch, uptime=get_uptime)
+sampler.run()
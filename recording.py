@@ -0,0 +1,194 @@
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import ingestion
+import protocol
+
+# Recording of telemetry sessions: the raw reads of every node connection,
+# exactly as the ingestion server received them, with their receive time.
+# A session file is append-only: a magic, then one record per event:
+#
+#   receive time (epoch seconds, float64) | connection id (uint32) |
+#   kind (uint8: open, data, close) | length (uint32) | bytes
+#
+# The bytes are the address of the node for an open event and the chunk
+# read from the socket for a data event. A session ends wherever the file
+# ends; a record cut by a crash is ignored.
+#
+# SessionReplayer feeds a file back into an IngestionServer (the one of
+# MonitoringApp, or a headless one) through the same decoding code as a
+# live connection, at the recorded pace, `speed` times faster, or as fast
+# as possible (speed None).
+
+MAGIC = b"REC1"
+RECORD = struct.Struct("<dIBI")
+OPEN, DATA, CLOSE = range(3)
+FLUSH_INTERVAL = 1.0  # Seconds between two flushes of the file buffer
+
+Event = namedtuple("Event", ["time", "connection", "kind", "data"])
+
+logger = logging.getLogger(__name__)
+
+
+# Writes the reads of the ingestion server (event loop thread), closed from any thread
+class SessionRecorder:
+    def __init__(self, path):
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{path} is not a session recording")
+        self.file = open(path, "ab", buffering=1 << 16)
+        if new:
+            self.file.write(MAGIC)
+        self.lock = threading.Lock()
+        self.next_connection = 0
+        self.last_flush = time.monotonic()
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, received, connection, kind, data):
+        with self.lock:
+            if self.file is None:
+                return  # Connections still closing after close()
+            self.file.write(RECORD.pack(received, connection, kind, len(data)))
+            self.file.write(data)
+            self.records += 1
+            self.bytes += RECORD.size + len(data)
+            now = time.monotonic()
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = now
+
+    # Function to record a new connection, returns its id for the next events
+    def open_connection(self, address, received=None):
+        connection = self.next_connection
+        self.next_connection += 1
+        text = address if isinstance(address, str) else f"{address[0]}:{address[1]}"
+        self.write(time.time() if received is None else received, connection, OPEN, text.encode())
+        return connection
+
+    def data(self, connection, data, received):
+        self.write(received, connection, DATA, data)
+
+    def close_connection(self, connection, received=None):
+        self.write(time.time() if received is None else received, connection, CLOSE, b"")
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+# Function to read the events of a session file in order
+def read_session(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            received, connection, kind, length = RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield Event(received, connection, kind, data)
+
+
+# Function to turn a recorded "host:port" back into a peer address
+def parse_address(data):
+    host, _, port = data.decode().rpartition(":")
+    return (host, int(port)) if port.isdigit() else data.decode()
+
+
+# Writer of a replayed connection: nothing to send to or close
+class ReplayedWriter:
+    def close(self):
+        pass
+
+
+class SessionReplayer:
+    def __init__(self, path, server, speed=1.0, on_tick=None, tick_interval=0.1, clock=time.monotonic):
+        self.path = path
+        self.server = server  # ingestion.IngestionServer, not started
+        self.speed = speed  # Times faster than recorded, None for as fast as possible
+        self.on_tick = on_tick  # on_tick(recorded time) every tick_interval of recorded time
+        self.tick_interval = tick_interval
+        self.clock = clock
+        self.connections = {}  # recorded connection id -> ingestion.Connection
+        self.stopped = threading.Event()
+        self.finished = False
+        self.thread = None
+        # Counters
+        self.events = 0
+        self.bytes = 0
+        self.errors = 0
+
+    def run(self):
+        origin = None
+        next_tick = None
+        for event in read_session(self.path):
+            if self.stopped.is_set():
+                break
+            if origin is None:
+                origin = (event.time, self.clock())
+                next_tick = event.time
+            if self.speed is not None:
+                delay = origin[1] + (event.time - origin[0]) / self.speed - self.clock()
+                if delay > 0 and self.stopped.wait(delay):
+                    break
+            # Ticks on the recorded time, the same whatever the speed; one tick
+            # for a gap without data (between two recordings of the file)
+            if self.on_tick is not None and event.time >= next_tick:
+                self.on_tick(next_tick)
+                next_tick += math.floor((event.time - next_tick) / self.tick_interval + 1) * self.tick_interval
+            self.play(event)
+        for connection_id in list(self.connections):
+            self.close(connection_id)
+        if self.on_tick is not None and next_tick is not None:
+            self.on_tick(next_tick)
+        self.finished = True
+        return self
+
+    def play(self, event):
+        self.events += 1
+        if event.kind == OPEN:
+            self.close(event.connection)  # Id reused by a later recording appended to the file
+            self.connections[event.connection] = ingestion.Connection(parse_address(event.data), ReplayedWriter())
+        elif event.kind == DATA:
+            connection = self.connections.get(event.connection)
+            if connection is None:
+                return  # Closed after a protocol error, like the live connection
+            self.bytes += len(event.data)
+            try:
+                self.server.receive(connection, event.data, event.time)
+            except protocol.ProtocolError as e:
+                self.errors += 1
+                logger.warning("Error in replayed data from %s: %s", connection.address, e)
+                self.close(event.connection)
+        elif event.kind == CLOSE:
+            self.close(event.connection)
+
+    def close(self, connection_id):
+        connection = self.connections.pop(connection_id, None)
+        if connection is not None:
+            self.server.close_connection(connection)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,115 @@
+import math
+import time
+from collections import namedtuple
+
+# Sampling loop of the field nodes. Samples are taken on absolute deadlines
+# of a monotonic clock (start + n * period), so the time spent reading,
+# sending or checking the IR link does not make the period drift, and a
+# late sample does not shift the next ones.
+#
+# The period adapts: the fast period is used while a value is near its
+# threshold (an upper limit, or the band between the start and stop
+# thresholds of a pump) or while urgent() is true (IR link lost), the
+# normal period otherwise. While the values are stable, samples are kept and sent
+# together in one batch, up to max_batch samples; a change, an urgent
+# sample or a full batch sends everything pending at once.
+#
+# The clocks and sleep are injectable, so the loop runs on a fake clock.
+
+Reading = namedtuple("Reading", ["seq", "timestamp", "values", "uptime"])
+
+
+class SamplingLoop:
+    def __init__(self, read_values, send, period=2.0, fast_period=0.5, thresholds=None, near_margin=5.0,
+                 stable_delta=1.0, max_batch=5, urgent=None, uptime=None,
+                 clock=time.monotonic, wall_clock=time.time, sleep=time.sleep):
+        self.read_values = read_values  # read_values() -> sensor values
+        self.send = send  # send(readings) sends a list of Reading, returns the bytes sent (or None)
+        self.period = period
+        self.fast_period = fast_period
+        # Per sensor: an upper threshold, a (lower, upper) band or None; None to disable
+        self.thresholds = thresholds
+        self.near_margin = near_margin  # A value within this margin of its threshold (or band) is near it
+        self.stable_delta = stable_delta  # Largest change still considered stable
+        self.max_batch = max_batch
+        self.urgent = urgent  # urgent() -> True to sample at the fast period
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self.started = clock()
+        self.uptime = uptime if uptime is not None else lambda: int(self.clock() - self.started)
+        self.running = False
+        self.fast = False
+        self.pending = []
+        self.last_sent = None  # Values of the last sample sent
+        self.seq = 0
+        # Counters
+        self.samples = 0
+        self.sends = 0
+        self.bytes_sent = 0
+        self.overruns = 0  # Deadlines missed because a step took longer than the period
+
+    # Function to tell if some value is within the margin of its threshold
+    def near_threshold(self, values):
+        if self.thresholds is None:
+            return False
+        for value, threshold in zip(values, self.thresholds):
+            if threshold is None:
+                continue
+            if isinstance(threshold, tuple):
+                lower, upper = threshold
+                if lower - self.near_margin <= value <= upper + self.near_margin:
+                    return True
+            elif value >= threshold - self.near_margin:
+                return True
+        return False
+
+    # Function to tell if the values moved since the last sample sent
+    def changed(self, values):
+        if self.last_sent is None:
+            return True
+        for value, last in zip(values, self.last_sent):
+            if abs(value - last) > self.stable_delta:
+                return True
+        return False
+
+    # Function to take one sample and send the pending ones if needed
+    def step(self):
+        values = tuple(self.read_values())
+        self.pending.append(Reading(self.seq, self.wall_clock(), values, self.uptime()))
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        self.samples += 1
+        self.fast = self.near_threshold(values) or (self.urgent is not None and bool(self.urgent()))
+        if self.fast or self.changed(values) or len(self.pending) >= self.max_batch:
+            self.flush()
+
+    # Function to send every pending sample in one call
+    def flush(self):
+        if not self.pending:
+            return
+        readings = self.pending
+        self.pending = []
+        self.last_sent = readings[-1].values
+        self.sends += 1
+        self.bytes_sent += self.send(readings) or 0
+
+    # Function to run the loop on absolute deadlines, `iterations` steps or until stop()
+    def run(self, iterations=None):
+        self.running = True
+        deadline = self.clock()
+        while self.running and (iterations is None or iterations > 0):
+            self.step()
+            if iterations is not None:
+                iterations -= 1
+            period = self.fast_period if self.fast else self.period
+            deadline += period
+            now = self.clock()
+            if deadline <= now:
+                # Late: skip to the next slot instead of sampling in a burst
+                self.overruns += 1
+                deadline += math.ceil((now - deadline) / period + 1e-9) * period
+            self.sleep(deadline - now)
+        self.flush()
+
+    def stop(self):
+        self.running = False
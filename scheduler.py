@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+
+# Timer scheduler for the nodes: every delayed action (LED or pump off
+# after a duration) is an entry of one heap served by a single thread, so
+# the number of threads stays the same whatever the command rate. Timers
+# can be cancelled or moved; the old heap entries are skipped lazily.
+#
+# The clock is injectable: with a fake clock, run_pending(now) runs the due
+# timers without the worker thread. Periodic timers run on absolute
+# deadlines (start + n * period), so they do not drift.
+
+logger = logging.getLogger(__name__)
+
+
+# Function to reject a delay that would never come due: a NaN or infinite deadline
+# at the top of the heap blocks every timer behind it
+def check_delay(delay):
+    if not math.isfinite(delay):
+        raise ValueError(f"timer delay must be finite, not {delay!r}")
+
+
+class Timer:
+    __slots__ = ("deadline", "callback", "args", "generation", "cancelled", "period")
+
+    def __init__(self, deadline, callback, args, period=None):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.period = period  # Seconds between two runs, None for a one-shot timer
+        self.generation = 0  # Incremented when the timer is moved
+        self.cancelled = False
+
+
+class TimerScheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []  # (deadline, sequence, timer, generation)
+        self.sequence = itertools.count()
+        self.stale = 0  # Heap entries of cancelled or moved timers
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def __len__(self):
+        return len(self.heap) - self.stale
+
+    def push(self, timer):
+        heapq.heappush(self.heap, (timer.deadline, next(self.sequence), timer, timer.generation))
+        # Rebuild the heap when it is mostly made of stale entries
+        if self.stale > 64 and self.stale > len(self.heap) // 2:
+            self.heap = [entry for entry in self.heap if not entry[2].cancelled and entry[3] == entry[2].generation]
+            heapq.heapify(self.heap)
+            self.stale = 0
+        self.condition.notify()
+
+    # Function to run callback(*args) in `delay` seconds, returns the Timer
+    def schedule(self, delay, callback, *args):
+        check_delay(delay)
+        with self.condition:
+            timer = Timer(self.clock() + delay, callback, args)
+            self.push(timer)
+            return timer
+
+    # Function to run callback(*args) every `period` seconds, first run in `delay` seconds
+    def every(self, period, callback, *args, delay=None):
+        if not math.isfinite(period) or period <= 0:
+            raise ValueError(f"period must be positive and finite, not {period!r}")
+        if delay is not None:
+            check_delay(delay)
+        with self.condition:
+            timer = Timer(self.clock() + (period if delay is None else delay), callback, args, period)
+            self.push(timer)
+            return timer
+
+    # Function to move a pending timer to `delay` seconds from now (shorter or longer)
+    def reschedule(self, timer, delay):
+        check_delay(delay)
+        with self.condition:
+            if timer.cancelled:
+                return False
+            timer.generation += 1
+            timer.deadline = self.clock() + delay
+            self.stale += 1
+            self.push(timer)
+            return True
+
+    # Function to push a pending timer back by `seconds`
+    def extend(self, timer, seconds):
+        with self.condition:
+            return self.reschedule(timer, timer.deadline + seconds - self.clock())
+
+    def cancel(self, timer):
+        with self.condition:
+            if not timer.cancelled:
+                timer.cancelled = True
+                self.stale += 1
+
+    # Function to run the timers due at `now` (current clock by default), returns how many ran
+    def run_pending(self, now=None):
+        due = []
+        with self.condition:
+            now = self.clock() if now is None else now
+            while self.heap and self.heap[0][0] <= now:
+                _, _, timer, generation = heapq.heappop(self.heap)
+                if timer.cancelled or generation != timer.generation:
+                    self.stale -= 1
+                    continue
+                if timer.period is None:
+                    timer.cancelled = True  # Done, a late cancel() is a no-op
+                else:
+                    # Next slot after now: missed runs are skipped, not run in a burst
+                    timer.deadline += timer.period
+                    if timer.deadline <= now:
+                        timer.deadline += math.ceil((now - timer.deadline) / timer.period + 1e-9) * timer.period
+                    heapq.heappush(self.heap, (timer.deadline, next(self.sequence), timer, timer.generation))
+                due.append(timer)
+        for timer in due:
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                logger.error("Error in timer callback %s: %s", timer.callback, e)
+        return len(due)
+
+    # Seconds until the next valid timer, None if there is none
+    def next_delay(self):
+        while self.heap:
+            _, _, timer, generation = self.heap[0]
+            if timer.cancelled or generation != timer.generation:
+                heapq.heappop(self.heap)
+                self.stale -= 1
+                continue
+            return timer.deadline - self.clock()
+        return None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    delay = self.next_delay()
+                    if delay is not None and delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                if not self.running:
+                    return
+            self.run_pending()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+# Output switched on for a duration (LED, pump). A newer command replaces
+# the pending switch-off of the previous one, so an old timer can never
+# switch off what a newer command turned on.
+class Actuator:
+    def __init__(self, name, write, scheduler, log=logger.info):
+        self.name = name
+        self.write = write  # write(level) drives the output
+        self.log = log
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.active = False
+        self.timer = None  # Pending switch-off
+        self.token = None  # Identifies the command that scheduled it
+
+    def turn_on(self, duration=None):
+        with self.lock:
+            self.write(1)
+            self.active = True
+            if self.timer is not None:
+                self.scheduler.cancel(self.timer)
+                self.timer = self.token = None
+            if duration is not None:
+                self.token = object()
+                self.timer = self.scheduler.schedule(duration, self.expire, self.token)
+        self.log(f"{self.name} turned on" + (f" for {duration} seconds." if duration is not None else "."))
+
+    # Function to keep the output on `seconds` longer than planned
+    def extend(self, seconds):
+        with self.lock:
+            if self.timer is None:
+                return False
+            return self.scheduler.extend(self.timer, seconds)
+
+    def turn_off(self):
+        with self.lock:
+            if self.timer is not None:
+                self.scheduler.cancel(self.timer)
+                self.timer = None
+                self.token = None
+            self.write(0)
+            self.active = False
+        self.log(f"{self.name} turned off.")
+
+    # Timer callback, ignored if a newer command replaced this timer
+    def expire(self, token):
+        with self.lock:
+            if token is not self.token:
+                return
+            self.timer = None
+            self.token = None
+            self.write(0)
+            self.active = False
+        self.log(f"{self.name} turned off after its duration.")
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import OrderedDict
+
+import protocol
+import sampling
+import uplink
+
+# Headless simulator of field nodes: hundreds or thousands of virtual nodes
+# in one asyncio process, speaking the same protocol as the Raspberry Pi
+# scripts. Each node streams batch frames to the dashboard port on its own
+# schedule, and can serve the LED/pump commands of the dashboard on its own
+# control port, acknowledged like node_control.CommandServer.
+#
+# Faults are injected per node: IR link losses (heartbeat flag off for a
+# while) and network faults (connection aborted, down for a while). Like
+# the real uplink, a node keeps the samples of a network fault and sends
+# them once reconnected.
+#
+# Usage: python simulator.py --nodes 500 --rate 1 --host 127.0.0.1 --duration 60
+
+
+# Value models, next(t) returns the 4 sensor values at time t (seconds)
+class UniformModel:
+    # Same values as the node scripts
+    def __init__(self, rng):
+        self.rng = rng
+
+    def next(self, t):
+        return tuple(self.rng.uniform(0, 100) for _ in protocol.SENSORS)
+
+
+class WalkModel:
+    # Bounded random walk, stable values with a slow drift
+    def __init__(self, rng, step=0.5):
+        self.rng = rng
+        self.step = step
+        self.values = [rng.uniform(20, 80) for _ in protocol.SENSORS]
+
+    def next(self, t):
+        for i, value in enumerate(self.values):
+            self.values[i] = min(100.0, max(0.0, value + self.rng.gauss(0, self.step)))
+        return tuple(self.values)
+
+
+class DailyModel:
+    # Daily cycle with noise, `day` seconds per simulated day
+    def __init__(self, rng, day=86400.0):
+        self.rng = rng
+        self.day = day
+        self.phases = [rng.uniform(0, 2 * math.pi) for _ in protocol.SENSORS]
+
+    def next(self, t):
+        angle = 2 * math.pi * t / self.day
+        return tuple(50 + 30 * math.sin(angle + phase) + self.rng.gauss(0, 1) for phase in self.phases)
+
+
+MODELS = {"uniform": UniformModel, "walk": WalkModel, "daily": DailyModel}
+
+
+class VirtualNode:
+    def __init__(self, field_id, host, port, rate=0.5, batch=1, model="walk", ir_loss=0.0, ir_outage=10.0,
+                 fault_rate=0.0, fault_downtime=2.0, command_port=None, deadband=None, seed=None):
+        self.field_id = field_id
+        self.host = host
+        self.port = port
+        self.rate = rate  # Samples per second
+        self.batch = batch  # Samples per frame
+        self.rng = random.Random(field_id if seed is None else seed)
+        self.model = MODELS[model](self.rng)
+        self.ir_loss = ir_loss  # Probability per sample that the IR link is lost
+        self.ir_outage = ir_outage  # Mean seconds of an IR link loss
+        self.fault_rate = fault_rate  # Probability per send that the connection is aborted
+        self.fault_downtime = fault_downtime  # Mean seconds before reconnecting after a fault
+        self.command_port = command_port  # None to run without command server
+        # Delta frames with this deadband, None for batch frames with every value
+        self.encoder = None if deadband is None else protocol.DeltaEncoder(deadband)
+        self.link_up_at = 0.0  # Monotonic time the IR link comes back
+        self.network_up_at = 0.0  # Monotonic time the network comes back after a fault
+        self.unsent = []  # (Reading, heartbeat) not sent yet
+        self.writer = None
+        self.led_until = 0.0
+        self.recent = OrderedDict()  # command id -> status
+        self.command_connections = {}  # handler task -> writer
+        # Counters
+        self.samples = 0
+        self.sent = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.faults = 0
+        self.commands = 0
+
+    async def connect(self, deadline):
+        backoff = 0.1
+        while time.monotonic() < deadline:
+            try:
+                _, self.writer = await asyncio.open_connection(self.host, self.port)
+                self.connections += 1
+                if self.encoder is not None:
+                    self.encoder.reset()
+                return True
+            except OSError:
+                await asyncio.sleep(backoff * self.rng.uniform(0.5, 1.0))
+                backoff = min(5.0, backoff * 2)
+        return False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.transport.abort()
+            self.writer = None
+
+    # Function to take one sample with the IR link state
+    def sample(self, now, started):
+        if now >= self.link_up_at and self.ir_loss and self.rng.random() < self.ir_loss:
+            self.link_up_at = now + self.rng.expovariate(1 / self.ir_outage)
+        reading = sampling.Reading(self.samples, time.time(), self.model.next(now - started), int(now - started))
+        self.unsent.append((reading, now >= self.link_up_at))
+        self.samples += 1
+
+    # Function to send the unsent samples, False when the connection was lost
+    async def flush(self):
+        sent = time.time()
+        encode = protocol.encode_batch if self.encoder is None else self.encoder.encode
+        data = b"".join(encode(self.field_id, readings, heartbeat, sent)
+                        for readings, heartbeat in uplink.split_batches(self.unsent))
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except OSError:
+            self.close()
+            return False
+        self.sent += len(self.unsent)
+        self.bytes_sent += len(data)
+        self.unsent = []
+        return True
+
+    async def run(self, duration):
+        server = None
+        if self.command_port is not None:
+            server = await asyncio.start_server(self.handle_commands, self.host, self.command_port)
+        started = time.monotonic()
+        end = started + duration
+        # Random phase so the nodes do not all send at the same time
+        deadline = started + self.rng.uniform(0, 1 / self.rate)
+        try:
+            while deadline < end:
+                await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+                deadline += 1 / self.rate
+                now = time.monotonic()
+                self.sample(now, started)
+                if len(self.unsent) < self.batch or now < self.network_up_at:
+                    continue
+                if self.fault_rate and self.rng.random() < self.fault_rate:
+                    # Network fault: connection aborted, samples kept until it comes back
+                    self.faults += 1
+                    self.close()
+                    self.network_up_at = now + self.rng.expovariate(1 / self.fault_downtime)
+                    continue
+                if self.writer is None and not await self.connect(end):
+                    break
+                await self.flush()
+            if self.unsent and self.writer is not None:
+                await self.flush()
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+            if server is not None:
+                server.close()
+                for writer in self.command_connections.values():
+                    writer.close()
+                await asyncio.gather(*self.command_connections, return_exceptions=True)
+
+    # Command server, same frames and acknowledgements as node_control.CommandServer
+    async def handle_commands(self, reader, writer):
+        decoder = protocol.FrameDecoder()
+        task = asyncio.current_task()
+        self.command_connections[task] = writer
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                for message in decoder.feed(data):
+                    if message.__class__ is protocol.Command:
+                        writer.write(protocol.encode_ack(message.command_id, self.execute(message)))
+        except (OSError, protocol.ProtocolError):
+            pass
+        finally:
+            del self.command_connections[task]
+            writer.close()
+
+    def execute(self, command):
+        status = self.recent.get(command.command_id)
+        if status is None:
+            self.commands += 1
+            if command.opcode == protocol.CMD_LED_ON and math.isfinite(command.argument) and command.argument > 0:
+                self.led_until = time.monotonic() + command.argument
+                status = protocol.ACK_OK
+            elif command.opcode == protocol.CMD_LED_ON:
+                status = protocol.ACK_ERROR
+            elif command.opcode == protocol.CMD_LED_OFF:
+                self.led_until = 0.0
+                status = protocol.ACK_OK
+            else:
+                status = protocol.ACK_UNKNOWN_COMMAND
+            self.recent[command.command_id] = status
+            if len(self.recent) > 256:
+                self.recent.popitem(last=False)
+        return status
+
+
+class Simulator:
+    def __init__(self, count, host="127.0.0.1", port=12345, first_field=1, command_port=None, **node_options):
+        # Node i serves its commands on command_port + i
+        self.nodes = [VirtualNode(first_field + i, host, port,
+                                  command_port=None if command_port is None else command_port + i, **node_options)
+                      for i in range(count)]
+
+    async def run(self, duration):
+        await asyncio.gather(*(node.run(duration) for node in self.nodes))
+
+    def stats(self):
+        return {
+            "nodes": len(self.nodes),
+            "samples": sum(node.samples for node in self.nodes),
+            "sent": sum(node.sent for node in self.nodes),
+            "bytes": sum(node.bytes_sent for node in self.nodes),
+            "connections": sum(node.connections for node in self.nodes),
+            "faults": sum(node.faults for node in self.nodes),
+            "commands": sum(node.commands for node in self.nodes),
+        }
+
+
+# Function to allow one socket per node (plus the command servers) in this process
+def raise_file_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and (hard == resource.RLIM_INFINITY or soft < hard):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate field nodes sending to the dashboard")
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--first-field", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=0.5, help="samples per second per node")
+    parser.add_argument("--batch", type=int, default=1, help="samples per frame")
+    parser.add_argument("--model", choices=sorted(MODELS), default="walk")
+    parser.add_argument("--ir-loss", type=float, default=0.0, help="probability per sample of an IR link loss")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="probability per send of a network fault")
+    parser.add_argument("--deadband", type=float, default=None, help="send delta frames with this deadband")
+    parser.add_argument("--command-port", type=int, default=None, help="first control port, one per node")
+    parser.add_argument("--duration", type=float, default=60)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    simulator = Simulator(args.nodes, args.host, args.port, args.first_field, args.command_port,
+                          rate=args.rate, batch=args.batch, model=args.model, ir_loss=args.ir_loss,
+                          fault_rate=args.fault_rate, deadband=args.deadband)
+    began = time.monotonic()
+    asyncio.run(simulator.run(args.duration))
+    stats = simulator.stats()
+    print(f"{stats['nodes']} nodes, {stats['samples']} samples taken, {stats['sent']} sent ({stats['bytes']} bytes) "
+          f"in {time.monotonic() - began:.1f}s, {stats['connections']} connections, {stats['faults']} faults, "
+          f"{stats['commands']} commands")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+
+import protocol
+
+# Local streaming endpoint of the dashboard: any number of programs (another
+# window, a logger, a script) subscribe to the decoded samples and the
+# alerts, over plain TCP with one JSON object per line.
+#
+# A subscriber sends a line with its filter, every key optional (all
+# fields, all sensors, samples and alerts by default), and may send a new
+# one at any time:
+#
+#   {"fields": [1, 2], "sensors": [0, 2], "samples": true, "alerts": true}
+#
+# and receives lines of the types "subscribed", "sample", "alert", "error",
+# and "dropped" (count of the messages it lost). Each subscriber has a
+# bounded queue: when it reads too slowly the oldest messages are dropped,
+# so publishing never waits on a client. publish_sample() and
+# publish_alerts() may be called from any thread (the queues are filled
+# under one lock of the server); a sample is encoded once per sensor
+# filter, and the writers of the subscribers are woken once per pass of the
+# event loop, not once per message.
+
+STREAM_PORT = 12348
+STREAM_QUEUE = 1000  # Messages waiting per subscriber, the oldest are dropped
+WRITE_CHUNK = 256  # Messages per write to a subscriber
+ALL_SENSORS = (1 << len(protocol.SENSORS)) - 1
+
+logger = logging.getLogger(__name__)
+
+
+# Function to encode a message as a JSON line
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+def sample_message(sample, sensors=ALL_SENSORS):
+    return {
+        "type": "sample",
+        "field": sample.field_id,
+        "seq": sample.seq,
+        "timestamp": sample.timestamp,
+        "uptime": sample.uptime,
+        "heartbeat": sample.heartbeat,
+        "values": {str(sensor): value for sensor, value in enumerate(sample.values) if sensors & 1 << sensor},
+    }
+
+
+# Function to read a subscription line: (field ids or None, sensor mask, samples, alerts)
+def parse_subscription(line):
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("a subscription is a JSON object")
+    fields = request.get("fields")
+    if fields is not None:
+        fields = frozenset(int(field_id) for field_id in fields)
+    sensors = request.get("sensors")
+    mask = ALL_SENSORS
+    if sensors is not None:
+        mask = 0
+        for sensor in sensors:
+            if not 0 <= int(sensor) < len(protocol.SENSORS):
+                raise ValueError(f"unknown sensor {sensor!r}, expected 0 to {len(protocol.SENSORS) - 1}")
+            mask |= 1 << int(sensor)
+    return fields, mask, bool(request.get("samples", True)), bool(request.get("alerts", True))
+
+
+class Subscriber:
+    def __init__(self, writer, address, queue_size=STREAM_QUEUE):
+        self.writer = writer
+        self.address = address
+        self.fields = None  # Field ids, None for every field
+        self.sensors = ALL_SENSORS  # Mask of the sensors
+        self.samples = True
+        self.alerts = True
+        self.queue = deque(maxlen=queue_size)  # Encoded lines
+        self.ready = asyncio.Event()  # Set when the queue has lines to write
+        self.dropped = 0  # Written under the lock of the server, by push only
+        self.reported = 0  # Drops already reported to the client, written by its writer only
+        self.sent = 0
+
+    # Function to queue a line, under the lock of the server: the publishing threads and
+    # the event loop push to the same queues
+    def push(self, line):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(line)
+
+
+class StreamServer:
+    def __init__(self, host="127.0.0.1", port=STREAM_PORT, queue_size=STREAM_QUEUE):
+        self.host = host  # Local only by default
+        self.port = port
+        self.queue_size = queue_size
+        self.server = None
+        self.loop = None
+        self.handlers = set()
+        # Replaced, never changed in place: the publishing threads read them without lock
+        self.subscribers = ()
+        self.by_field = {}  # field id -> subscribers of its samples
+        self.every_field = ()  # Subscribers of the samples of every field
+        self.wake_pending = False
+        self.lock = threading.Lock()  # Taken by every push and the publish counters
+        # Counters
+        self.published = 0  # Samples published
+        self.alerts_published = 0
+        self.dropped_gone = 0  # Drops of the subscribers gone
+
+    @property
+    def dropped(self):
+        return self.dropped_gone + sum(subscriber.dropped for subscriber in self.subscribers)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # Real port when started on port 0
+        logger.info("Streaming samples and alerts on port %s", self.port)
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            for subscriber in self.subscribers:
+                subscriber.writer.close()
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+            await self.server.wait_closed()
+
+    # Function to rebuild the indexes of the subscribers, on the event loop thread
+    def reindex(self):
+        by_field = {}
+        every_field = []
+        for subscriber in self.subscribers:
+            if not subscriber.samples:
+                continue
+            if subscriber.fields is None:
+                every_field.append(subscriber)
+            else:
+                for field_id in subscriber.fields:
+                    by_field.setdefault(field_id, []).append(subscriber)
+        self.by_field = {field_id: tuple(subscribers) for field_id, subscribers in by_field.items()}
+        self.every_field = tuple(every_field)
+
+    async def handle(self, reader, writer):
+        subscriber = Subscriber(writer, writer.get_extra_info("peername"), self.queue_size)
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        self.subscribers += (subscriber,)
+        self.reindex()
+        logger.info("Stream subscriber %s connected, %d subscribers", subscriber.address, len(self.subscribers))
+        sender = asyncio.create_task(self.write_loop(subscriber))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.subscribe(subscriber, line)
+        except ConnectionError:
+            pass  # Gone without closing, the writer may have found it first
+        except ValueError as e:  # Line longer than the stream limit
+            logger.warning("Error on stream subscriber %s: %s", subscriber.address, e)
+        finally:
+            sender.cancel()
+            self.subscribers = tuple(other for other in self.subscribers if other is not subscriber)
+            self.reindex()
+            with self.lock:  # A publishing thread may still push to it
+                self.dropped_gone += subscriber.dropped
+            writer.close()
+            self.handlers.discard(task)
+            logger.info("Stream subscriber %s gone, %d subscribers", subscriber.address, len(self.subscribers))
+
+    def subscribe(self, subscriber, line):
+        try:
+            fields, sensors, samples, alerts = parse_subscription(line)
+        except (ValueError, TypeError) as e:
+            reply = {"type": "error", "message": f"Invalid subscription: {e}"}
+        else:
+            subscriber.fields, subscriber.sensors = fields, sensors
+            subscriber.samples, subscriber.alerts = samples, alerts
+            self.reindex()
+            reply = {
+                "type": "subscribed",
+                "fields": None if fields is None else sorted(fields),
+                "sensors": [sensor for sensor in range(len(protocol.SENSORS)) if sensors & 1 << sensor],
+                "samples": samples,
+                "alerts": alerts,
+            }
+        with self.lock:
+            subscriber.push(encode(reply))
+        subscriber.ready.set()
+
+    # Writer of a subscriber: the queued lines in chunks, as fast as the client reads them
+    async def write_loop(self, subscriber):
+        try:
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                while subscriber.queue:
+                    lines = []
+                    dropped = subscriber.dropped
+                    if dropped != subscriber.reported:
+                        lines.append(encode({"type": "dropped", "count": dropped - subscriber.reported}))
+                        subscriber.reported = dropped
+                    while subscriber.queue and len(lines) < WRITE_CHUNK:
+                        lines.append(subscriber.queue.popleft())
+                    subscriber.writer.write(b"".join(lines))
+                    subscriber.sent += len(lines)
+                    await subscriber.writer.drain()
+        except ConnectionError:
+            subscriber.writer.close()
+
+    # Function to wake the writers of the subscribers with queued lines, on the event loop thread
+    def wake(self):
+        self.wake_pending = False
+        for subscriber in self.subscribers:
+            if subscriber.queue:
+                subscriber.ready.set()
+
+    def schedule_wake(self):
+        if not self.wake_pending and self.loop is not None:
+            self.wake_pending = True
+            self.loop.call_soon_threadsafe(self.wake)
+
+    # Function to publish a protocol.Sample to its subscribers, from any thread
+    def publish_sample(self, sample):
+        targets = self.by_field.get(sample.field_id, ()) + self.every_field
+        if not targets:
+            return
+        lines = {}  # Sensor mask -> encoded line
+        for subscriber in targets:
+            if subscriber.sensors not in lines:
+                lines[subscriber.sensors] = encode(sample_message(sample, subscriber.sensors))
+        with self.lock:
+            for subscriber in targets:
+                subscriber.push(lines[subscriber.sensors])
+            self.published += 1
+        self.schedule_wake()
+
+    # Function to publish alerts, (field id, sensor, "raised" or "cleared", value, message) tuples
+    def publish_alerts(self, alerts):
+        subscribers = [subscriber for subscriber in self.subscribers if subscriber.alerts]
+        if not subscribers or not alerts:
+            return
+        lines = [(field_id, sensor, encode({"type": "alert", "field": field_id, "sensor": sensor, "state": state,
+                                            "value": value, "message": message}))
+                 for field_id, sensor, state, value, message in alerts]
+        with self.lock:
+            for field_id, sensor, line in lines:
+                for subscriber in subscribers:
+                    if (subscriber.fields is None or field_id in subscriber.fields) and subscriber.sensors & 1 << sensor:
+                        subscriber.push(line)
+            self.alerts_published += len(alerts)
+        self.schedule_wake()
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "alerts": self.alerts_published,
+            "dropped": self.dropped,
+        }
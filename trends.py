@@ -0,0 +1,104 @@
+import numpy as np
+
+import protocol
+
+# Recent trend of every sensor of every field, for the strips drawn under
+# the gauges. Each field keeps a ring of `width` points, one per pixel of
+# the strip, and a point is the mean of the values shown during `period`
+# seconds: the values are decimated as they arrive, never stored one by
+# one. The points of every field are on the same time grid, so they are
+# closed for all fields at once by one pass of NumPy operations, and the
+# strips only have to append the new point. The nodes sample every 2
+# seconds, slower than the points: a period without any value repeats the
+# last point of its field, and only after TREND_HOLD empty periods in a row
+# is it a NaN point, drawn as a gap. Headless, like
+# alerting.ThresholdEngine.
+
+TREND_WIDTH = 120  # Points of a strip, one per pixel
+TREND_PERIOD = 1.0  # Seconds per point, 2 minutes per strip
+TREND_HOLD = 5  # Empty periods that repeat the last point of a field before a gap
+
+
+class TrendBuffer:
+    def __init__(self, capacity=16, width=TREND_WIDTH, period=TREND_PERIOD, sensors=len(protocol.SENSORS),
+                 hold=TREND_HOLD):
+        self.width = width
+        self.period = period
+        self.hold = hold
+        self.sensors = sensors
+        self.rows = {}  # field id -> row of the arrays
+        self.field_ids = []  # row -> field id
+        self.slot = None  # Number of the period being accumulated (time // period)
+        self.closed = 0  # Points closed so far, the newest one is at (closed - 1) % width
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        self.points = np.full((capacity, self.width, self.sensors), np.nan, dtype=np.float32)  # Ring of each field
+        self.sums = np.zeros((capacity, self.sensors), dtype=np.float64)  # Values of the current period
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.last = np.full((capacity, self.sensors), np.nan, dtype=np.float32)  # Last point with values
+        self.empty = np.zeros(capacity, dtype=np.int64)  # Empty periods in a row since then
+
+    # Function to double the capacity, keeping the points of the existing rows
+    def grow(self):
+        old = (self.points, self.sums, self.counts, self.last, self.empty)
+        self.allocate(max(1, 2 * len(self.counts)))
+        for new, previous in zip((self.points, self.sums, self.counts, self.last, self.empty), old):
+            new[:len(previous)] = previous
+
+    def row_for(self, field_id):
+        row = self.rows.get(field_id)
+        if row is None:
+            row = len(self.field_ids)
+            if row == len(self.counts):
+                self.grow()
+            self.rows[field_id] = row
+            self.field_ids.append(field_id)
+        return row
+
+    # Function to add the values of a field to the point of the current period
+    def add(self, field_id, values):
+        row = self.row_for(field_id)  # May grow the arrays
+        self.sums[row] += values
+        self.counts[row] += 1
+
+    # Function to close the points of the periods ended before `now`, returns how many
+    # points were added to every ring (0 most ticks)
+    def advance(self, now):
+        slot = int(now // self.period)
+        if self.slot is None:
+            self.slot = slot
+        added = min(slot - self.slot, self.width)
+        if added <= 0:
+            return 0
+        count = len(self.field_ids)
+        counts = self.counts[:count]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = self.sums[:count] / counts[:, None]  # NaN without values
+        # A field without values in the period repeats its last point, up to `hold` periods
+        filled = counts > 0
+        empty = self.empty[:count]
+        empty[filled] = 0
+        empty[~filled] += added
+        held = ~filled & (empty <= self.hold)
+        means[held] = self.last[:count][held]
+        self.last[:count][filled] = means[filled]
+        # Periods that ended without the dashboard ticking are gaps, the values added
+        # since the last tick go to the newest point
+        for index in range(added - 1):
+            self.points[:count, (self.closed + index) % self.width] = np.nan
+        self.closed += added
+        self.points[:count, (self.closed - 1) % self.width] = means
+        self.slot = slot
+        self.sums[:count] = 0.0
+        counts[:] = 0
+        return added
+
+    # Function to get the last `count` points of a sensor of a field, oldest first
+    def series(self, field_id, sensor, count=None):
+        count = min(self.width, self.closed) if count is None else min(count, self.closed, self.width)
+        row = self.rows.get(field_id)
+        if row is None:
+            return np.full(count, np.nan, dtype=np.float32)
+        indexes = np.arange(self.closed - count, self.closed) % self.width
+        return self.points[row, indexes, sensor]
@@ -0,0 +1,350 @@
+import bisect
+import heapq
+import mmap
+import os
+import queue
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+import protocol
+
+# Embedded time-series store for the sensor history.
+#
+# Every (field, sensor) series lives in its own directory as append-only
+# column files: raw timestamps and values, plus 1-minute and 1-hour rollups
+# (bucket start, min, max, mean, count). New points are kept in array chunks
+# and appended to the files on every flush; flushed data is read back
+# through mmap, so a range query is a binary search on the time column and
+# a slice of the other columns. Columns use the native byte order, the
+# files are meant to be read on the machine that wrote them.
+#
+# Points older than the last one (the spooled backlog of a node, replayed
+# after newer samples came through the other node or the IR link) are kept
+# aside and merged in order on the next flush or query: the end of the
+# columns is rewritten from the first late point, and the rollup buckets
+# from its bucket on are rebuilt from the raw points.
+#
+# The ingestion path only puts samples on a queue; a writer thread appends
+# them and flushes periodically, so it never blocks the receive loop.
+
+DEFAULT_DIRECTORY = "history"
+FLUSH_INTERVAL = 5.0  # Seconds between two flushes to disk
+RESOLUTIONS = (60, 3600)  # Rollup bucket sizes in seconds
+LATE_WINDOW = 86400.0  # Seconds a late point may be older than the last one, older ones are dropped
+
+RollupRows = namedtuple("RollupRows", ["start", "min", "max", "mean", "count"])
+
+
+# Append-only column of one type: pending values in an array, flushed values in a file
+class Column:
+    def __init__(self, path, typecode):
+        self.path = path
+        self.typecode = typecode
+        self.pending = array(typecode)
+        self.itemsize = self.pending.itemsize
+        self.stored = os.path.getsize(path) // self.itemsize if os.path.exists(path) else 0
+        self.map = None
+        self.view = None
+        self.mapped = 0
+
+    def __len__(self):
+        return self.stored + len(self.pending)
+
+    def append(self, value):
+        self.pending.append(value)
+
+    def flush(self):
+        if self.pending:
+            with open(self.path, "ab") as f:
+                self.pending.tofile(f)
+            self.stored += len(self.pending)
+            del self.pending[:]
+
+    # Function to drop the values from `index` on, flushed ones included
+    def truncate(self, index):
+        if index < self.stored:
+            self.unmap()  # A mapping past the end of the file must not be read
+            with open(self.path, "r+b") as f:
+                f.truncate(index * self.itemsize)
+            self.stored = index
+            del self.pending[:]
+        else:
+            del self.pending[index - self.stored:]
+
+    def unmap(self):
+        if self.map is not None:
+            self.view.release()
+            self.map.close()
+            self.map = self.view = None
+            self.mapped = 0
+
+    # Function to map the flushed values, remapped only when the file grew
+    def remap(self):
+        if self.mapped != self.stored:
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), self.stored * self.itemsize, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map).cast(self.typecode)
+            self.mapped = self.stored
+
+    def last(self):
+        if self.pending:
+            return self.pending[-1]
+        if self.stored:
+            self.remap()
+            return self.view[self.stored - 1]
+        return None
+
+    # Function to find the first index whose value is >= value (sorted columns only)
+    def bisect(self, value):
+        if self.pending and self.pending[0] < value:
+            return self.stored + bisect.bisect_left(self.pending, value)
+        if self.stored:
+            self.remap()
+            return bisect.bisect_left(self.view, value)
+        return 0
+
+    # Function to copy the values [start, end) into an array
+    def slice(self, start, end):
+        result = array(self.typecode)
+        if start < self.stored:
+            self.remap()
+            result.frombytes(self.map[start * self.itemsize:min(end, self.stored) * self.itemsize])
+        if end > self.stored:
+            result.extend(self.pending[max(0, start - self.stored):end - self.stored])
+        return result
+
+
+# min/max/mean rollup of a series for one bucket size
+class Rollup:
+    def __init__(self, directory, resolution):
+        prefix = os.path.join(directory, f"{resolution}s")
+        self.resolution = resolution
+        self.start = Column(prefix + ".start", "d")
+        self.min = Column(prefix + ".min", "f")
+        self.max = Column(prefix + ".max", "f")
+        self.mean = Column(prefix + ".mean", "f")
+        self.count = Column(prefix + ".count", "I")
+        self.columns = (self.start, self.min, self.max, self.mean, self.count)
+        # Bucket still receiving points, written once the next bucket starts
+        self.bucket = None
+        self.low = self.high = self.total = 0.0
+        self.points = 0
+
+    # Function to get the end of the last written bucket
+    def closed_until(self):
+        last = self.start.last()
+        return None if last is None else last + self.resolution
+
+    def add(self, timestamp, value):
+        bucket = timestamp - timestamp % self.resolution
+        if bucket != self.bucket:
+            self.close_bucket()
+            self.bucket = bucket
+            self.low = self.high = self.total = value
+            self.points = 1
+        else:
+            if value < self.low:
+                self.low = value
+            elif value > self.high:
+                self.high = value
+            self.total += value
+            self.points += 1
+
+    # Function to drop the buckets from the one of `timestamp` on, open bucket included
+    def truncate(self, timestamp):
+        index = self.start.bisect(timestamp - timestamp % self.resolution)
+        for column in self.columns:
+            column.truncate(index)
+        self.bucket = None
+
+    def close_bucket(self):
+        if self.bucket is not None:
+            self.start.append(self.bucket)
+            self.min.append(self.low)
+            self.max.append(self.high)
+            self.mean.append(self.total / self.points)
+            self.count.append(self.points)
+            self.bucket = None
+
+    def flush(self):
+        for column in self.columns:
+            column.flush()
+
+    # Function to get the buckets overlapping [start, end), open bucket included
+    def query(self, start, end):
+        i = self.start.bisect(start - start % self.resolution)
+        j = self.start.bisect(end)
+        rows = RollupRows(*(column.slice(i, j) for column in self.columns))
+        if self.bucket is not None and start - self.resolution < self.bucket < end:
+            rows.start.append(self.bucket)
+            rows.min.append(self.low)
+            rows.max.append(self.high)
+            rows.mean.append(self.total / self.points)
+            rows.count.append(self.points)
+        return rows
+
+
+# History of one sensor of one field
+class Series:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.time = Column(os.path.join(directory, "raw.time"), "d")
+        self.value = Column(os.path.join(directory, "raw.value"), "f")
+        self.rollups = {resolution: Rollup(directory, resolution) for resolution in RESOLUTIONS}
+        self.last_time = self.time.last()
+        self.late = []  # (timestamp, value) older than last_time, not merged yet
+        self.out_of_order = 0  # Points dropped, older than LATE_WINDOW
+        self.rebuild_rollups()
+
+    # Function to rebuild the open bucket of each rollup from the raw points after its
+    # last closed bucket, after dropping the buckets from `since` on
+    def rebuild_rollups(self, since=None):
+        for rollup in self.rollups.values():
+            if since is not None:
+                rollup.truncate(since)
+            closed = rollup.closed_until()
+            i = 0 if closed is None else self.time.bisect(closed)
+            end = len(self.time)
+            for timestamp, value in zip(self.time.slice(i, end), self.value.slice(i, end)):
+                rollup.add(timestamp, value)
+
+    def append(self, timestamp, value):
+        if self.last_time is not None and timestamp < self.last_time:
+            if timestamp < self.last_time - LATE_WINDOW:
+                self.out_of_order += 1
+                return
+            self.late.append((timestamp, value))
+            return
+        self.last_time = timestamp
+        self.time.append(timestamp)
+        self.value.append(value)
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, value)
+
+    # Function to insert the late points in order and rebuild the rollup buckets they touch
+    def merge_late(self):
+        if not self.late:
+            return
+        self.late.sort()
+        first = self.late[0][0]
+        i = self.time.bisect(first)
+        end = len(self.time)
+        tail = zip(self.time.slice(i, end), self.value.slice(i, end))
+        merged = list(heapq.merge(tail, self.late, key=lambda point: point[0]))
+        self.late = []
+        self.time.truncate(i)
+        self.value.truncate(i)
+        for timestamp, value in merged:
+            self.time.append(timestamp)
+            self.value.append(value)
+        self.rebuild_rollups(first)
+
+    def flush(self):
+        self.merge_late()
+        self.time.flush()
+        self.value.flush()
+        for rollup in self.rollups.values():
+            rollup.flush()
+
+    def query_raw(self, start, end):
+        self.merge_late()
+        i = self.time.bisect(start)
+        j = self.time.bisect(end)
+        return self.time.slice(i, j), self.value.slice(i, j)
+
+
+# Function to pick the coarsest useful resolution for a time range (0 = raw points)
+def pick_resolution(start, end):
+    span = end - start
+    if span <= 6 * 3600:
+        return 0
+    if span <= 7 * 86400:
+        return 60
+    return 3600
+
+
+class TimeSeriesStore:
+    def __init__(self, directory=DEFAULT_DIRECTORY, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.series = {}  # (field id, sensor index) -> Series
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def series_path(self, field_id, sensor):
+        return os.path.join(self.directory, f"field_{field_id}", protocol.SENSORS[sensor].lower().replace(" ", "_"))
+
+    def series_for(self, field_id, sensor, create=True):
+        key = (field_id, sensor)
+        series = self.series.get(key)
+        if series is None:
+            path = self.series_path(field_id, sensor)
+            if not create and not os.path.isdir(path):
+                return None
+            series = self.series[key] = Series(path)
+        return series
+
+    # Called from the ingestion thread: only queues the sample, never blocks
+    def append_sample(self, sample, timestamp):
+        self.queue.put((timestamp, sample.field_id, sample.values))
+
+    # Function to queue the values of a field at `timestamp`, like append_sample
+    def append(self, timestamp, field_id, values):
+        self.queue.put((timestamp, field_id, values))
+
+    # Function to write the values of one sample (writer thread)
+    def write(self, timestamp, field_id, values):
+        with self.lock:
+            for sensor, value in enumerate(values):
+                self.series_for(field_id, sensor).append(timestamp, value)
+
+    def flush(self):
+        with self.lock:
+            for series in self.series.values():
+                series.flush()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, next_flush - time.monotonic()))
+                if item is None:
+                    break
+                self.write(*item)
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_interval
+        self.flush()
+
+    # Function to stop the writer thread once the queued samples are written
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    # Function to read the history of a sensor: (times, values) for raw points,
+    # RollupRows for a rollup resolution, picked from the range when None
+    def query(self, field_id, sensor, start, end, resolution=None):
+        if resolution is None:
+            resolution = pick_resolution(start, end)
+        with self.lock:
+            series = self.series_for(field_id, sensor, create=False)
+            if resolution == 0:
+                if series is None:
+                    return array("d"), array("f")
+                return series.query_raw(start, end)
+            if series is None:
+                return RollupRows(array("d"), array("f"), array("f"), array("f"), array("I"))
+            series.merge_late()
+            return series.rollups[resolution].query(start, end)
@@ -0,0 +1,273 @@
+import logging
+import mmap
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+import protocol
+import sampling
+
+# Store-and-forward uplink of the field nodes. Every sample goes first to
+# a bounded spool file, then a sender thread forwards the spool to the
+# dashboard in the order the samples were taken. When the dashboard is
+# unreachable the samples stay in the spool, the thread reconnects with
+# exponential backoff and, once connected, replays the backlog in large
+# batch frames. The batches carry the node timestamps, so the dashboard
+# files the replayed samples at the time they were taken.
+#
+# The spool is a ring of fixed-size records in a memory-mapped file, so
+# the backlog survives a restart of the node script. When it is full the
+# oldest samples are dropped.
+#
+# With the "delta" wire format, the deadband is applied when the spool is
+# sent: the spool keeps every sample, and each new connection starts with
+# a keyframe, so the dashboard can always rebuild the values.
+#
+# A relayed uplink sends the samples of another node (peer_link.Relay) in
+# frames flagged as relayed (not possible with the "csv" wire format).
+
+DEFAULT_SPOOL = "uplink.spool"
+DEFAULT_CAPACITY = 200000  # Records, about 6.6 MB and more than a day at one sample every 2 seconds
+SYNC_INTERVAL = 5.0  # Seconds between two syncs of the spool file to disk
+REPLAY_RECORDS = 4096  # Records sent per write while replaying the backlog
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+CONNECT_TIMEOUT = 5.0
+KEYFRAME_INTERVAL = 60.0  # Seconds between two keyframes of the delta wire format
+
+# Spool header: magic, capacity, head and tail (records ever taken and ever stored)
+SPOOL_HEADER = struct.Struct("<4sQQQ")
+SPOOL_MAGIC = b"SPL1"
+# Spool record: seq, node timestamp, 4 sensors, uptime, heartbeat (-1 when unknown)
+RECORD = struct.Struct("<Id4fIb")
+
+logger = logging.getLogger(__name__)
+
+
+# Bounded FIFO of readings in a memory-mapped file, not thread-safe
+class Spool:
+    def __init__(self, path=DEFAULT_SPOOL, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.dropped = 0  # Records overwritten because the spool was full
+        size = SPOOL_HEADER.size + capacity * RECORD.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, stored_capacity, self.head, self.tail = SPOOL_HEADER.unpack_from(self.map)
+        if existing != size or magic != SPOOL_MAGIC or stored_capacity != capacity or not 0 <= self.tail - self.head <= capacity:
+            # New file, other capacity or damaged header: start empty
+            self.head = self.tail = 0
+            self.write_header()
+        self.last_sync = time.monotonic()
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def write_header(self):
+        SPOOL_HEADER.pack_into(self.map, 0, SPOOL_MAGIC, self.capacity, self.head, self.tail)
+
+    def offset(self, index):
+        return SPOOL_HEADER.size + (index % self.capacity) * RECORD.size
+
+    # Function to add readings at the tail, dropping the oldest ones when full
+    def append(self, readings, heartbeat=None):
+        flag = -1 if heartbeat is None else int(bool(heartbeat))
+        for seq, timestamp, values, uptime in readings:
+            if self.tail - self.head == self.capacity:
+                self.head += 1
+                self.dropped += 1
+            RECORD.pack_into(self.map, self.offset(self.tail), seq, timestamp, *values, int(uptime), flag)
+            self.tail += 1
+        self.write_header()
+        self.sync()
+
+    # Function to read up to `count` records from the head as (Reading, heartbeat)
+    def peek(self, count):
+        records = []
+        for index in range(self.head, min(self.tail, self.head + count)):
+            seq, timestamp, s0, s1, s2, s3, uptime, flag = RECORD.unpack_from(self.map, self.offset(index))
+            records.append((sampling.Reading(seq, timestamp, (s0, s1, s2, s3), uptime), None if flag < 0 else bool(flag)))
+        return records
+
+    # Function to remove `count` records from the head once they were sent
+    def pop(self, count):
+        self.head = min(self.tail, self.head + count)
+        self.write_header()
+        self.sync()
+
+    # Function to write the changes to disk, at most every SYNC_INTERVAL unless forced
+    def sync(self, force=False):
+        now = time.monotonic()
+        if force or now - self.last_sync >= SYNC_INTERVAL:
+            self.map.flush()
+            self.last_sync = now
+
+    def close(self):
+        self.sync(force=True)
+        self.map.close()
+
+
+# Function to cut spool records into runs that fit in one batch frame:
+# consecutive sequence numbers, same heartbeat, limited count and time span
+def split_batches(records):
+    batches = []
+    run = []
+    run_heartbeat = None
+    for reading, heartbeat in records:
+        if run and (heartbeat != run_heartbeat or reading.seq != (run[-1].seq + 1) & 0xFFFFFFFF
+                    or len(run) == protocol.MAX_BATCH or reading.timestamp < run[-1].timestamp
+                    or reading.timestamp - run[0].timestamp > protocol.MAX_BATCH_SPAN):
+            batches.append((run, run_heartbeat))
+            run = []
+        run.append(reading)
+        run_heartbeat = heartbeat
+    if run:
+        batches.append((run, run_heartbeat))
+    return batches
+
+
+class Uplink:
+    def __init__(self, node_name, host, port=12345, spool=None, wire_format="binary", deadband=0.0,
+                 keyframe_interval=KEYFRAME_INTERVAL, min_backoff=MIN_BACKOFF, max_backoff=MAX_BACKOFF, log=logger.info,
+                 relayed=False):
+        self.node_name = node_name
+        self.field_id = protocol.field_id_from_name(node_name)
+        self.host = host
+        self.port = port
+        self.spool = spool if spool is not None else Spool()
+        self.wire_format = wire_format  # "binary", "delta", or "csv" for old dashboards (no node timestamps)
+        self.encoder = protocol.DeltaEncoder(deadband, keyframe_interval) if wire_format == "delta" else None
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.log = log
+        self.relayed = relayed  # Samples of another node, forwarded by this one
+        self.condition = threading.Condition()
+        self.socket = None
+        self.running = False
+        self.thread = None
+        self.backlog = 0  # Records of the current backlog not replayed yet
+        # Counters
+        self.connections = 0
+        self.failed_connects = 0
+        self.sent_records = 0
+        self.replayed_records = 0  # Records sent while catching up a backlog
+        self.sent_bytes = 0
+
+    @property
+    def connected(self):
+        return self.socket is not None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.disconnect()
+        self.spool.close()
+
+    # Function to queue readings for the dashboard, never blocks on the network
+    def send(self, readings, heartbeat=None):
+        with self.condition:
+            self.spool.append(readings, heartbeat)
+            self.condition.notify()
+
+    # Function to build the frames of a list of spool records, stamped with the send time
+    def encode(self, records):
+        if self.wire_format == "csv":
+            return b"".join(protocol.encode_csv_sample(self.node_name, reading.values, reading.uptime, heartbeat)
+                            for reading, heartbeat in records)
+        sent = time.time()
+        if self.encoder is not None:
+            return b"".join(self.encoder.encode(self.field_id, readings, heartbeat, sent, self.relayed)
+                            for readings, heartbeat in split_batches(records))
+        return b"".join(protocol.encode_batch(self.field_id, readings, heartbeat, sent, self.relayed)
+                        for readings, heartbeat in split_batches(records))
+
+    def connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        except OSError as e:
+            self.failed_connects += 1
+            self.log(f"Error establishing connection to computer: {e}")
+            return False
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket = sock
+        self.connections += 1
+        if self.encoder is not None:
+            self.encoder.reset()  # The dashboard starts from a keyframe on every connection
+        self.backlog = len(self.spool)
+        self.log(f"Connected to {self.host}:{self.port}, {len(self.spool)} samples waiting")
+        return True
+
+    def disconnect(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    # Function to tell if the dashboard closed the connection (it never sends on it)
+    def peer_closed(self):
+        try:
+            return self.socket.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    # Sender thread: connect, then forward the spool as it fills
+    def run(self):
+        backoff = self.min_backoff
+        while True:
+            with self.condition:
+                while self.running and self.socket is not None and not len(self.spool):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                records = self.spool.peek(REPLAY_RECORDS) if self.socket is not None else None
+
+            if self.socket is None:
+                if self.connect():
+                    backoff = self.min_backoff
+                    continue
+                # Exponential backoff with jitter, so nodes do not reconnect all at once;
+                # new samples wake the condition, the deadline keeps the wait
+                retry_at = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+                with self.condition:
+                    while self.running and time.monotonic() < retry_at:
+                        self.condition.wait(retry_at - time.monotonic())
+                backoff = min(self.max_backoff, backoff * 2)
+                continue
+
+            data = self.encode(records)
+            try:
+                if self.peer_closed():
+                    raise ConnectionResetError("connection closed by the computer")
+                self.socket.sendall(data)
+            except OSError as e:
+                self.log(f"Connection to computer lost: {e}")
+                self.disconnect()
+                continue
+            with self.condition:
+                self.spool.pop(len(records))
+            self.sent_records += len(records)
+            self.sent_bytes += len(data)
+            replayed = min(self.backlog, len(records))
+            self.replayed_records += replayed
+            self.backlog -= replayed